@@ -19,7 +19,29 @@ from typing import Any
 from sphinx.application import Sphinx
 
 from pathlib import Path
-import shutil
+
+from canonical_sphinx.assets import sync_directory
+from canonical_sphinx.compress import precompress_output
+from canonical_sphinx.doctreecache import setup_doctree_cache
+from canonical_sphinx.fonts import (
+    FONT_FILES,
+    subset_pdf_fonts,
+    subsetting_enabled,
+    write_web_fonts,
+)
+from canonical_sphinx.fragments import setup_fragment_cache
+from canonical_sphinx.githistory import setup_git_history
+from canonical_sphinx.images import PDF_LOGO, optimize_html_images, place_pdf_logo
+from canonical_sphinx.latexformat import precompile_latex_preambles
+from canonical_sphinx.linkcheck import CachedLinkcheckBuilder
+from canonical_sphinx.navigation import setup_navigation
+from canonical_sphinx.parallel import setup_parallel_jobs
+from canonical_sphinx.memory import setup_memory_profile
+from canonical_sphinx.profiling import setup_profiling
+from canonical_sphinx.search import write_search_shards
+from canonical_sphinx.sharedstatic import setup_shared_static
+from canonical_sphinx.siteconfig import write_site_config
+from canonical_sphinx.spelling import SpellingBuilder
 
 
 theme_dir = Path(__file__).parent / "theme"
@@ -45,16 +67,95 @@ def hello(people: list[Any] | None = None) -> None:
 
 def copy_custom_files(app: Sphinx) -> None:
     if app.builder.format == "latex":
-        shutil.copytree(str(theme_dir / "PDF"), app.outdir, dirs_exist_ok=True)
+        # Subset fonts are put in place once the LaTeX sources are written.
+        exclude = FONT_FILES if subsetting_enabled(app) else []
+        if app.config.optimize_images:
+            exclude = [*exclude, PDF_LOGO]
+        sync_directory(
+            theme_dir / "PDF",
+            Path(app.outdir),
+            hardlink=app.config.hardlink_pdf_assets,
+            exclude=exclude,
+        )
+        if app.config.optimize_images:
+            place_pdf_logo(app)
 
 
 def setup(app: Sphinx) -> dict[str, Any]:
     """Configure the main extension and theme."""
     app.setup_extension("canonical_sphinx.config")
+    app.add_builder(CachedLinkcheckBuilder, override=True)
+    app.add_builder(SpellingBuilder)
+    # Before the extensions that are set up when the configuration is read.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "config-inited",
+        setup_memory_profile,
+        priority=100,
+    )
+    # Once all the extensions have connected their handlers.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "config-inited",
+        setup_profiling,
+        priority=900,
+    )
     app.connect(  # pyright: ignore [reportUnknownMemberType]
         "builder-inited",
         copy_custom_files,
     )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        setup_fragment_cache,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        setup_git_history,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        setup_navigation,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        setup_parallel_jobs,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        setup_doctree_cache,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        setup_shared_static,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        subset_pdf_fonts,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        precompile_latex_preambles,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        write_web_fonts,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        optimize_html_images,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        write_search_shards,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        write_site_config,
+    )
+    # After the other handlers, which may still write files.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        precompress_output,
+        priority=900,
+    )
     return {
         "parallel_read_safe": True,
         "parallel_write_safe": True,
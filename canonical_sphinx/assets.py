@@ -0,0 +1,133 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Copying of the theme's asset files into build output directories."""
+import contextlib
+import os
+import shutil
+import sys
+from collections.abc import Collection
+from pathlib import Path
+
+from sphinx.util import logging
+
+from canonical_sphinx.cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# The FICLONE ioctl request from <linux/fs.h>, which makes a copy-on-write
+# clone of a file on filesystems such as Btrfs and XFS.
+FICLONE = 0x40049409
+
+
+def is_up_to_date(src: Path, dst: Path) -> bool:
+    """Check whether ``dst`` already has the same contents as ``src``.
+
+    Files with the same size and modification time are assumed to be equal;
+    otherwise files of the same size are compared by content hash.
+    """
+    try:
+        dst_stat = dst.stat()
+    except OSError:
+        return False
+    src_stat = src.stat()
+
+    if os.path.samestat(src_stat, dst_stat):
+        return True
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    if file_digest(src) != file_digest(dst):
+        return False
+
+    # Same contents: align the mtimes so that the next check is cheap.
+    os.utime(dst, ns=(dst_stat.st_atime_ns, src_stat.st_mtime_ns))
+    return True
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    """Clone ``src`` into ``dst``, raising OSError if unsupported."""
+    if sys.platform != "linux":
+        raise OSError("reflinks are only supported on Linux")
+
+    import fcntl
+
+    with src.open("rb") as src_file, dst.open("wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+def place_file(src: Path, dst: Path, *, hardlink: bool = False) -> str:
+    """Make ``dst`` a copy of ``src`` as cheaply as the filesystem allows.
+
+    The file is hardlinked (if ``hardlink`` is set), then reflinked, and
+    copied as a last resort. The new file is moved into place atomically, so
+    an existing ``dst`` is replaced rather than written into; this keeps
+    hardlinked files from being modified through the output directory.
+
+    :returns: How the file was placed: "hardlink", "reflink" or "copy".
+    """
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        method = "copy"
+        if hardlink:
+            with contextlib.suppress(OSError):
+                os.link(src, tmp)
+                method = "hardlink"
+        if method == "copy":
+            try:
+                _reflink(src, tmp)
+                method = "reflink"
+            except OSError:
+                tmp.unlink(missing_ok=True)
+                shutil.copy2(src, tmp)
+        tmp.replace(dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return method
+
+
+def sync_directory(
+    src: Path,
+    dst: Path,
+    *,
+    hardlink: bool = False,
+    exclude: Collection[str] = (),
+) -> list[Path]:
+    """Incrementally copy the files in ``src`` into ``dst``.
+
+    Files that are already up to date in ``dst`` are left alone. Files in
+    ``dst`` that don't exist in ``src`` are kept. Paths relative to ``src``
+    listed in ``exclude`` are skipped.
+
+    :returns: The paths in ``dst`` that were (re)written.
+    """
+    written: list[Path] = []
+    for src_file in sorted(src.rglob("*")):
+        if not src_file.is_file():
+            continue
+        relative = src_file.relative_to(src)
+        if relative.as_posix() in exclude:
+            continue
+        dst_file = dst / relative
+        if is_up_to_date(src_file, dst_file):
+            continue
+        dst_file.parent.mkdir(parents=True, exist_ok=True)
+        method = place_file(src_file, dst_file, hardlink=hardlink)
+        logger.debug("%s: %s from %s", dst_file, method, src_file)
+        written.append(dst_file)
+    return written
@@ -0,0 +1,358 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Synthetic documentation sets and build benchmarks for canonical-sphinx."""
+import argparse
+import base64
+import json
+import math
+import multiprocessing
+import platform
+import random
+import sys
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+import sphinx
+from sphinx.application import Sphinx
+
+import canonical_sphinx
+from canonical_sphinx import config
+
+MIN_PAGES = 10
+MAX_PAGES = 20000
+
+BUILDERS = ["html", "dirhtml", "epub", "latex"]
+
+# A 1x1 transparent PNG, used for the synthetic images.
+PNG_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==",
+)
+
+CONF_PY = """\
+project = "Synthetic Docs"
+author = "canonical-sphinx"
+copyright = "Canonical Ltd."
+version = "1.0"
+extensions = ["canonical_sphinx"]
+html_context = {
+    "github_url": "https://github.com/example/synthetic",
+    "display_contributors": False,
+}
+latex_documents = [
+    ("index", "synthetic.tex", project, author, "manual", False),
+]
+"""
+
+
+@dataclass
+class DocsetSpec:
+    """Shape of a synthetic documentation set.
+
+    :param pages: Number of pages, besides the root document.
+    :param source_format: "rst" for reStructuredText, "md" for MyST Markdown.
+    :param toctree_depth: Depth of the navigation tree below the root document.
+    :param code_blocks: Code blocks per page.
+    :param images: Images per page.
+    :param cross_references: References to other pages, per page.
+    :param seed: Seed for picking the cross-reference targets.
+    """
+
+    pages: int = 100
+    source_format: str = "rst"
+    toctree_depth: int = 3
+    code_blocks: int = 2
+    images: int = 1
+    cross_references: int = 3
+    seed: int = 0
+
+    def validate(self) -> None:
+        """Raise a ValueError if the spec can't be generated."""
+        if not MIN_PAGES <= self.pages <= MAX_PAGES:
+            raise ValueError(
+                f"Docsets must have between {MIN_PAGES} and {MAX_PAGES} pages.",
+            )
+        if self.source_format not in ("rst", "md"):
+            raise ValueError("The source format must be either 'rst' or 'md'.")
+        if self.toctree_depth < 1:
+            raise ValueError("The toctree depth must be at least 1.")
+        if min(self.code_blocks, self.images, self.cross_references) < 0:
+            raise ValueError("Element counts can't be negative.")
+
+
+def _page_name(index: int) -> str:
+    return f"page-{index:05d}"
+
+
+def _children(spec: DocsetSpec, fanout: int, index: int) -> range:
+    """Return the pages listed in the toctree of page ``index``.
+
+    Pages are laid out as a complete tree with the given fanout, where the
+    root document is index 0.
+    """
+    first = index * fanout + 1
+    return range(first, min(first + fanout, spec.pages + 1))
+
+
+def _render_page(
+    spec: DocsetSpec,
+    index: int,
+    children: range,
+    references: list[int],
+) -> str:
+    title = "Synthetic Docs" if index == 0 else f"Page {index}"
+    label = "root" if index == 0 else _page_name(index)
+    paragraph = (
+        f"This is the body of {title.lower()}. It has some *emphasis*, some "
+        "**strong text** and an ``inline literal``."
+    )
+    lines: list[str] = []
+
+    if spec.source_format == "md":
+        lines += [f"({label})=", f"# {title}", "", paragraph, ""]
+        for block in range(spec.code_blocks):
+            lines += [
+                "```python",
+                f"def function_{block}():",
+                "    return 42",
+                "```",
+                "",
+            ]
+        for image in range(spec.images):
+            lines += [
+                "```{image} /images/sample.png",
+                f":alt: Image {image}",
+                "```",
+                "",
+            ]
+        for target in references:
+            lines += [f"See {{ref}}`{_page_name(target)}`.", ""]
+        if children:
+            lines += ["```{toctree}", ":maxdepth: 1", ""]
+            lines += [f"/pages/{_page_name(child)}" for child in children]
+            lines += ["```", ""]
+    else:
+        lines += [f".. _{label}:", "", title, "=" * len(title), "", paragraph, ""]
+        for block in range(spec.code_blocks):
+            lines += [".. code-block:: python", "", f"    def function_{block}():"]
+            lines += ["        return 42", ""]
+        for image in range(spec.images):
+            lines += [".. image:: /images/sample.png", f"   :alt: Image {image}", ""]
+        for target in references:
+            lines += [f"See :ref:`{_page_name(target)}`.", ""]
+        if children:
+            lines += [".. toctree::", "   :maxdepth: 1", ""]
+            lines += [f"   /pages/{_page_name(child)}" for child in children]
+            lines += [""]
+
+    return "\n".join(lines)
+
+
+def generate_docset(spec: DocsetSpec, directory: Path) -> Path:
+    """Write a synthetic documentation project into ``directory``.
+
+    :returns: The directory containing the generated "conf.py".
+    """
+    spec.validate()
+    fanout = max(2, math.ceil(spec.pages ** (1 / spec.toctree_depth)))
+    rng = random.Random(spec.seed)  # noqa: S311 (not used for security)
+    suffix = f".{spec.source_format}"
+
+    (directory / "pages").mkdir(parents=True, exist_ok=True)
+    (directory / "images").mkdir(exist_ok=True)
+    (directory / "images" / "sample.png").write_bytes(PNG_IMAGE)
+    (directory / "conf.py").write_text(CONF_PY)
+
+    for index in range(spec.pages + 1):
+        references = [rng.randint(1, spec.pages) for _ in range(spec.cross_references)]
+        text = _render_page(spec, index, _children(spec, fanout, index), references)
+        if index == 0:
+            path = directory / f"index{suffix}"
+        else:
+            path = directory / "pages" / f"{_page_name(index)}{suffix}"
+        path.write_text(text)
+
+    return directory
+
+
+@contextmanager
+def _timed_functions(timings: dict[str, float]) -> Iterator[None]:
+    """Accumulate the time spent in canonical-sphinx's hooks into ``timings``."""
+    targets: list[tuple[Any, str, str]] = [
+        (canonical_sphinx, "setup", "setup"),
+        (config, "config_inited", "config_inited"),
+        (canonical_sphinx, "copy_custom_files", "copy_custom_files"),
+    ]
+
+    def wrap(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+        return wrapper
+
+    originals = [getattr(module, attr) for module, attr, _ in targets]
+    for (module, attr, name), func in zip(targets, originals, strict=True):
+        setattr(module, attr, wrap(name, func))
+    try:
+        yield
+    finally:
+        for (module, attr, _), func in zip(targets, originals, strict=True):
+            setattr(module, attr, func)
+
+
+def _connect_phase_timers(app: Sphinx, timings: dict[str, float]) -> None:
+    """Time the read and write phases of a build through Sphinx events."""
+    marks: dict[str, float] = {}
+
+    def mark(name: str) -> Callable[..., None]:
+        def handler(*_args: Any) -> None:
+            marks[name] = time.perf_counter()
+            if name == "read_end":
+                timings["read"] = marks["read_end"] - marks["read_start"]
+            elif name == "write_end":
+                timings["write"] = marks["write_end"] - marks["read_end"]
+
+        return handler
+
+    # Run first at the start of the phases and last at their end.
+    app.connect("env-before-read-docs", mark("read_start"), priority=0)
+    app.connect("env-updated", mark("read_end"), priority=1000)
+    app.connect("build-finished", mark("write_end"), priority=1000)
+
+
+def benchmark_builder(
+    srcdir: Path,
+    builddir: Path,
+    builder: str,
+) -> dict[str, float]:
+    """Build ``srcdir`` from scratch with ``builder`` and time each phase.
+
+    Sphinx and its extensions keep global state, so this should run in a fresh
+    interpreter (see :func:`run_benchmark`) for the results to be meaningful.
+    """
+    timings: dict[str, float] = {}
+    overrides = {"epub_build": True} if builder == "epub" else {}
+    start = time.perf_counter()
+
+    with _timed_functions(timings):
+        app = Sphinx(
+            str(srcdir),
+            str(srcdir),
+            str(builddir / builder),
+            str(builddir / "doctrees" / builder),
+            builder,
+            confoverrides=overrides,
+            status=None,
+            freshenv=True,
+        )
+        _connect_phase_timers(app, timings)
+        app.build()
+
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def run_benchmark(
+    spec: DocsetSpec,
+    workdir: Path,
+    builders: list[str] | None = None,
+) -> dict[str, Any]:
+    """Generate a docset, build it with each builder and return the results."""
+    srcdir = generate_docset(spec, workdir / "source")
+    results: dict[str, Any] = {
+        "canonical_sphinx": canonical_sphinx.__version__,
+        "sphinx": sphinx.__display_version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "docset": asdict(spec),
+        "builders": {},
+    }
+    # Every build gets a new interpreter, so that imports are timed the same way
+    # as for "sphinx-build" and builds don't share any state.
+    context = multiprocessing.get_context("spawn")
+    for builder in builders or BUILDERS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            future = executor.submit(
+                benchmark_builder,
+                srcdir,
+                workdir / "build",
+                builder,
+            )
+            results["builders"][builder] = future.result()
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark canonical-sphinx builds of a synthetic docset.",
+    )
+    parser.add_argument("workdir", type=Path, help="directory for the docset")
+    parser.add_argument("--pages", type=int, default=DocsetSpec.pages)
+    parser.add_argument(
+        "--format",
+        dest="source_format",
+        choices=["rst", "md"],
+        default=DocsetSpec.source_format,
+    )
+    parser.add_argument("--depth", type=int, default=DocsetSpec.toctree_depth)
+    parser.add_argument("--code-blocks", type=int, default=DocsetSpec.code_blocks)
+    parser.add_argument("--images", type=int, default=DocsetSpec.images)
+    parser.add_argument("--xrefs", type=int, default=DocsetSpec.cross_references)
+    parser.add_argument("--seed", type=int, default=DocsetSpec.seed)
+    parser.add_argument(
+        "--builder",
+        dest="builders",
+        action="append",
+        choices=BUILDERS,
+        help="builder to benchmark (repeatable; default: all)",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="write the JSON results to this file instead of stdout",
+    )
+    args = parser.parse_args(argv)
+
+    spec = DocsetSpec(
+        pages=args.pages,
+        source_format=args.source_format,
+        toctree_depth=args.depth,
+        code_blocks=args.code_blocks,
+        images=args.images,
+        cross_references=args.xrefs,
+        seed=args.seed,
+    )
+    try:
+        spec.validate()
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    results = run_benchmark(spec, args.workdir, args.builders)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
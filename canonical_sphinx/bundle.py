@@ -0,0 +1,203 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Bundling of the theme's stylesheets and scripts for HTML builds.
+
+The minifiers only remove comments and redundant whitespace. They are meant
+for the theme's own files, and don't handle every corner of CSS and
+JavaScript (such as JavaScript regular expression literals containing
+quotes).
+"""
+import hashlib
+import re
+import shutil
+from pathlib import Path
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from canonical_sphinx.cache import (
+    file_digest,
+    fingerprint,
+    get_cache_dir,
+    load_json,
+    save_json,
+)
+
+logger = logging.getLogger(__name__)
+
+static_dir = Path(__file__).parent / "theme" / "static"
+
+# Bump when the output of the minifiers changes, to invalidate cached bundles.
+BUNDLE_VERSION = 1
+
+# How many bundles are kept in the cache.
+BUNDLE_CACHE_SIZE = 8
+
+# Without bundles, the theme's files are added to "html_css_files" and
+# "html_js_files" after the project's own files, which Sphinx links at
+# priority 800. The bundles come after them too, to keep the same cascade.
+BUNDLE_PRIORITY = 801
+
+_CSS_TOKENS = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)""",
+    re.DOTALL,
+)
+_JS_TOKENS = re.compile(
+    r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)"""
+    r"""|(/\*.*?\*/|(?<![\w\\)\]])//[^\n]*)""",
+    re.DOTALL,
+)
+
+
+def _tokens(pattern: re.Pattern[str], text: str) -> list[tuple[bool, str]]:
+    """Split ``text`` into (is_string, text) tokens, without the comments.
+
+    Comments are replaced by whitespace, which is merged into the code around
+    them.
+    """
+    tokens: list[tuple[bool, str]] = []
+
+    def add_code(code: str) -> None:
+        if tokens and not tokens[-1][0]:
+            tokens[-1] = (False, tokens[-1][1] + code)
+        else:
+            tokens.append((False, code))
+
+    position = 0
+    for match in pattern.finditer(text):
+        add_code(text[position : match.start()])
+        if match.group(1) is not None:
+            tokens.append((True, match.group()))
+        else:
+            add_code("\n" if "\n" in match.group() else " ")
+        position = match.end()
+    add_code(text[position:])
+    return tokens
+
+
+def minify_css(text: str) -> str:
+    """Remove the comments and redundant whitespace from a stylesheet."""
+    css = ""
+    for is_string, token in _tokens(_CSS_TOKENS, text):
+        if is_string:
+            css += token
+        else:
+            code = re.sub(r"\s+", " ", token)
+            css += re.sub(r" ?([{};,>]) ?", r"\1", code)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(text: str) -> str:
+    """Remove the comments, indentation and blank lines from a script.
+
+    Line breaks are kept, so that automatic semicolon insertion still applies.
+    """
+    js = ""
+    for is_string, token in _tokens(_JS_TOKENS, text):
+        if is_string:
+            js += token
+        else:
+            code = re.sub(r"[ \t]*\n\s*", "\n", token)
+            js += re.sub(r"[ \t]+", " ", code)
+    return js.strip()
+
+
+def _write_bundle(directory: Path, stem: str, suffix: str, content: str) -> str:
+    """Write ``content`` under a content-hashed name and return the name."""
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    name = f"{stem}.{digest[:12]}{suffix}"
+    (directory / name).write_text(content, encoding="utf-8")
+    return name
+
+
+def build_bundle(
+    sources: Path,
+    css_files: list[str],
+    js_files: list[str],
+    cache_dir: Path,
+) -> tuple[Path, list[str]]:
+    """Concatenate and minify the files in ``sources`` into content-hashed files.
+
+    Bundles are cached in ``cache_dir``, keyed by the names and hashes of the
+    input files.
+
+    :returns: The directory containing the bundled files, and their names.
+    """
+    inputs = [(name, file_digest(sources / name)) for name in css_files + js_files]
+    key = fingerprint(BUNDLE_VERSION, inputs)[:16]
+    directory = cache_dir / key
+    manifest = cache_dir / f"{key}.json"
+
+    cached = load_json(manifest)
+    if isinstance(cached, list) and all(
+        isinstance(name, str) and (directory / name).exists() for name in cached
+    ):
+        manifest.touch()
+        return directory, cached
+
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    names: list[str] = []
+    if css_files:
+        css = "\n".join(
+            minify_css((sources / name).read_text(encoding="utf-8"))
+            for name in css_files
+        )
+        names.append(_write_bundle(directory, "canonical-sphinx", ".css", css))
+    if js_files:
+        js = ";\n".join(
+            minify_js((sources / name).read_text(encoding="utf-8")) for name in js_files
+        )
+        names.append(_write_bundle(directory, "canonical-sphinx", ".js", js))
+    save_json(manifest, names)
+
+    stale = sorted(
+        cache_dir.glob("*.json"),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    for path in stale[BUNDLE_CACHE_SIZE:]:
+        shutil.rmtree(path.with_suffix(""), ignore_errors=True)
+        path.unlink(missing_ok=True)
+    return directory, names
+
+
+def bundle_theme_assets(app: Sphinx, css_files: list[str], js_files: list[str]) -> None:
+    """Add the theme's stylesheets and scripts to HTML builds as two bundles.
+
+    If the bundles can't be written, the files are added individually.
+    """
+    if app.builder.format != "html":
+        return
+
+    try:
+        directory, names = build_bundle(
+            static_dir,
+            css_files,
+            js_files,
+            get_cache_dir(app) / "bundles",
+        )
+    except OSError as exc:
+        logger.warning("Could not bundle the theme assets: %s", exc)
+        names = css_files + js_files
+    else:
+        app.config.html_static_path.append(str(directory))
+
+    for name in names:
+        if name.endswith(".css"):
+            app.add_css_file(name, priority=BUNDLE_PRIORITY)
+        else:
+            app.add_js_file(name, priority=BUNDLE_PRIORITY)
@@ -0,0 +1,89 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""On-disk caches shared by the canonical-sphinx build stages."""
+import contextlib
+import hashlib
+import json
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir(app: Sphinx) -> Path:
+    """Return the cache directory inside the project's ".sphinx" directory."""
+    return Path(app.confdir) / ".sphinx" / "cache"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Return a stable hash of JSON-serialisable values."""
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """Return the SHA-256 hash of a file's contents."""
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_json(path: Path) -> object:
+    """Load a JSON cache file, returning None if it is missing or unreadable."""
+    try:
+        with path.open(encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(path: Path, data: object) -> None:
+    """Atomically write a JSON cache file.
+
+    Caches are an optimisation only, so failing to write one (for example, on a
+    read-only source tree) is logged and otherwise ignored.
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w", encoding="utf-8") as file:
+            json.dump(data, file, sort_keys=True)
+        tmp_path.replace(path)
+    except OSError as exc:
+        logger.debug("could not write cache file %s: %s", path, exc)
+        with contextlib.suppress(OSError):
+            tmp_path.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def locked(directory: Path) -> Iterator[None]:
+    """Hold a lock on a directory, for builds that update it at the same time."""
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover (not on Windows)
+        yield
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    with (directory / ".lock").open("w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
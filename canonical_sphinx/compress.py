@@ -0,0 +1,207 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Precompression of HTML build output for web servers that serve it."""
+import gzip
+import importlib.util
+import os
+import time
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from canonical_sphinx.cache import fingerprint, get_cache_dir, load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_SUFFIXES = frozenset(
+    [".html", ".css", ".js", ".json", ".svg", ".txt", ".xml", ".map"],
+)
+
+# Smaller files don't get any smaller once compressed.
+MIN_SIZE = 1024
+
+# Below this many files, compressing in this process is faster than starting
+# a pool of workers.
+MIN_POOL_FILES = 32
+
+
+def available_encoders() -> dict[str, str]:
+    """Return the available encodings, keyed by file suffix."""
+    encoders = {".gz": "gzip"}
+    if importlib.util.find_spec("brotli"):
+        encoders[".br"] = "brotli"
+    return encoders
+
+
+def _is_stale(path: Path, sibling: Path, incompressible: Mapping[str, int]) -> bool:
+    mtime = path.stat().st_mtime_ns
+    if incompressible.get(str(sibling)) == mtime:
+        return False
+    try:
+        return sibling.stat().st_mtime_ns < mtime
+    except FileNotFoundError:
+        return True
+
+
+def find_compressible(
+    outdir: Path,
+    suffixes: list[str],
+    incompressible: Mapping[str, int],
+) -> Iterator[Path]:
+    """Yield the files in ``outdir`` that have missing or outdated siblings.
+
+    Siblings in ``incompressible``, with the modification time of the file they
+    weren't written for, aren't missing unless the file has changed since.
+    """
+    for path in outdir.rglob("*"):
+        if path.suffix not in COMPRESSIBLE_SUFFIXES or not path.is_file():
+            continue
+        if path.stat().st_size < MIN_SIZE:
+            continue
+        if any(
+            _is_stale(path, path.with_name(path.name + suffix), incompressible)
+            for suffix in suffixes
+        ):
+            yield path
+
+
+def compress_file(
+    path: Path,
+    encoders: dict[str, str],
+    incompressible: Mapping[str, int] | None = None,
+) -> tuple[int, dict[str, int]]:
+    """Write the compressed siblings of ``path``, such as "index.html.gz".
+
+    Siblings are only written if they are smaller than the file itself.
+
+    :returns: The number of siblings written, and the siblings that weren't
+        written as they would be larger, with the modification time of
+        ``path``.
+    """
+    incompressible = incompressible or {}
+    data = path.read_bytes()
+    written = 0
+    skipped: dict[str, int] = {}
+    for suffix, encoding in encoders.items():
+        sibling = path.with_name(path.name + suffix)
+        if not _is_stale(path, sibling, incompressible):
+            continue
+        if encoding == "brotli":
+            import brotli  # pyright: ignore [reportMissingImports]
+
+            compressed = brotli.compress(data, mode=brotli.MODE_TEXT)
+        else:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+
+        if len(compressed) >= len(data):
+            sibling.unlink(missing_ok=True)
+            skipped[str(sibling)] = path.stat().st_mtime_ns
+            continue
+        tmp = sibling.with_name(f".{sibling.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(compressed)
+        tmp.replace(sibling)
+        written += 1
+    return written, skipped
+
+
+def _compress_files(
+    paths: list[Path],
+    encoders: dict[str, str],
+    incompressible: Mapping[str, int],
+) -> tuple[int, dict[str, int]]:
+    written = 0
+    skipped: dict[str, int] = {}
+    for path in paths:
+        count, siblings = compress_file(path, encoders, incompressible)
+        written += count
+        skipped.update(siblings)
+    return written, skipped
+
+
+def _load_incompressible(path: Path) -> dict[str, int]:
+    data = load_json(path)
+    if not isinstance(data, dict):
+        return {}
+    return {
+        name: mtime
+        for name, mtime in data.items()
+        if isinstance(name, str) and isinstance(mtime, int)
+    }
+
+
+def precompress_output(app: Sphinx, exception: Exception | None) -> None:
+    """Write gzip and Brotli versions of the compressible files in an HTML build.
+
+    Files whose compressed versions are newer than them are skipped, so
+    incremental builds only compress the files that they wrote. So are the
+    files that didn't compress in an earlier build and haven't changed since,
+    which are recorded in the cache directory.
+    """
+    if (
+        exception
+        or not app.config.precompress_output
+        or app.builder.format != "html"
+        or app.config.epub_build
+    ):
+        return
+
+    start = time.perf_counter()
+    outdir = Path(app.outdir).resolve()
+    record = get_cache_dir(app) / f"incompressible-{fingerprint(str(outdir))[:16]}.json"
+    incompressible = _load_incompressible(record)
+    encoders = available_encoders()
+    paths = sorted(find_compressible(outdir, list(encoders), incompressible))
+    workers = min(os.cpu_count() or 1, len(paths) // MIN_POOL_FILES)
+
+    if workers > 1:
+        # Interleave the files so that every worker gets a similar share.
+        batches = [paths[index::workers] for index in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _compress_files,
+                    batches,
+                    [encoders] * workers,
+                    [incompressible] * workers,
+                ),
+            )
+    else:
+        results = [_compress_files(paths, encoders, incompressible)]
+
+    written = 0
+    skipped: dict[str, int] = {}
+    for count, siblings in results:
+        written += count
+        skipped.update(siblings)
+    if skipped:
+        # Forget the files that have gone since.
+        incompressible = {
+            name: mtime
+            for name, mtime in incompressible.items()
+            if Path(name[: -len(Path(name).suffix)]).exists()
+        }
+        incompressible.update(skipped)
+        save_json(record, incompressible)
+
+    logger.info(
+        "canonical-sphinx: wrote %d compressed files for %d files in %.2fs",
+        written,
+        len(paths),
+        time.perf_counter() - start,
+    )
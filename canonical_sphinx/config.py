@@ -14,17 +14,80 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Sphinx configuration, extension and theme for Canonical documentation."""
-import ast
+import functools
 import importlib.util
 import os
+import sys
+import time
+from collections.abc import Mapping
 from pathlib import Path
 from typing import Any
 
 from sphinx.application import Sphinx
+from sphinx.builders.html import (
+    StandaloneHTMLBuilder,
+    convert_html_css_files,
+    convert_html_js_files,
+)
 from sphinx.config import Config
 from sphinx.errors import ConfigError
 from sphinx.util import logging
 
+from canonical_sphinx.bundle import bundle_theme_assets
+from canonical_sphinx.cache import fingerprint, get_cache_dir, load_json, save_json
+from canonical_sphinx.fonts import WEB_FONT_PRELOADS, web_fonts_enabled
+from canonical_sphinx.latex import build_latex_elements
+from canonical_sphinx.siteconfig import SITE_CONFIG, get_build_branch
+
+logger = logging.getLogger(__name__)
+
+# Optional extensions that only matter to builders of a single output format.
+# With "defer_optional_extensions" enabled, these are only imported and set up
+# on "builder-inited", and only when the builder produces that format.
+DEFERRABLE_EXTENSIONS = {
+    "sphinx_copybutton": "html",
+    "sphinxext.opengraph": "html",
+    "sphinxcontrib.jquery": "html",
+    "canonical.contributor-listing": "html",
+    "sphinxcontrib.cairosvgconverter": "latex",
+}
+
+# Optional extensions that the git history index replaces, when it is enabled.
+GIT_HISTORY_EXTENSIONS = frozenset(["sphinx_last_updated_by_git"])
+
+# The config values that each kind of output is generated from, once
+# config_inited has derived them from the canonical-sphinx options.
+DERIVED_OUTPUTS = {
+    "environment": ["exclude_patterns", "myst_enable_extensions"],
+    "html": [
+        "html_theme",
+        "html_theme_options",
+        "html_context",
+        "html_css_files",
+        "html_js_files",
+        "html_last_updated_fmt",
+        "html_permalinks_icon",
+        "html_copy_source",
+        "html_show_sourcelink",
+        "templates_path",
+    ],
+    "static files": ["html_static_path", "html_favicon"],
+    "404 page": ["notfound_urls_prefix", "notfound_template"],
+    "latex": [
+        "latex_engine",
+        "latex_elements",
+        "latex_show_pagerefs",
+        "latex_show_urls",
+        "latex_table_style",
+    ],
+}
+
+# Events that have already been emitted when deferred extensions are set up.
+REPLAYED_EVENTS = ["config-inited", "builder-inited"]
+
+# How many interpreter/sys.path combinations the discovery cache remembers.
+DISCOVERY_CACHE_SIZE = 16
+
 
 class SphinxConfig(Config):
     """Expanded class for linting config options."""
@@ -40,8 +103,12 @@ class SphinxConfig(Config):
     latex_show_pagerefs: bool
     latex_show_urls: str
     latex_table_style: list[str]
-    latex_config: str
     latex_elements: dict[str, Any]
+    latex_colors: dict[str, Any]
+    latex_environments: dict[str, str]
+    latex_preamble_fragments: dict[str, str]
+    latex_elements_overrides: dict[str, str]
+    latex_precompiled_preamble: bool
     html_copy_source: bool
     html_show_sourcelink: bool
 
@@ -49,28 +116,252 @@ class SphinxConfig(Config):
         pass
 
 
-def setup(app: Sphinx) -> dict[str, Any]:
+def setup(app: Sphinx) -> dict[str, Any]:  # noqa: PLR0915
     """Perform the main configuration and theme-setting."""
     # These are options that the user can set on their "conf.py"
     # (many options are still missing).
+    # None of them changes how sources are read, so changing them only
+    # rewrites the output (see DERIVED_OUTPUTS).
     app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
         "disable_feedback_button",
         default=False,
-        rebuild="env",
+        rebuild="html",
         types=bool,
     )
     app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
         "slug",
         default="",
-        rebuild="env",
+        rebuild="html",
         types=str,
     )
     app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
         "epub_build",
         default=False,
-        rebuild="env",
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "bundle_theme_assets",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "shared_static_dir",
+        default="",
+        rebuild="html",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "shared_static_url",
+        default="/_canonical_static/",
+        rebuild="html",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "self_host_web_fonts",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "optimize_images",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "webp_images",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "precompress_output",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "build_profile",
+        default="",
+        rebuild="",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "build_profile_top",
+        default=20,
+        rebuild="",
+        types=int,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "memory_profile",
+        default="",
+        rebuild="",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "memory_profile_frames",
+        default=25,
+        rebuild="",
+        types=int,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "hardlink_pdf_assets",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "subset_pdf_fonts",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "latex_colors",
+        default={},
+        rebuild="",
+        types=dict,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "latex_environments",
+        default={},
+        rebuild="",
+        types=dict,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "latex_preamble_fragments",
+        default={},
+        rebuild="",
+        types=dict,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "latex_elements_overrides",
+        default={},
+        rebuild="",
+        types=dict,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "latex_precompiled_preamble",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "defer_optional_extensions",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "sharded_search",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "instant_navigation",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "instant_navigation_swap",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "prefetch_budget",
+        default=2048,
+        rebuild="html",
+        types=int,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "external_navigation",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "git_history_index",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "runtime_site_config",
+        default=False,
+        rebuild="html",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "auto_parallel_jobs",
+        default=False,
+        rebuild="",
+        types=bool,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "parallel_scaling_file",
+        default="",
+        rebuild="",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "linkcheck_cache",
+        default=False,
+        rebuild="",
         types=bool,
     )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "linkcheck_cache_dir",
+        default="",
+        rebuild="",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "linkcheck_cache_ttl",
+        default={},
+        rebuild="",
+        types=dict,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "linkcheck_host_workers",
+        default=2,
+        rebuild="",
+        types=int,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "canonical_spelling_checker",
+        default="aspell",
+        rebuild="",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "canonical_spelling_lang",
+        default="en",
+        rebuild="",
+        types=str,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "canonical_spelling_wordlists",
+        default=[".wordlist.txt", ".custom_wordlist.txt"],
+        rebuild="",
+        types=list,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "canonical_spelling_workers",
+        default=0,
+        rebuild="",
+        types=int,
+    )
+    app.add_config_value(  # pyright: ignore [reportUnknownMemberType]
+        "shared_doctree_cache",
+        default="",
+        rebuild="",
+        types=str,
+    )
 
     extra_extensions = [
         "myst_parser",
@@ -93,26 +384,66 @@ def setup(app: Sphinx) -> dict[str, Any]:
         "sphinx_last_updated_by_git",
     ]
 
+    start = time.perf_counter()
+    found, cached = find_optional_extensions(app, optional_packages)
+
+    deferred: list[str] = []
     for package in optional_packages:
-        try:
-            if importlib.util.find_spec(package) is not None:
-                extra_extensions.append(package)
-                print(f"{package} found.\n{package} is now configured.")
-            else:
-                print(f"{package} not found.\n{package} will not be configured.")
-        except ModuleNotFoundError:  # noqa: PERF203
-            print(f"{package} not found.\n{package} will not be configured.")
+        if package not in found:
+            status = "not found"
+        elif app.config.git_history_index and package in GIT_HISTORY_EXTENSIONS:
+            # The git history index provides the "last updated" dates instead.
+            status = "replaced"
+        elif app.config.defer_optional_extensions and package in DEFERRABLE_EXTENSIONS:
+            status = "deferred"
+            deferred.append(package)
+        else:
+            status = "configured"
+            extra_extensions.append(package)
+        logger.verbose(
+            "optional extension %s: %s",
+            package,
+            status,
+            extra={"canonical_sphinx": {"extension": package, "status": status}},
+        )
 
     # These are the extra extensions that we need.
 
     for ext in extra_extensions:
         app.setup_extension(ext)
 
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "canonical-sphinx: configured %d of %d optional extensions in %.3fs%s",
+        len(extra_extensions) - 1,
+        len(optional_packages),
+        elapsed,
+        " (cached discovery)" if cached else "",
+        extra={
+            "canonical_sphinx": {
+                "configured": extra_extensions[1:],
+                "deferred": deferred,
+                "cached": cached,
+                "seconds": elapsed,
+            },
+        },
+    )
+
+    if deferred:
+        app.connect(  # pyright: ignore [reportUnknownMemberType]
+            "builder-inited",
+            functools.partial(setup_deferred_extensions, extensions=deferred),
+        )
+
     # Hook into config-inited so we can do more work after "conf.py" is parsed.
     app.connect(  # pyright: ignore [reportUnknownMemberType]
         "config-inited",
         config_inited,
     )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        record_config_fingerprint,
+    )
 
     return {
         "version": "0.1",
@@ -121,58 +452,208 @@ def setup(app: Sphinx) -> dict[str, Any]:
     }
 
 
-def config_inited(app: Sphinx, config: SphinxConfig) -> None:  # noqa: PLR0915, PLR0912
-    """Read user-provided values and setup defaults."""
-    # Get the Sphinx warning logger early
-    logger = logging.getLogger(__name__)
+def _discovery_key() -> str:
+    """Identify the interpreter, its import path and the installed packages.
 
-    config.myst_enable_extensions.update(["substitution", "deflist", "linkify"])
+    Installing, removing or upgrading a distribution changes the modification
+    time of the directory on ``sys.path`` that holds it, so the mtimes stand in
+    for the installed-distribution metadata.
+    """
+    entries: list[tuple[str, int | None]] = []
+    for entry in sys.path:
+        try:
+            mtime = Path(entry or ".").stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        entries.append((entry, mtime))
+    return fingerprint(sys.executable, sys.version, entries)
+
+
+def find_optional_extensions(
+    app: Sphinx,
+    packages: list[str],
+) -> tuple[list[str], bool]:
+    """Return which of ``packages`` are importable, and whether that was cached.
+
+    Results are persisted in the project's ".sphinx" directory and are
+    invalidated whenever the interpreter, ``sys.path`` or the set of installed
+    distributions changes.
+    """
+    cache_file = get_cache_dir(app) / "optional-extensions.json"
+    key = fingerprint(_discovery_key(), packages)
+
+    data = load_json(cache_file)
+    entries: dict[str, list[str]] = data if isinstance(data, dict) else {}
+    if key in entries:
+        return entries[key], True
+
+    found: list[str] = []
+    for package in packages:
+        try:
+            if importlib.util.find_spec(package) is not None:
+                found.append(package)
+        except ModuleNotFoundError:  # noqa: PERF203
+            pass
+
+    # Keep the most recent entries only, so switching between a handful of
+    # virtual environments doesn't grow the file forever.
+    entries[key] = found
+    for stale in list(entries)[:-DISCOVERY_CACHE_SIZE]:
+        del entries[stale]
+    save_json(cache_file, entries)
+
+    return found, False
+
+
+def setup_deferred_extensions(app: Sphinx, extensions: list[str]) -> None:
+    """Set up the deferred extensions that the current builder needs.
+
+    The extensions missed the events emitted before "builder-inited" finished,
+    so the handlers they register for those are called once here.
+    """
+    assets = _asset_config(app.config)
+    for ext in extensions:
+        if DEFERRABLE_EXTENSIONS[ext] != app.builder.format:
+            logger.verbose("optional extension %s: skipped", ext)
+            continue
+
+        known = {
+            event: {listener.id for listener in app.events.listeners[event]}
+            for event in REPLAYED_EVENTS
+        }
+        start = time.perf_counter()
+        app.setup_extension(ext)
 
-    config.exclude_patterns.extend(
-        [
-            "_build",
-            "Thumbs.db",
-            ".DS_Store",
-            ".sphinx",
-        ],
-    )
+        for event in REPLAYED_EVENTS:
+            args = (app.config,) if event == "config-inited" else ()
+            listeners = sorted(
+                app.events.listeners[event],
+                key=lambda listener: listener.priority,
+            )
+            for listener in listeners:
+                if listener.id not in known[event]:
+                    listener.handler(app, *args)
+
+        logger.verbose(
+            "optional extension %s: configured in %.3fs",
+            ext,
+            time.perf_counter() - start,
+        )
+
+    # HTML builders collect the files of "html_css_files" and "html_js_files"
+    # before "builder-inited", so they collect them again with the files that
+    # the replayed handlers added.
+    builder = app.builder
+    if (
+        isinstance(builder, StandaloneHTMLBuilder)
+        and _asset_config(app.config) != assets
+    ):
+        convert_html_css_files(app, app.config)
+        convert_html_js_files(app, app.config)
+        builder.init_css_files()
+        builder.init_js_files()
+
+    if "canonical.contributor-listing" in app.extensions:
+        app.config.html_context["has_contributor_listing"] = True
+
+
+def _asset_config(config: Config) -> list[Any]:
+    return [
+        list(getattr(config, name, None) or [])
+        for name in ("html_css_files", "html_js_files")
+    ]
+
+
+def _stable(value: Any) -> Any:  # noqa: ANN401
+    if isinstance(value, set | frozenset):
+        return sorted(value, key=str)
+    return value
 
-    # The URL prefix for the notfound extension depends on whether the documentation uses versions.
-    # For documentation on documentation.ubuntu.com, we also must add the slug.
+
+def config_fingerprint(config: Config) -> dict[str, str]:
+    """Return a hash of the config values that each kind of output uses."""
+    return {
+        output: fingerprint([_stable(getattr(config, name, None)) for name in names])
+        for output, names in DERIVED_OUTPUTS.items()
+    }
+
+
+def record_config_fingerprint(app: Sphinx) -> None:
+    """Log the outputs that configuration changes make Sphinx regenerate.
+
+    The fingerprints are kept per builder in the cache directory.
+    """
+    path = get_cache_dir(app) / "config-fingerprint.json"
+    cached = load_json(path)
+    fingerprints = cached if isinstance(cached, dict) else {}
+    previous = fingerprints.get(app.builder.name)
+    current = config_fingerprint(app.config)
+
+    if isinstance(previous, dict):
+        changed = [
+            output for output in current if previous.get(output) != current[output]
+        ]
+        if changed:
+            logger.info(
+                "canonical-sphinx: configuration changes affect: %s",
+                ", ".join(changed),
+                extra={"canonical_sphinx": {"changed_outputs": changed}},
+            )
+    if previous != current:
+        fingerprints[app.builder.name] = current
+        save_json(path, fingerprints)
+
+
+def url_prefix(slug: str, environ: Mapping[str, str]) -> str:
+    """Return the path that the docs are served under, for the notfound extension.
+
+    The path depends on whether the documentation uses versions and languages,
+    which Read the Docs sets in ``environ``. For documentation on
+    documentation.ubuntu.com, it also starts with the slug.
+    """
     url_version = ""
     url_lang = ""
 
     # Determine if the URL uses versions and language
-    if (
-        "READTHEDOCS_CANONICAL_URL" in os.environ
-        and os.environ["READTHEDOCS_CANONICAL_URL"]
-    ):
-        url_parts = os.environ["READTHEDOCS_CANONICAL_URL"].split("/")
+    if environ.get("READTHEDOCS_CANONICAL_URL"):
+        url_parts = environ["READTHEDOCS_CANONICAL_URL"].split("/")
 
         if (
             len(url_parts) >= 2  # noqa: PLR2004 (magic value)
-            and "READTHEDOCS_VERSION" in os.environ
-            and os.environ["READTHEDOCS_VERSION"] == url_parts[-2]
+            and environ.get("READTHEDOCS_VERSION") == url_parts[-2]
         ):
             url_version = url_parts[-2] + "/"
 
         if (
             len(url_parts) >= 3  # noqa: PLR2004 (magic value)
-            and "READTHEDOCS_LANGUAGE" in os.environ
-            and os.environ["READTHEDOCS_LANGUAGE"] == url_parts[-3]
+            and environ.get("READTHEDOCS_LANGUAGE") == url_parts[-3]
         ):
             url_lang = url_parts[-3] + "/"
 
-    # Set notfound_urls_prefix to the slug (if defined) and the version/language affix
-    slug = config.slug
     if slug:
-        notfound_urls_prefix = "/" + slug + "/" + url_lang + url_version
-    elif len(url_lang + url_version) > 0:
-        notfound_urls_prefix = "/" + url_lang + url_version
-    else:
-        notfound_urls_prefix = ""
+        return "/" + slug + "/" + url_lang + url_version
+    if url_lang + url_version:
+        return "/" + url_lang + url_version
+    return ""
+
+
+def config_inited(app: Sphinx, config: SphinxConfig) -> None:  # noqa: PLR0915, PLR0912
+    """Read user-provided values and setup defaults."""
+    # Get the Sphinx warning logger early
+    logger = logging.getLogger(__name__)
+
+    config.myst_enable_extensions.update(["substitution", "deflist", "linkify"])
+
+    config.exclude_patterns.extend(
+        [
+            "_build",
+            "Thumbs.db",
+            ".DS_Store",
+            ".sphinx",
+        ],
+    )
 
-    config.notfound_urls_prefix = notfound_urls_prefix
+    config.notfound_urls_prefix = url_prefix(config.slug, os.environ)
 
     if config.html_theme == "alabaster":
         config.html_theme = "canonical_sphinx_theme"
@@ -192,13 +673,14 @@ def config_inited(app: Sphinx, config: SphinxConfig) -> None:  # noqa: PLR0915,
     if not config.html_favicon:
         config.html_favicon = str(html_favicon)
 
+    self_host_web_fonts = web_fonts_enabled(config)
     extra_css = [
+        "web-fonts.css" if self_host_web_fonts else "fonts.css",
         "custom.css",
         "header.css",
         "github_issue_links.css",
         "furo_colors.css",
     ]
-    config.html_css_files.extend(extra_css)
 
     html_js_files = ["header-nav.js"]
 
@@ -216,13 +698,18 @@ def config_inited(app: Sphinx, config: SphinxConfig) -> None:  # noqa: PLR0915,
     config.latex_show_urls = "footnote"
     config.latex_table_style = ["standard", "colorrows", "booktabs"]
 
-    with Path.open(theme_dir / "PDF/latex_elements_template.txt", "r+") as file:
-        config.latex_config = file.read()
-
+    # A "latex_elements" from "conf.py" replaces all the Canonical elements;
+    # the "latex_*" options above are merged into them instead.
     if (
         config.latex_elements == {}
     ):  # pyright: ignore [reportUnnecessaryComparison] type: # ignore[comparison-overlap]
-        config.latex_elements = ast.literal_eval(config.latex_config)
+        config.latex_elements = build_latex_elements(
+            colors=config.latex_colors,
+            environments=config.latex_environments,
+            fragments=config.latex_preamble_fragments,
+            overrides=config.latex_elements_overrides,
+            precompiled=config.latex_precompiled_preamble,
+        )
 
     html_context = config.html_context
 
@@ -246,9 +733,43 @@ def config_inited(app: Sphinx, config: SphinxConfig) -> None:  # noqa: PLR0915,
     if html_context.get("github_issues") and not disable_feedback_button:
         html_js_files.append("github_issue_links.js")
 
-    html_context["has_contributor_listing"] = has_contributor_listing
+    sharded_search = config.sharded_search and not config.epub_build
+    if sharded_search:
+        html_js_files.append("search-as-you-type.js")
+
+    if config.external_navigation and not config.epub_build:
+        html_js_files.append("navigation.js")
+
+    runtime_site_config = config.runtime_site_config and not config.epub_build
+    if runtime_site_config:
+        html_js_files.append("site-config.js")
+
+    instant_navigation = None
+    if config.instant_navigation and not config.epub_build:
+        html_js_files.append("instant-navigation.js")
+        instant_navigation = {
+            "swap": config.instant_navigation_swap,
+            "budget": config.prefetch_budget * 1024,
+        }
 
-    config.html_js_files.extend(html_js_files)
+    html_context["has_contributor_listing"] = has_contributor_listing
+    html_context["web_font_preloads"] = WEB_FONT_PRELOADS if self_host_web_fonts else []
+    html_context["sharded_search"] = sharded_search
+    html_context["instant_navigation"] = instant_navigation
+    html_context["site_config"] = SITE_CONFIG if runtime_site_config else None
+
+    if config.bundle_theme_assets:
+        app.connect(  # pyright: ignore [reportUnknownMemberType]
+            "builder-inited",
+            functools.partial(
+                bundle_theme_assets,
+                css_files=extra_css,
+                js_files=html_js_files,
+            ),
+        )
+    else:
+        config.html_css_files.extend(extra_css)
+        config.html_js_files.extend(html_js_files)
 
     # Warnings for old HTML context settings
     if "github_folder" in config.html_context:
@@ -286,12 +807,8 @@ def config_inited(app: Sphinx, config: SphinxConfig) -> None:  # noqa: PLR0915,
     config.html_show_sourcelink = False
 
     # Inject branch name into context
-    branch = config.html_context["repo_default_branch"]
-
-    if "READTHEDOCS" in os.environ:  # noqa: SIM102; `in` is orthogonal to `!=`
-        # Skip PR builds because ReadTheDocs can't read the target branch from
-        # GitHub actions
-        if os.environ["READTHEDOCS_VERSION_TYPE"] != "external":
-            branch = os.environ["READTHEDOCS_GIT_IDENTIFIER"]
-
-    html_context["build_branch"] = branch
+    if runtime_site_config:
+        # The theme scripts read the actual branch from the site config.
+        html_context["build_branch"] = html_context["repo_default_branch"]
+    else:
+        html_context["build_branch"] = get_build_branch(html_context)
@@ -0,0 +1,304 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Parsed documents shared between builds, by the hash of their contents.
+
+Builds of several versions of the same docs mostly parse the same files. With
+"shared_doctree_cache" set to a directory, each document read by a build is
+stored there: its doctree, and the environment that it was read into. Other
+builds with the same document, configuration and extensions then merge it
+into their environment the way Sphinx merges documents read by parallel
+processes, instead of reading it again.
+
+The version, release and date aren't part of the configuration that the
+cache is keyed by, since they differ between versions. Documents are only
+shared if their text doesn't contain these values, or if they are the same.
+"""
+import functools
+import importlib.metadata
+import pickle
+import time
+from pathlib import Path
+from typing import Any
+
+import sphinx
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+from canonical_sphinx.assets import place_file
+from canonical_sphinx.cache import file_digest, fingerprint, load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+# Bump when the contents of the cache entries change.
+CACHE_VERSION = 1
+
+# Config values that documents rarely depend on, but that differ between
+# versions of the same docs.
+VERSIONED_CONFIG = ("version", "release", "today")
+
+
+def _extension_versions(app: Sphinx) -> dict[str, str]:
+    return {name: str(ext.version) for name, ext in sorted(app.extensions.items())}
+
+
+def environment_key(app: Sphinx) -> str:
+    """Return the hash of what all documents of a build are parsed with."""
+    config = sorted(
+        (item.name, item.value)
+        for item in app.config.filter(frozenset(("env",)))
+        if item.name not in VERSIONED_CONFIG
+    )
+    catalogs = {
+        path.as_posix(): file_digest(path)
+        for directory in app.config.locale_dirs
+        for path in sorted(
+            Path(app.srcdir, directory, app.config.language or "").rglob("*.mo"),
+        )
+    }
+    return fingerprint(
+        CACHE_VERSION,
+        sphinx.__display_version__,
+        importlib.metadata.version("docutils"),
+        _extension_versions(app),
+        [(name, _stable(value)) for name, value in config],
+        sorted(app.tags),
+        catalogs,
+    )
+
+
+def _stable(value: Any) -> Any:  # noqa: ANN401
+    if isinstance(value, set | frozenset):
+        return sorted(value, key=str)
+    return value
+
+
+def _digest(path: Path) -> str | None:
+    try:
+        return file_digest(path)
+    except OSError:
+        return None
+
+
+class DoctreeCache:
+    """A directory of doctrees and environments, named after their hashes."""
+
+    def __init__(self, app: Sphinx, directory: Path) -> None:
+        self.app = app
+        self.directory = directory
+        self.environment = environment_key(app)
+        self.read: list[str] = []
+        self.restored: list[str] = []
+        self.warnings = 0
+
+    def _blob(self, digest: str) -> Path:
+        return self.directory / "blobs" / digest[:2] / digest
+
+    def _store_blob(self, path: Path) -> str:
+        digest = file_digest(path)
+        blob = self._blob(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            place_file(path, blob)
+        return digest
+
+    def _entry_path(self, env: BuildEnvironment, docname: str) -> Path:
+        key = fingerprint(
+            self.environment,
+            docname,
+            file_digest(Path(env.doc2path(docname))),
+        )
+        return self.directory / "entries" / key[:2] / f"{key}.json"
+
+    @functools.cached_property
+    def _found_docs(self) -> str:
+        return fingerprint(sorted(self.app.env.found_docs))
+
+    def _versioned(self, doctree: nodes.document) -> dict[str, str]:
+        text = doctree.astext()
+        values = {
+            name: str(getattr(self.app.config, name)) for name in VERSIONED_CONFIG
+        }
+        return {name: value for name, value in values.items() if value in text}
+
+    def lookup(self, env: BuildEnvironment, docname: str) -> dict[str, Any] | None:
+        """Return the cache entry of a document, if it is still valid."""
+        entry = load_json(self._entry_path(env, docname))
+        if not isinstance(entry, dict):
+            return None
+        srcdir = Path(self.app.srcdir)
+        valid = (
+            all(
+                _digest(srcdir / path) == digest
+                for path, digest in entry["dependencies"].items()
+            )
+            and all(
+                str(getattr(self.app.config, name)) == value
+                for name, value in entry["versioned"].items()
+            )
+            and entry["found_docs"] in (None, self._found_docs)
+            and self._blob(entry["doctree"]).is_file()
+            and self._blob(entry["environment"]).is_file()
+        )
+        return entry if valid else None
+
+    def restore(
+        self,
+        env: BuildEnvironment,
+        entries: dict[str, dict[str, Any]],
+    ) -> None:
+        """Add the cached documents to the environment, instead of reading them."""
+        by_environment: dict[str, list[str]] = {}
+        for docname, entry in entries.items():
+            by_environment.setdefault(entry["environment"], []).append(docname)
+
+        for digest, docnames in by_environment.items():
+            with self._blob(digest).open("rb") as file:
+                other = pickle.load(file)  # noqa: S301 (our own cache)
+            for docname in docnames:
+                self.app.events.emit("env-purge-doc", env, docname)
+                env.clear_doc(docname)
+                doctree = Path(self.app.doctreedir, f"{docname}.doctree")
+                doctree.parent.mkdir(parents=True, exist_ok=True)
+                # Sphinx writes doctrees in place, so they can't be hardlinks.
+                place_file(self._blob(entries[docname]["doctree"]), doctree)
+            env.merge_info_from(docnames, other, self.app)
+            now = time.time_ns() // 1_000
+            for docname in docnames:
+                env.all_docs[docname] = now
+
+    def store(self, env: BuildEnvironment) -> None:
+        """Add the documents read by this build to the cache."""
+        if not self.read:
+            return
+        environment_file = Path(self.app.doctreedir, "shared-environment.pickle")
+        with environment_file.open("wb") as file:
+            pickle.dump(env, file, pickle.HIGHEST_PROTOCOL)
+        environment = self._store_blob(environment_file)
+        environment_file.unlink()
+
+        for docname in self.read:
+            doctree_file = Path(self.app.doctreedir, f"{docname}.doctree")
+            dependencies = self._dependencies(env, docname)
+            if not doctree_file.is_file() or dependencies is None:
+                continue
+            doctree = env.get_doctree(docname)
+            save_json(
+                self._entry_path(env, docname),
+                {
+                    "doctree": self._store_blob(doctree_file),
+                    "environment": environment,
+                    "dependencies": dependencies,
+                    "versioned": self._versioned(doctree),
+                    "found_docs": (
+                        self._found_docs if docname in env.glob_toctrees else None
+                    ),
+                },
+            )
+
+    def _dependencies(
+        self,
+        env: BuildEnvironment,
+        docname: str,
+    ) -> dict[str, str | None] | None:
+        """Return the hashes of the files that a document includes, by path."""
+        srcdir = Path(self.app.srcdir).resolve()
+        dependencies: dict[str, str | None] = {}
+        for dependency in env.dependencies.get(docname, ()):
+            path = Path(srcdir, dependency).resolve()
+            if not path.is_relative_to(srcdir):
+                # Other checkouts of the docs wouldn't have the same file.
+                return None
+            dependencies[path.relative_to(srcdir).as_posix()] = _digest(path)
+        return dependencies
+
+
+def before_read(
+    app: Sphinx,
+    env: BuildEnvironment,
+    docnames: list[str],
+    cache: DoctreeCache,
+) -> None:
+    """Restore the cached documents, and read the others."""
+    entries = {}
+    for docname in docnames:
+        entry = cache.lookup(env, docname)
+        if entry is not None:
+            entries[docname] = entry
+    cache.restored = list(entries)
+    if entries:
+        cache.restore(env, entries)
+        docnames[:] = [docname for docname in docnames if docname not in entries]
+        logger.info(
+            "canonical-sphinx: reused %d of %d documents from the shared doctree cache",
+            len(entries),
+            len(entries) + len(docnames),
+        )
+    cache.read = list(docnames)
+    cache.warnings = app._warncount  # noqa: SLF001 (no public counter)
+
+
+def store_doctrees(
+    app: Sphinx,
+    env: BuildEnvironment,
+    cache: DoctreeCache,
+) -> list[str]:
+    """Add the documents read by this build to the cache.
+
+    :returns: The restored documents, which Sphinx then counts as updated, so
+        that it saves the environment and checks its consistency.
+    """
+    # Documents aren't shared if reading them may have logged warnings, which
+    # the builds that reuse them wouldn't log.
+    if app._warncount != cache.warnings:  # noqa: SLF001
+        logger.verbose("not sharing the doctrees of a build with warnings")
+        return cache.restored
+    try:
+        cache.store(env)
+    except (OSError, pickle.PicklingError) as exc:
+        logger.warning("Could not write the shared doctree cache: %s", exc)
+    return cache.restored
+
+
+def setup_doctree_cache(app: Sphinx) -> None:
+    """Share parsed documents between builds, if "shared_doctree_cache" is set."""
+    if not app.config.shared_doctree_cache:
+        return
+    unsafe = [
+        name for name, ext in app.extensions.items() if not ext.parallel_read_safe
+    ]
+    if unsafe:
+        # Merging documents into another environment is only safe when every
+        # extension supports it, as for parallel builds.
+        logger.warning(
+            "Not using the shared doctree cache: these extensions aren't "
+            "parallel read safe: %s",
+            ", ".join(sorted(unsafe)),
+        )
+        return
+
+    cache = DoctreeCache(app, Path(app.confdir, app.config.shared_doctree_cache))
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "env-before-read-docs",
+        functools.partial(before_read, cache=cache),
+        # Before the number of parallel jobs is chosen for the documents to read.
+        priority=400,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "env-updated",
+        functools.partial(store_doctrees, cache=cache),
+    )
@@ -0,0 +1,276 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Builds of several versions and languages of the same docs, in one run.
+
+Each target is a git ref and a language. The ref is checked out in a worktree
+of its own, and built into "<outdir>/<language>/<version>/", with the same
+Read the Docs variables that a build of that version would have. The builds
+run in parallel processes, and share the documents that they read through
+"shared_doctree_cache".
+"""
+import argparse
+import dataclasses
+import os
+import re
+import subprocess
+import sys
+import urllib.parse
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from canonical_sphinx.parallel import cpu_count
+
+# The directory of the output that "--shared-static" writes the theme assets to.
+SHARED_STATIC_DIR = "_canonical_static"
+
+
+class FarmError(Exception):
+    """A target of the farm couldn't be built."""
+
+
+@dataclasses.dataclass(frozen=True)
+class Target:
+    """A version and language of the docs to build."""
+
+    ref: str
+    language: str = "en"
+
+    @property
+    def version(self) -> str:
+        """Return the version slug of the ref, as Read the Docs names it."""
+        return version_slug(self.ref)
+
+    @property
+    def name(self) -> str:
+        """Return the path of the target's output, relative to the farm's."""
+        return f"{self.language}/{self.version}"
+
+
+def version_slug(ref: str) -> str:
+    """Return the slug of a git ref, for URLs."""
+    slug = re.sub(r"[^a-z0-9._-]+", "-", ref.lower()).strip("-._")
+    if not slug:
+        raise ValueError(f"Can't make a version slug of {ref!r}.")
+    return slug
+
+
+def parse_target(value: str) -> Target:
+    """Parse a "REF[:LANGUAGE]" target of the command line."""
+    ref, _, language = value.partition(":")
+    if not ref:
+        raise argparse.ArgumentTypeError(f"{value!r} doesn't name a git ref.")
+    return Target(ref, language or "en")
+
+
+def target_environ(target: Target, base_url: str) -> dict[str, str]:
+    """Return the environment that a target is built with.
+
+    These are the variables that Read the Docs sets, and that the URL prefix
+    of the 404 page is derived from.
+    """
+    environ = dict(os.environ)
+    environ.update(
+        READTHEDOCS_CANONICAL_URL=f"{base_url.rstrip('/')}/{target.name}/",
+        READTHEDOCS_VERSION=target.version,
+        READTHEDOCS_LANGUAGE=target.language,
+    )
+    return environ
+
+
+def checkout(repo: Path, ref: str, worktree: Path) -> None:
+    """Check out ``ref`` of ``repo`` in ``worktree``, creating it if needed."""
+    if worktree.exists():
+        command = ["git", "-C", str(worktree), "checkout", "--force", "--detach", ref]
+    else:
+        worktree.parent.mkdir(parents=True, exist_ok=True)
+        command = [
+            "git",
+            "-C",
+            str(repo),
+            "worktree",
+            "add",
+            "--force",
+            "--detach",
+            str(worktree),
+            ref,
+        ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as exc:
+        raise FarmError(f"Could not check out {ref!r}: {exc.stderr.strip()}") from exc
+
+
+def build_target(
+    target: Target,
+    srcdir: Path,
+    outdir: Path,
+    workdir: Path,
+    base_url: str,
+    builder: str,
+    options: dict[str, str],
+) -> Path:
+    """Build one target with sphinx-build, logging to a file of its own.
+
+    :param options: Configuration values to set, as with "-D".
+    """
+    log = workdir / "logs" / f"{target.language}-{target.version}.log"
+    log.parent.mkdir(parents=True, exist_ok=True)
+    command = [
+        sys.executable,
+        "-m",
+        "sphinx",
+        "-b",
+        builder,
+        "-d",
+        str(workdir / "doctrees" / target.language / target.version),
+        *(
+            argument
+            for name, value in {"language": target.language, **options}.items()
+            for argument in ("-D", f"{name}={value}")
+        ),
+        str(srcdir),
+        str(outdir / target.language / target.version),
+    ]
+    with log.open("w") as file:
+        result = subprocess.run(  # noqa: PLW1510 (checked below, with the log)
+            command,
+            stdout=file,
+            stderr=subprocess.STDOUT,
+            env=target_environ(target, base_url),
+        )
+    if result.returncode:
+        raise FarmError(f"The build of {target.name} failed; see {log}.")
+    return log
+
+
+def run_farm(  # noqa: PLR0913 (the options of the command line)
+    repo: Path,
+    outdir: Path,
+    targets: Iterable[Target],
+    *,
+    docs_dir: str = "docs",
+    base_url: str = "/",
+    builder: str = "html",
+    jobs: int | None = None,
+    workdir: Path | None = None,
+    shared_static: bool = False,
+) -> list[Path]:
+    """Build every target of ``repo`` into ``outdir``.
+
+    The first target of each language is built first, so that the targets
+    after it can reuse the documents that it read.
+
+    :param workdir: The directory for the worktrees, doctrees, logs and shared
+        cache of the builds, next to ``outdir`` by default.
+    :param shared_static: Whether the targets share their theme assets, in
+        ``outdir``'s "_canonical_static" directory.
+    :returns: The build logs of the targets.
+    """
+    targets = list(dict.fromkeys(targets))
+    if workdir is None:
+        workdir = outdir.with_name(f"{outdir.name}.farm")
+    for ref in dict.fromkeys(target.ref for target in targets):
+        checkout(repo, ref, workdir / "worktrees" / version_slug(ref))
+
+    options = {
+        "shared_doctree_cache": str((workdir / "cache").resolve()),
+        "linkcheck_cache_dir": str((workdir / "linkcheck").resolve()),
+    }
+    if shared_static:
+        options["shared_static_dir"] = str((outdir / SHARED_STATIC_DIR).resolve())
+        options["shared_static_url"] = (
+            urllib.parse.urlsplit(base_url).path.rstrip("/") + f"/{SHARED_STATIC_DIR}/"
+        )
+
+    def build(target: Target) -> Path:
+        srcdir = workdir / "worktrees" / target.version / docs_dir
+        return build_target(
+            target,
+            srcdir,
+            outdir,
+            workdir,
+            base_url,
+            builder,
+            options,
+        )
+
+    seeds = list({target.language: target for target in reversed(targets)}.values())
+    rest = [target for target in targets if target not in seeds]
+    logs: list[Path] = []
+    with ThreadPoolExecutor(max_workers=jobs or cpu_count()) as executor:
+        for batch in (seeds, rest):
+            logs.extend(executor.map(build, batch))
+    return logs
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Build several versions and languages of the docs from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Build several versions and languages of the docs of a repository.",
+    )
+    parser.add_argument("repo", type=Path, help="git repository of the docs")
+    parser.add_argument("outdir", type=Path, help="directory for the builds")
+    parser.add_argument(
+        "--target",
+        dest="targets",
+        type=parse_target,
+        action="append",
+        required=True,
+        help="REF[:LANGUAGE] to build (repeatable; the language defaults to 'en')",
+    )
+    parser.add_argument(
+        "--docs-dir",
+        default="docs",
+        help="directory of conf.py in the repository",
+    )
+    parser.add_argument(
+        "--base-url",
+        default="/",
+        help="URL that '<language>/<version>/' of each target is served under",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        help="directory for the worktrees and caches (default: OUTDIR.farm)",
+    )
+    parser.add_argument(
+        "--shared-static",
+        action="store_true",
+        help=f"share the theme assets of the targets in OUTDIR/{SHARED_STATIC_DIR}",
+    )
+    parser.add_argument("-b", "--builder", default="html")
+    parser.add_argument("-j", "--jobs", type=int, help="builds to run at once")
+    args = parser.parse_args(argv)
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("The number of jobs must be at least 1.")
+    try:
+        logs = run_farm(
+            args.repo,
+            args.outdir,
+            args.targets,
+            docs_dir=args.docs_dir,
+            base_url=args.base_url,
+            builder=args.builder,
+            jobs=args.jobs,
+            workdir=args.workdir,
+            shared_static=args.shared_static,
+        )
+    except FarmError as exc:
+        sys.exit(str(exc))
+    for log in logs:
+        sys.stderr.write(f"{log}\n")
@@ -0,0 +1,224 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Subsetting of the bundled Ubuntu fonts for PDF builds and web pages."""
+import html
+import importlib.util
+import logging as std_logging
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+from sphinx.util import logging
+
+from canonical_sphinx.assets import is_up_to_date, place_file
+from canonical_sphinx.cache import file_digest, fingerprint, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+pdf_dir = Path(__file__).parent / "theme" / "PDF"
+
+# The fonts loaded by the "fonts" fragment of the LaTeX preamble.
+FONT_FILES = [
+    "Ubuntu-R.ttf",
+    "Ubuntu-B.ttf",
+    "Ubuntu-RI.ttf",
+    "UbuntuMono-R.ttf",
+    "UbuntuMono-B.ttf",
+    "UbuntuMono-RI.ttf",
+]
+
+# Characters that LaTeX can typeset without them appearing in the generated
+# sources, such as page numbers, localised headings from babel/polyglossia
+# and typographic punctuation produced by ligatures and macros.
+BASE_CHARACTERS = frozenset(
+    [chr(code) for code in range(0x20, 0x7F)]
+    + [chr(code) for code in range(0xA0, 0x180)]
+    # En and em dashes, curly quotes, bullet, ellipsis, euro and trademark.
+    + list("\u2013\u2014\u2018\u2019\u201a\u201c\u201d\u201e\u2022\u2026\u20ac\u2122"),
+)
+
+# How many subsets of each font are kept in the cache.
+SUBSET_CACHE_SIZE = 8
+
+# The web fonts that most pages need to render their first screen; the others
+# are only downloaded when used. See "web-fonts.css".
+WEB_FONT_PRELOADS = ["Ubuntu-R.woff2", "Ubuntu-B.woff2"]
+
+
+def subsetting_enabled(app: Sphinx) -> bool:
+    """Check whether fonts should be subset for this build."""
+    if not app.config.subset_pdf_fonts:
+        return False
+    if importlib.util.find_spec("fontTools") is None:
+        logger.warning(
+            "'subset_pdf_fonts' requires fontTools; the full fonts are used instead.",
+            once=True,
+        )
+        return False
+    return True
+
+
+def web_fonts_enabled(config: Config) -> bool:
+    """Check whether the site should use self-hosted fonts.
+
+    EPUB builds package their files before the fonts would be generated, so
+    they keep using the remote fonts.
+    """
+    if not config.self_host_web_fonts or config.epub_build:
+        return False
+    if not all(importlib.util.find_spec(name) for name in ("fontTools", "brotli")):
+        logger.warning(
+            "'self_host_web_fonts' requires fontTools and brotli; "
+            "the fonts are loaded from assets.ubuntu.com instead.",
+            once=True,
+        )
+        return False
+    return True
+
+
+def collect_characters(outdir: Path) -> set[str]:
+    """Return the characters used by the LaTeX sources in ``outdir``."""
+    characters = set(BASE_CHARACTERS)
+    for pattern in ("*.tex", "*.sty"):
+        for path in outdir.glob(pattern):
+            characters.update(path.read_text(encoding="utf-8", errors="ignore"))
+    return characters
+
+
+def collect_html_characters(outdir: Path) -> set[str]:
+    """Return the characters used by the HTML pages in ``outdir``."""
+    characters = set(BASE_CHARACTERS)
+    for path in outdir.rglob("*.html"):
+        characters.update(html.unescape(path.read_text(encoding="utf-8")))
+    return characters
+
+
+def subset_font(
+    src: Path,
+    dst: Path,
+    characters: Iterable[str],
+    flavor: str | None = None,
+) -> None:
+    """Write a copy of the font ``src`` that only covers ``characters``.
+
+    :param flavor: Set to "woff2" to write a compressed web font.
+    """
+    from fontTools import subset  # pyright: ignore [reportMissingTypeStubs]
+
+    # fontTools reports every table it prunes at the INFO level.
+    std_logging.getLogger("fontTools").setLevel(std_logging.WARNING)
+
+    options = subset.Options()
+    # Keep ligatures, kerning and the font names that fontspec relies on.
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    options.notdef_outline = True
+    # PDF viewers don't use TrueType hinting, and it's a large part of the file.
+    options.hinting = flavor is not None
+    options.flavor = flavor
+
+    font = subset.load_font(str(src), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=sorted(ord(char) for char in characters))
+    subsetter.subset(font)
+    subset.save_font(font, str(dst), options)
+
+
+def _get_subset(
+    src: Path,
+    characters: set[str],
+    cache_dir: Path,
+    flavor: str | None = None,
+) -> Path:
+    """Return the cached subset of ``src`` for ``characters``, creating it."""
+    key = fingerprint(file_digest(src), sorted(characters))
+    suffix = f".{flavor}" if flavor else src.suffix
+    cached = cache_dir / f"{src.stem}-{key[:16]}{suffix}"
+
+    if cached.exists():
+        cached.touch()
+        return cached
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(f".{cached.name}.{os.getpid()}.tmp")
+    subset_font(src, tmp, characters, flavor)
+    tmp.replace(cached)
+
+    stale = sorted(
+        cache_dir.glob(f"{src.stem}-*{suffix}"),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    for path in stale[SUBSET_CACHE_SIZE:]:
+        path.unlink(missing_ok=True)
+    return cached
+
+
+def subset_pdf_fonts(app: Sphinx, exception: Exception | None) -> None:
+    """Replace the fonts in the LaTeX output with subsets of the used glyphs."""
+    if exception or app.builder.format != "latex" or not subsetting_enabled(app):
+        return
+
+    outdir = Path(app.outdir)
+    characters = collect_characters(outdir)
+    cache_dir = get_cache_dir(app) / "fonts"
+
+    for name in FONT_FILES:
+        src = pdf_dir / name
+        dst = outdir / name
+        try:
+            subset = _get_subset(src, characters, cache_dir)
+        except Exception as exc:  # noqa: BLE001 (fall back on any fontTools error)
+            logger.warning("Could not subset %s, using the full font: %s", name, exc)
+            subset = src
+        if not is_up_to_date(subset, dst):
+            place_file(subset, dst)
+
+    logger.info(
+        "canonical-sphinx: subset PDF fonts to %d characters",
+        len(characters),
+    )
+
+
+def write_web_fonts(app: Sphinx, exception: Exception | None) -> None:
+    """Write WOFF2 subsets of the Ubuntu fonts for the characters in the site."""
+    if exception or app.builder.format != "html" or not web_fonts_enabled(app.config):
+        return
+
+    outdir = Path(app.outdir)
+    characters = collect_html_characters(outdir)
+    cache_dir = get_cache_dir(app) / "fonts"
+    fonts_dir = outdir / "_static" / "fonts"
+    fonts_dir.mkdir(parents=True, exist_ok=True)
+
+    for name in FONT_FILES:
+        src = pdf_dir / name
+        dst = fonts_dir / f"{src.stem}.woff2"
+        try:
+            subset = _get_subset(src, characters, cache_dir, "woff2")
+        except Exception as exc:  # noqa: BLE001 (fall back on any fontTools error)
+            logger.warning("Could not convert %s to a web font: %s", name, exc)
+            continue
+        if not is_up_to_date(subset, dst):
+            place_file(subset, dst)
+
+    logger.info(
+        "canonical-sphinx: wrote web fonts for %d characters",
+        len(characters),
+    )
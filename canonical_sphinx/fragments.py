@@ -0,0 +1,70 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Reuse of the template fragments that are the same on many pages."""
+import functools
+from collections.abc import Callable
+from typing import Any
+
+from sphinx.application import Sphinx
+
+
+class FragmentCache:
+    """Rendered template fragments, keyed by the values that they use.
+
+    Templates use it through a call block, listing every value that the
+    fragment depends on, including the results of ``pathto()`` for fragments
+    with relative links::
+
+        {% call cached_fragment("header", pathto(product_tag, 1), project) %}
+          ...
+        {% endcall %}
+    """
+
+    def __init__(self) -> None:
+        self.fragments: dict[tuple[str, str], str] = {}
+        self.hits = 0
+
+    def render(self, name: str, *key: object, caller: Callable[[], str]) -> str:
+        """Return the fragment's markup, only rendering it for new keys."""
+        cache_key = (name, repr(key))
+        markup = self.fragments.get(cache_key)
+        if markup is None:
+            markup = self.fragments[cache_key] = caller()
+        else:
+            self.hits += 1
+        return markup
+
+
+def add_fragment_cache(
+    app: Sphinx,  # noqa: ARG001 (event handler signature)
+    pagename: str,  # noqa: ARG001
+    templatename: str,  # noqa: ARG001
+    context: dict[str, Any],
+    doctree: object,  # noqa: ARG001
+    cache: FragmentCache,
+) -> None:
+    """Make the fragment cache available to the page templates."""
+    context["cached_fragment"] = cache.render
+
+
+def setup_fragment_cache(app: Sphinx) -> None:
+    """Share a fragment cache between the pages of an HTML build."""
+    if app.builder.format != "html":
+        return
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "html-page-context",
+        functools.partial(add_fragment_cache, cache=FragmentCache()),
+    )
@@ -0,0 +1,290 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""An index of the git history of the documentation's source files.
+
+The index is built from a single "git log" of the repository, instead of a
+"git log" per file, and answers the "last updated" dates and contributor
+listings of the pages. It is cached by HEAD commit, and updated from the
+previous HEAD when the new one descends from it.
+"""
+import functools
+import subprocess
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.locale import _
+from sphinx.util import logging
+from sphinx.util.i18n import format_date
+
+from canonical_sphinx.cache import get_cache_dir, load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+# Bump when the format of the cached index changes.
+INDEX_VERSION = 1
+
+_RECORD = "\x1e"
+_FIELD = "\x1f"
+LOG_FORMAT = (
+    f"{_RECORD}%H{_FIELD}%ct{_FIELD}%an{_FIELD}"
+    f"%(trailers:key=Co-authored-by,valueonly,separator=%x1f)"
+)
+
+
+class GitError(Exception):
+    """A git command failed."""
+
+
+def _git(repo: Path, *args: str) -> str:
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(repo), *args],  # (git from PATH)
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise GitError(str(exc)) from exc
+    return result.stdout.strip()
+
+
+def parse_log(lines: Iterable[str]) -> Iterator[tuple[str, int, list[str], str]]:
+    """Parse the output of "git log --name-only" with :data:`LOG_FORMAT`.
+
+    :returns: The commit hash, commit time, authors and path of every file
+        changed by every commit.
+    """
+    commit: tuple[str, int, list[str]] | None = None
+    for raw_line in lines:
+        line = raw_line.rstrip("\n")
+        if line.startswith(_RECORD):
+            sha, timestamp, author, *co_authors = line[1:].split(_FIELD)
+            names = [author] + [
+                value.split(" <")[0].strip() for value in co_authors if value.strip()
+            ]
+            commit = (sha, int(timestamp), list(dict.fromkeys(names)))
+        elif line and commit:
+            yield (*commit, line)
+
+
+class GitHistory:
+    """The last update time and contributors of every file in a repository.
+
+    Paths are relative to the root of the repository.
+    """
+
+    def __init__(self, root: Path, head: str = "") -> None:
+        self.root = root
+        self.head = head
+        self.files: dict[str, dict[str, Any]] = {}
+
+    def add(self, sha: str, timestamp: int, authors: list[str], path: str) -> None:
+        """Record that a commit by ``authors`` changed ``path``."""
+        entry = self.files.setdefault(path, {"updated": 0, "contributors": {}})
+        entry["updated"] = max(entry["updated"], timestamp)
+        for author in authors:
+            latest = entry["contributors"].get(author)
+            if latest is None or timestamp > latest[0]:
+                entry["contributors"][author] = [timestamp, sha]
+
+    def read_log(self, revisions: str) -> int:
+        """Add the commits in ``revisions`` from one streamed "git log".
+
+        :returns: The number of commits read.
+        """
+        command = [
+            "git",
+            "-C",
+            str(self.root),
+            "-c",
+            "core.quotePath=false",
+            "log",
+            "--name-only",
+            "--no-renames",
+            f"--format={LOG_FORMAT}",
+            revisions,
+            "--",
+        ]
+        commits: set[str] = set()
+        try:
+            with subprocess.Popen(
+                command,  # (fixed arguments)
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            ) as process:
+                assert process.stdout is not None  # noqa: S101 (for the type checker)
+                for sha, timestamp, authors, path in parse_log(process.stdout):
+                    commits.add(sha)
+                    self.add(sha, timestamp, authors, path)
+        except OSError as exc:
+            raise GitError(str(exc)) from exc
+        if process.returncode:
+            raise GitError(f"git log exited with status {process.returncode}")
+        return len(commits)
+
+    def last_updated(self, paths: Iterable[str]) -> int | None:
+        """Return the time of the latest commit that changed any of ``paths``."""
+        times = [self.files[path]["updated"] for path in paths if path in self.files]
+        return max(times, default=None)
+
+    def contributors(self, path: str, since: int = 0) -> dict[str, list[Any]]:
+        """Return the latest (time, commit) of each contributor to ``path``.
+
+        :param since: Only include contributors with commits after this time.
+        """
+        entry = self.files.get(path, {"contributors": {}})
+        return {
+            name: latest
+            for name, latest in entry["contributors"].items()
+            if latest[0] >= since
+        }
+
+    def to_json(self) -> dict[str, Any]:
+        """Return the index as JSON-serialisable data."""
+        return {"version": INDEX_VERSION, "head": self.head, "files": self.files}
+
+    @classmethod
+    def from_json(cls, root: Path, data: object) -> "GitHistory | None":
+        """Load an index saved with :meth:`to_json`, if it is valid."""
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        history = cls(root, data["head"])
+        history.files = data["files"]
+        return history
+
+
+def load_history(root: Path, cache_file: Path) -> GitHistory:
+    """Return the index for HEAD, updating the cached index if needed."""
+    head = _git(root, "rev-parse", "HEAD")
+    history = GitHistory.from_json(root, load_json(cache_file))
+
+    if history is not None and history.head == head:
+        return history
+
+    if history is not None:
+        try:
+            _git(root, "merge-base", "--is-ancestor", history.head, head)
+        except GitError:
+            history = None
+
+    if history is None:
+        history = GitHistory(root)
+        revisions = head
+    else:
+        revisions = f"{history.head}..{head}"
+
+    commits = history.read_log(revisions)
+    history.head = head
+    save_json(cache_file, history.to_json())
+    logger.verbose("git history: read %d commits (%s)", commits, revisions)
+    return history
+
+
+def _relative_paths(app: Sphinx, docname: str, root: Path) -> list[str]:
+    """Return the repository paths of a document's source and dependencies."""
+    env = app.env
+    paths = [Path(env.doc2path(docname))]
+    paths += [Path(app.srcdir, dep) for dep in env.dependencies.get(docname, ())]
+    resolved = [path.resolve() for path in paths]
+    return [
+        path.relative_to(root).as_posix()
+        for path in resolved
+        if path.is_relative_to(root)
+    ]
+
+
+@functools.cache
+def _since_timestamp(root: Path, since: str) -> int:
+    """Convert a git date, such as "2 years ago", to a timestamp."""
+    # "git rev-parse --since=<date>" prints "--max-age=<timestamp>".
+    output = _git(root, "rev-parse", f"--since={since}")
+    return int(output.rpartition("=")[2])
+
+
+def add_history_context(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,  # noqa: ARG001 (event handler signature)
+    context: dict[str, Any],
+    doctree: object,  # noqa: ARG001
+    history: GitHistory,
+) -> None:
+    """Answer the page's "last updated" date and contributors from the index."""
+    if pagename not in app.env.all_docs:
+        return
+    paths = _relative_paths(app, pagename, history.root.resolve())
+
+    updated = history.last_updated(paths)
+    if updated is not None and app.config.html_last_updated_fmt is not None:
+        context["last_updated"] = format_date(
+            app.config.html_last_updated_fmt or _("%b %d, %Y"),
+            date=datetime.fromtimestamp(updated, tz=timezone.utc),
+            language=app.config.language,
+        )
+
+    if "get_contributors_for_file" not in context:
+        return
+    github_url = context.get("github_url")
+    since_value = (context.get("display_contributors_since") or "").strip()
+
+    def get_contributors_for_file(
+        pagename: str,  # noqa: ARG001 (same signature as the extension's)
+        page_source_suffix: str,  # noqa: ARG001
+    ) -> list[tuple[str, str]]:
+        if not context.get("display_contributors") or not github_url or not paths:
+            return []
+        since = _since_timestamp(history.root, since_value) if since_value else 0
+        contributors = history.contributors(paths[0], since)
+        return sorted(
+            (name, f"{github_url}/commit/{sha}")
+            for name, (_time, sha) in contributors.items()
+        )
+
+    context["get_contributors_for_file"] = get_contributors_for_file
+
+
+def setup_git_history(app: Sphinx) -> None:
+    """Build the git history index for HTML builds, if it is enabled."""
+    if not app.config.git_history_index or app.builder.format != "html":
+        return
+
+    start = time.perf_counter()
+    try:
+        root = Path(_git(Path(app.srcdir), "rev-parse", "--show-toplevel"))
+        history = load_history(root, get_cache_dir(app) / "git-history.json")
+    except GitError as exc:
+        logger.warning("Could not read the git history: %s", exc, once=True)
+        return
+
+    # After the contributor listing extension, which this replaces the
+    # lookups of.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "html-page-context",
+        functools.partial(add_history_context, history=history),
+        priority=600,
+    )
+    logger.info(
+        "canonical-sphinx: indexed the git history of %d files in %.3fs",
+        len(history.files),
+        time.perf_counter() - start,
+    )
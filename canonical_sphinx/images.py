@@ -0,0 +1,337 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Lossless optimisation of the images in build output directories.
+
+PNG files are recompressed and SVG files are minified without any extra
+dependencies. WebP variants and the downscaled PDF logo need Pillow.
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from urllib.parse import unquote
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from canonical_sphinx.assets import is_up_to_date, place_file
+from canonical_sphinx.cache import (
+    file_digest,
+    fingerprint,
+    get_cache_dir,
+    load_json,
+    save_json,
+)
+
+logger = logging.getLogger(__name__)
+
+pdf_dir = Path(__file__).parent / "theme" / "PDF"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Chunks that only hold metadata, such as the editing software and time.
+PNG_METADATA_CHUNKS = frozenset([b"tEXt", b"zTXt", b"iTXt", b"tIME"])
+
+# The output directories that hold images in HTML builds.
+IMAGE_DIRS = ["_images", "_static"]
+
+WEBP_SOURCES = frozenset([".png", ".jpg", ".jpeg"])
+
+# The logo on every PDF page; the preamble includes it 4 cm wide.
+PDF_LOGO = "Canonical-logo-4x.png"
+PDF_LOGO_WIDTH_CM = 4
+PDF_IMAGE_DPI = 300
+
+_IMG_TAG = re.compile(r"""<img\b[^>]*?\ssrc="([^"]+)"[^>]*>""")
+_SOURCE_BEFORE = re.compile(r"<source\b[^>]*>\s*$")
+
+
+def pillow_available() -> bool:
+    """Check whether Pillow is installed, warning once if it isn't."""
+    if importlib.util.find_spec("PIL") is None:
+        logger.warning(
+            "WebP images and PDF logo downscaling require Pillow; skipping them.",
+            once=True,
+        )
+        return False
+    return True
+
+
+def _png_chunks(data: bytes) -> list[tuple[bytes, bytes]]:
+    chunks: list[tuple[bytes, bytes]] = []
+    position = len(PNG_SIGNATURE)
+    while position < len(data):
+        (length,) = struct.unpack(">I", data[position : position + 4])
+        kind = data[position + 4 : position + 8]
+        chunks.append((kind, data[position + 8 : position + 8 + length]))
+        position += length + 12
+    return chunks
+
+
+def _png_chunk(kind: bytes, body: bytes) -> bytes:
+    crc = zlib.crc32(kind + body)
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", crc)
+
+
+def recompress_png(data: bytes) -> bytes:
+    """Losslessly recompress a PNG image and drop its metadata chunks.
+
+    :returns: The smaller of the original and recompressed images.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+    try:
+        chunks = _png_chunks(data)
+        pixels = zlib.decompress(b"".join(b for k, b in chunks if k == b"IDAT"))
+    except (struct.error, zlib.error):
+        return data
+
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9)
+    idat = compressor.compress(pixels) + compressor.flush()
+
+    output = [PNG_SIGNATURE]
+    for kind, body in chunks:
+        if kind == b"IDAT":
+            if idat:
+                output.append(_png_chunk(kind, idat))
+                idat = b""
+        elif kind not in PNG_METADATA_CHUNKS:
+            output.append(_png_chunk(kind, body))
+    recompressed = b"".join(output)
+    return recompressed if len(recompressed) < len(data) else data
+
+
+def minify_svg(text: str) -> str:
+    """Remove the comments, metadata and indentation from an SVG image.
+
+    Whitespace between elements is kept in images with text, where it may be
+    rendered.
+    """
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.DOTALL)
+    text = re.sub(r"<metadata\b.*?</metadata>", "", text, flags=re.DOTALL)
+    if not re.search(r"<(text|tspan)\b", text):
+        text = re.sub(r">\s+<", "><", text)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def optimize_image(path: Path) -> bytes:
+    """Return the optimised contents of the PNG or SVG image at ``path``."""
+    data = path.read_bytes()
+    suffix = path.suffix.lower()
+    if suffix == ".png":
+        return recompress_png(data)
+    if suffix == ".svg":
+        minified = minify_svg(data.decode("utf-8")).encode("utf-8")
+        return minified if len(minified) < len(data) else data
+    return data
+
+
+def convert_to_webp(data: bytes, suffix: str) -> bytes:
+    """Convert a PNG (losslessly) or JPEG image to WebP."""
+    from PIL import Image
+
+    output = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as image:
+        if suffix == ".png":
+            image.save(output, "WEBP", lossless=True, method=6)
+        else:
+            image.save(output, "WEBP", quality=85, method=6)
+    return output.getvalue()
+
+
+def downscale_png(data: bytes, width: int) -> bytes:
+    """Resize a PNG image to ``width`` pixels, if it is wider."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width <= width:
+            return data
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        resized.save(output, "PNG", optimize=True)
+    return recompress_png(output.getvalue())
+
+
+class ImageCache:
+    """Optimised images, stored under the hash of their contents.
+
+    The index maps the hash of every image seen to the hash of its optimised
+    version, so optimised images are recognised as such.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.index_path = directory / "index.json"
+        index = load_json(self.index_path)
+        self.index: dict[str, str] = index if isinstance(index, dict) else {}
+        self.changed = False
+
+    def _store(self, name: str, data: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / name
+        tmp = path.with_name(f".{name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    def optimize(self, path: Path) -> str:
+        """Replace the image at ``path`` with its optimised version.
+
+        :returns: The hash of the optimised image.
+        """
+        digest = file_digest(path)
+        optimized = self.index.get(digest)
+        if optimized is None or not self._has(optimized, digest, path.suffix):
+            data = optimize_image(path)
+            optimized = hashlib.sha256(data).hexdigest()
+            if optimized != digest:
+                self._store(f"{optimized}{path.suffix}", data)
+            self.index[digest] = self.index[optimized] = optimized
+            self.changed = True
+        if optimized != digest:
+            place_file(self.directory / f"{optimized}{path.suffix}", path)
+        return optimized
+
+    def _has(self, optimized: str, digest: str, suffix: str) -> bool:
+        """Check whether the optimised version of an image is available."""
+        return optimized == digest or (self.directory / f"{optimized}{suffix}").exists()
+
+    def webp(self, path: Path, digest: str) -> bool:
+        """Write a WebP version of the image at ``path`` next to it.
+
+        No WebP image is written if it would be larger than the original.
+
+        :returns: Whether the WebP image was written.
+        """
+        cached = self.directory / f"{digest}.webp"
+        skipped = f"webp:{digest}"
+        if skipped in self.index:
+            return False
+        if not cached.exists():
+            data = path.read_bytes()
+            webp = convert_to_webp(data, path.suffix.lower())
+            if len(webp) >= len(data):
+                self.index[skipped] = ""
+                self.changed = True
+                return False
+            self._store(cached.name, webp)
+        dst = path.with_name(path.name + ".webp")
+        if not is_up_to_date(cached, dst):
+            place_file(cached, dst)
+        return True
+
+    def save(self) -> None:
+        """Write the index, if it changed."""
+        if self.changed:
+            save_json(self.index_path, self.index)
+            self.changed = False
+
+
+def add_picture_elements(page: Path) -> bool:
+    """Wrap the page's images that have WebP versions in <picture> elements.
+
+    :returns: Whether the page was changed.
+    """
+    text = page.read_text(encoding="utf-8")
+
+    def replace(match: re.Match[str]) -> str:
+        src = match.group(1)
+        if (
+            "://" in src
+            or src.startswith(("data:", "/"))
+            or Path(src).suffix.lower() not in WEBP_SOURCES
+            or _SOURCE_BEFORE.search(text, max(0, match.start() - 500), match.start())
+        ):
+            return match.group()
+        image = page.parent / unquote(src.partition("?")[0])
+        if not image.with_name(image.name + ".webp").is_file():
+            return match.group()
+        webp = src.partition("?")[0] + ".webp"
+        return (
+            f'<picture><source srcset="{webp}" type="image/webp">'
+            f"{match.group()}</picture>"
+        )
+
+    new_text = _IMG_TAG.sub(replace, text)
+    if new_text == text:
+        return False
+    page.write_text(new_text, encoding="utf-8")
+    return True
+
+
+def optimize_html_images(app: Sphinx, exception: Exception | None) -> None:
+    """Optimise the images in an HTML build, and add WebP variants if enabled."""
+    if exception or not app.config.optimize_images or app.builder.format != "html":
+        return
+
+    outdir = Path(app.outdir)
+    cache_dir = get_cache_dir(app) / "images"
+    cache = ImageCache(cache_dir)
+    webp = app.config.webp_images and not app.config.epub_build
+    webp = webp and pillow_available()
+    suffixes = {".png", ".svg"} | (WEBP_SOURCES if webp else set())
+
+    optimized = 0
+    for name in IMAGE_DIRS:
+        for path in sorted((outdir / name).rglob("*")):
+            suffix = path.suffix.lower()
+            if suffix not in suffixes or not path.is_file():
+                continue
+            digest = cache.optimize(path)
+            optimized += 1
+            if webp and suffix in WEBP_SOURCES:
+                try:
+                    cache.webp(path, digest)
+                except Exception as exc:  # noqa: BLE001 (skip unreadable images)
+                    logger.warning("Could not convert %s to WebP: %s", path, exc)
+    cache.save()
+
+    if webp:
+        # Only the pages written since the previous run need <picture> elements.
+        stamp = cache_dir / f"pages-{fingerprint(str(outdir))[:16]}.stamp"
+        since = stamp.stat().st_mtime_ns if stamp.exists() else 0
+        for page in outdir.rglob("*.html"):
+            if page.stat().st_mtime_ns > since:
+                add_picture_elements(page)
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.touch()
+
+    logger.info("canonical-sphinx: optimised %d images", optimized)
+
+
+def place_pdf_logo(app: Sphinx) -> None:
+    """Copy the PDF logo into the LaTeX output, at the resolution it is printed."""
+    src = pdf_dir / PDF_LOGO
+    dst = Path(app.outdir) / PDF_LOGO
+    width = round(PDF_LOGO_WIDTH_CM / 2.54 * PDF_IMAGE_DPI)
+    resize = pillow_available()
+
+    cache_dir = get_cache_dir(app) / "images"
+    key = fingerprint(file_digest(src), width if resize else None)
+    cached = cache_dir / f"logo-{key[:16]}.png"
+    if not cached.exists():
+        data = src.read_bytes()
+        data = downscale_png(data, width) if resize else recompress_png(data)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f".{cached.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(cached)
+    if not is_up_to_date(cached, dst):
+        place_file(cached, dst)
@@ -0,0 +1,331 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""The Canonical LaTeX elements used for PDF builds.
+
+The preamble is kept as structured data (packages, colours, environments and
+other named fragments) so that projects can override individual parts of it
+through their "conf.py" instead of copying the whole preamble.
+"""
+import functools
+from collections.abc import Mapping, Sequence
+
+from sphinx.builders.latex.constants import XELATEX_DEFAULT_FONTPKG
+
+Color = str | Sequence[int]
+
+PACKAGES = [
+    r"\usepackage[most]{tcolorbox}",
+    r"\tcbuselibrary{breakable}",
+    r"\usepackage{lastpage}",
+    r"\usepackage{tabto}",
+    r"\usepackage{ifthen}",
+    r"\usepackage{etoolbox}",
+    r"\usepackage{fancyhdr}",
+    r"\usepackage{graphicx}",
+    r"\usepackage{titlesec}",
+    r"\usepackage{titling}",
+    r"\usepackage{fontspec}",
+    r"\usepackage{tikz}",
+    r"\usepackage{changepage}",
+    r"\usepackage{array}",
+    r"\usepackage{tabularx}",
+    r"\usepackage{tcolorbox}",
+    r"\usepackage{xcolor}",
+    r"\usepackage{longtable}",
+]
+
+COLORS: dict[str, Color] = {
+    "yellowgreen": (154, 205, 50),
+    "title": (76, 17, 48),
+    "subtitle": (116, 27, 71),
+    "label": (119, 41, 100),
+    "copyright": (174, 167, 159),
+    "class-red": (139, 0, 0),
+    "code-io": (238, 238, 238),
+    "red-io": (192, 0, 0),
+    "orange-io": (196, 89, 17),
+    "blue-io": (47, 84, 150),
+}
+
+
+def _admonition(name: str, color: str) -> str:
+    return rf"""\renewenvironment{{{name}}}[1]
+  {{\begin{{tcolorbox}}[colframe={color},
+                     colbacktitle={color},
+                     colback=white,
+                     colupper=black,
+                     boxsep=1mm,
+                     left=1mm,
+                     right=1mm,
+                     toptitle=1.5mm,
+                     bottomtitle=1.5mm,
+                     sharp corners,
+                     title=\sphinxstrong{{#1}}]}}
+  {{\end{{tcolorbox}}}}"""
+
+
+ENVIRONMENTS = {
+    "quote": r"""\renewenvironment{quote}
+  {\begin{tcolorbox}[colback=code-io,
+                    colframe=code-io,
+                    colupper=black,
+                    boxsep=1mm,
+                    left=1mm,
+                    right=1mm,
+                    sharp corners,
+                    parbox=false]}
+  {\end{tcolorbox}}""",
+    "sphinxnote": _admonition("sphinxnote", "blue-io"),
+    "sphinxhint": _admonition("sphinxhint", "blue-io"),
+    "sphinximportant": _admonition("sphinximportant", "blue-io"),
+    "sphinxtip": _admonition("sphinxtip", "blue-io"),
+    "sphinxwarning": _admonition("sphinxwarning", "orange-io"),
+    "sphinxattention": _admonition("sphinxattention", "orange-io"),
+    "sphinxcaution": _admonition("sphinxcaution", "orange-io"),
+    "sphinxerror": _admonition("sphinxerror", "red-io"),
+}
+
+# The preamble, in order. The "packages", "colors" and "environments"
+# fragments are rendered from the data above.
+PREAMBLE_FRAGMENTS = {
+    "fonts": r"""\setmainfont[UprightFont = *-R, BoldFont = *-B, ItalicFont=*-RI, Extension = .ttf]{Ubuntu}
+\setmonofont[UprightFont = *-R, BoldFont = *-B, ItalicFont=*-RI, Extension = .ttf]{UbuntuMono}""",
+    "packages": "",
+    "colors": "",
+    "tables": r"\renewcommand{\arraystretch}{1.5}",
+    "boxes": r"\tcbset{enhanced jigsaw, colback=black, colupper=white}",
+    "environments": "",
+    "tcolorbox-fix": r"""\makeatletter
+\def\tcb@finalize@environment{%
+  \color{.}% hack for xelatex
+  \tcb@layer@dec%
+}
+\makeatother""",
+    "terminal": r"""\newenvironment{sphinxclassprompt}{\color{yellowgreen}\setmonofont[Color = 9ACD32, UprightFont = *-R, Extension = .ttf]{UbuntuMono}}{}
+\newtcolorbox{termbox}{use color stack, breakable, colupper=white, halign=flush left}
+\newenvironment{sphinxclassterminal}{\setmonofont[Color = white, UprightFont = *-R, Extension = .ttf]{UbuntuMono}\sphinxsetup{VerbatimColor={black}}\begin{termbox}}{\end{termbox}}""",
+    "page-styles": r"""\newcommand{\dimtorightedge}{%
+  \dimexpr\paperwidth-1in-\hoffset-\oddsidemargin\relax}
+\newcommand{\dimtotop}{%
+  \dimexpr\height-1in-\voffset-\topmargin-\headheight-\headsep\relax}
+\newtoggle{tpage}
+\AtBeginEnvironment{titlepage}{\global\toggletrue{tpage}}
+\fancypagestyle{plain}{
+    \fancyhf{}
+    \fancyfoot[R]{\thepage\ of \pageref*{LastPage}}
+    \renewcommand{\headrulewidth}{0pt}
+    \renewcommand{\footrulewidth}{0pt}
+}
+\fancypagestyle{normal}{
+    \fancyhf{}
+    \fancyfoot[R]{\thepage\ of \pageref*{LastPage}}
+    \renewcommand{\headrulewidth}{0pt}
+    \renewcommand{\footrulewidth}{0pt}
+}
+\fancypagestyle{titlepage}{%
+    \fancyhf{}
+    \fancyfoot[L]{\footnotesize \textcolor{copyright}{© \the\year{} Canonical Ltd. All rights reserved.}}
+}
+\newcommand\sphinxbackoftitlepage{\thispagestyle{titlepage}}""",
+    "headings": r"""\titleformat{\chapter}[block]{\Huge \color{title} \bfseries\filright}{\thechapter .}{1.5ex}{}
+\titlespacing{\chapter}{0pt}{0pt}{0pt}
+\titleformat{\section}[block]{\huge \bfseries\filright}{\thesection .}{1.5ex}{}
+\titlespacing{\section}{0pt}{0pt}{0pt}
+\titleformat{\subsection}[block]{\Large \bfseries\filright}{\thesubsection .}{1.5ex}{}
+\titlespacing{\subsection}{0pt}{0pt}{0pt}
+\setcounter{tocdepth}{1}
+\renewcommand\pagenumbering[1]{}""",
+}
+
+# Ends the part of the preamble that precompiled formats contain (see
+# canonical_sphinx.latexformat). Without a format, it does nothing.
+END_OF_DUMP = r"\csname endofdump\endcsname"
+
+MAKETITLE = r"""
+\begin{titlepage}
+\begin{flushleft}
+    \begin{tikzpicture}[remember picture,overlay]
+    \node[anchor=south east, inner sep=0] at (current page.south east) {
+    \includegraphics[width=\paperwidth, height=\paperheight]{front-page-light}
+    };
+    \end{tikzpicture}
+\end{flushleft}
+
+\vspace*{3cm}
+
+\begin{adjustwidth}{8cm}{0pt}
+\begin{flushleft}
+    \huge \textcolor{black}{\textbf{}{\raggedright{\thetitle}}}
+\end{flushleft}
+\end{adjustwidth}
+
+\vfill
+
+\begin{adjustwidth}{8cm}{0pt}
+\begin{tabularx}{0.5\textwidth}{ l l }
+    \textcolor{lightgray}{© \the\year{} Canonical Ltd.}  & \hspace{3cm} \\
+    \textcolor{lightgray}{All rights reserved.}   & \hspace{3cm} \\
+                                                  & \hspace{3cm} \\
+                                                  & \hspace{3cm} \\
+
+\end{tabularx}
+\end{adjustwidth}
+
+\end{titlepage}
+\RemoveFromHook{shipout/background}
+\AddToHook{shipout/background}{
+      \begin{tikzpicture}[remember picture,overlay]
+      \node[anchor=south west, align=left, inner sep=0] at (current page.south west) {
+        \includegraphics[width=\paperwidth]{normal-page-footer}
+      };
+      \end{tikzpicture}
+      \begin{tikzpicture}[remember picture,overlay]
+      \node[anchor=north east, opacity=0.5, inner sep=35] at (current page.north east) {
+        \includegraphics[width=4cm]{Canonical-logo-4x}
+      };
+      \end{tikzpicture}
+    }
+
+% Define new commands for breakable characters
+\let\origus\_
+\newcommand\allowbreaksafterunderscoreinliterals {%
+  \def\_{\discretionary{\origus}{}{\origus}}% breaks after underscore_ in literals
+}%
+
+\let\orighyphenwithbraces\sphinxhyphen{}
+\newcommand\allowbreaksaftersphinxhypheninliterals {%
+  \def\sphinxhyphen{\discretionary{-}{}{-}}% breaks after \sphinxhyphen - in literals
+}%
+
+% Add to Sphinx literal environment
+\makeatletter
+\g@addto@macro\sphinx@literal@nolig@list{%
+  \allowbreaksafterunderscoreinliterals
+  \allowbreaksaftersphinxhypheninliterals
+}%
+\makeatother
+
+"""
+
+LATEX_ELEMENTS = {
+    "papersize": "a4paper",
+    "pointsize": "11pt",
+    "fncychap": "",
+    "sphinxsetup": r"verbatimwithframe=false, pre_border-radius=0pt, verbatimvisiblespace=\phantom{}, verbatimcontinued=\phantom{}",
+    "extraclassoptions": "openany,oneside",
+    "maketitle": MAKETITLE,
+}
+
+
+def render_color(name: str, color: Color) -> str:
+    r"""Return the ``\definecolor`` command for a colour.
+
+    Colours are either RGB triplets, such as ``(76, 17, 48)``, or HTML
+    notation strings, such as ``"#4C1130"``.
+    """
+    if isinstance(color, str):
+        return rf"\definecolor{{{name}}}{{HTML}}{{{color.lstrip('#').upper()}}}"
+    red, green, blue = color
+    return rf"\definecolor{{{name}}}{{RGB}}{{{red}, {green}, {blue}}}"
+
+
+def build_preamble(
+    colors: Mapping[str, Color] | None = None,
+    environments: Mapping[str, str] | None = None,
+    fragments: Mapping[str, str] | None = None,
+    *,
+    precompiled: bool = False,
+) -> str:
+    """Render the preamble, with some parts merged over the Canonical defaults.
+
+    :param colors: Colours to add or redefine.
+    :param environments: LaTeX environment definitions to add or replace, keyed
+        by environment name. An empty definition removes the default one.
+    :param fragments: Preamble fragments to add or replace, keyed by fragment
+        name. An empty fragment removes the default one.
+    :param precompiled: Load the packages first, followed by
+        :data:`END_OF_DUMP`, so that they can be precompiled into a format.
+    """
+    all_colors = {**COLORS, **(colors or {})}
+    all_environments = {**ENVIRONMENTS, **(environments or {})}
+    all_fragments = {
+        **PREAMBLE_FRAGMENTS,
+        "packages": "\n".join(PACKAGES),
+        "colors": "\n".join(
+            render_color(name, color) for name, color in all_colors.items()
+        ),
+        "environments": "\n\n".join(
+            definition for definition in all_environments.values() if definition
+        ),
+        **(fragments or {}),
+    }
+    if precompiled:
+        all_fragments = {
+            "packages": all_fragments.pop("packages"),
+            "end-of-dump": END_OF_DUMP,
+            **all_fragments,
+        }
+    preamble = "\n\n".join(
+        fragment.strip("\n") for fragment in all_fragments.values() if fragment
+    )
+    return f"\n{preamble}\n"
+
+
+@functools.cache
+def _default_latex_elements(*, precompiled: bool) -> tuple[tuple[str, str], ...]:
+    preamble = build_preamble(precompiled=precompiled)
+    return tuple({**LATEX_ELEMENTS, "preamble": preamble}.items())
+
+
+def build_latex_elements(
+    colors: Mapping[str, Color] | None = None,
+    environments: Mapping[str, str] | None = None,
+    fragments: Mapping[str, str] | None = None,
+    overrides: Mapping[str, str] | None = None,
+    *,
+    precompiled: bool = False,
+) -> dict[str, str]:
+    """Return the "latex_elements" for a build.
+
+    Without any customisation, the elements are only rendered once per
+    process. ``overrides`` replaces individual elements, such as "papersize";
+    the other parameters are passed to :func:`build_preamble`.
+
+    With ``precompiled`` set, the fonts are set up after the part of the
+    preamble that formats contain, since XeTeX can't dump fonts.
+    """
+    if colors or environments or fragments:
+        elements = {
+            **LATEX_ELEMENTS,
+            "preamble": build_preamble(
+                colors,
+                environments,
+                fragments,
+                precompiled=precompiled,
+            ),
+        }
+    else:
+        elements = dict(_default_latex_elements(precompiled=precompiled))
+    elements.update(overrides or {})
+    if precompiled and END_OF_DUMP in elements["preamble"]:
+        fontpkg = elements.get("fontpkg", XELATEX_DEFAULT_FONTPKG)
+        elements["fontpkg"] = ""
+        elements["preamble"] = elements["preamble"].replace(
+            END_OF_DUMP,
+            f"{END_OF_DUMP}\n{fontpkg}",
+            1,
+        )
+    return elements
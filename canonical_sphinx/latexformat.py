@@ -0,0 +1,163 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""LaTeX formats that contain the packages of the preamble.
+
+Each xelatex run loads tikz, tcolorbox and the other packages of the preamble
+again. With "latex_precompiled_preamble" enabled, the part of the preamble up
+to :data:`~canonical_sphinx.latex.END_OF_DUMP` is dumped into a format file
+with the "mylatexformat" package, once per preamble and TeX version. The
+documents are then compiled with the format, which their first line names.
+"""
+import functools
+import subprocess
+from pathlib import Path
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from canonical_sphinx.assets import is_up_to_date, place_file
+from canonical_sphinx.cache import file_digest, fingerprint, get_cache_dir
+from canonical_sphinx.latex import END_OF_DUMP
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PREFIX = "canonical-preamble"
+
+
+class FormatError(Exception):
+    """A format couldn't be built."""
+
+
+@functools.cache
+def tex_version(engine: str) -> str | None:
+    """Return the version of a TeX engine and its distribution, if installed."""
+    try:
+        result = subprocess.run(
+            [engine, "--version"],  # (engine from PATH)
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.partition("\n")[0]
+
+
+def preamble_head(text: str) -> str | None:
+    """Return the part of a document that the format contains, if it has one."""
+    head, marker, _ = text.partition(END_OF_DUMP)
+    if not marker:
+        return None
+    # The first line names the format.
+    if head.startswith("%&"):
+        head = head.partition("\n")[2]
+    return head
+
+
+def format_key(head: str, directory: Path, version: str) -> str:
+    """Return the hash of what a format is built from.
+
+    Besides the start of the document, this includes the packages and classes
+    that Sphinx writes next to it.
+    """
+    inputs = {
+        path.name: file_digest(path)
+        for pattern in ("*.sty", "*.cls")
+        for path in sorted(directory.glob(pattern))
+    }
+    return fingerprint(head, inputs, version)
+
+
+def build_format(tex: Path, name: str, engine: str) -> Path:
+    """Dump the preamble of ``tex`` into the format ``name``, next to it."""
+    try:
+        subprocess.run(
+            [
+                engine,
+                "-ini",
+                "-interaction=batchmode",
+                "-halt-on-error",
+                f"-jobname={name}",
+                f"&{engine}",
+                "mylatexformat.ltx",
+                tex.name,
+            ],
+            cwd=tex.parent,
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise FormatError(f"{exc} (see {tex.parent / name}.log)") from exc
+    return tex.parent / f"{name}.fmt"
+
+
+def use_format(tex: Path, name: str) -> None:
+    """Make the first line of ``tex`` name the format to compile it with."""
+    text = tex.read_text(encoding="utf-8")
+    if text.startswith("%&"):
+        text = text.partition("\n")[2]
+    tex.write_text(f"%&{name}\n{text}", encoding="utf-8")
+
+
+def precompile_latex_preambles(app: Sphinx, exception: Exception | None) -> None:
+    """Compile the LaTeX documents with formats, if "latex_precompiled_preamble" is set."""
+    if (
+        exception
+        or app.builder.format != "latex"
+        or not app.config.latex_precompiled_preamble
+    ):
+        return
+
+    engine = app.config.latex_engine
+    version = tex_version(engine)
+    if version is None:
+        logger.warning("Could not precompile the LaTeX preamble: %s not found", engine)
+        return
+
+    outdir = Path(app.outdir)
+    cache_dir = get_cache_dir(app) / "latex-formats"
+    precompiled = 0
+    for document in app.config.latex_documents:
+        tex = outdir / document[1]
+        try:
+            head = preamble_head(tex.read_text(encoding="utf-8"))
+        except OSError:
+            continue
+        if head is None:
+            # "latex_elements" from "conf.py" don't mark the end of the format.
+            continue
+
+        name = f"{FORMAT_PREFIX}-{format_key(head, outdir, version)[:16]}"
+        cached = cache_dir / f"{name}.fmt"
+        if not cached.exists():
+            try:
+                built = build_format(tex, name, engine)
+            except FormatError as exc:
+                logger.warning("Could not precompile the LaTeX preamble: %s", exc)
+                continue
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            place_file(built, cached)
+
+        fmt = outdir / cached.name
+        if not is_up_to_date(cached, fmt):
+            place_file(cached, fmt, hardlink=app.config.hardlink_pdf_assets)
+        use_format(tex, name)
+        precompiled += 1
+
+    logger.info(
+        "canonical-sphinx: compiling %d LaTeX documents with precompiled preambles",
+        precompiled,
+    )
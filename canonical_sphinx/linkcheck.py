@@ -0,0 +1,313 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Link checks that are remembered between builds.
+
+With "linkcheck_cache" enabled, the results of the linkcheck builder are kept
+in the project's cache, and reused until they are older than the time to live
+of their status in "linkcheck_cache_ttl". Expired results are checked again
+with the ETag or Last-Modified date of the previous response, which servers
+answer without a body if the page hasn't changed.
+
+Builds of several versions of the same docs can share their results by
+setting "linkcheck_cache_dir" to the same directory. Each host is checked by
+at most "linkcheck_host_workers" workers at a time, which share their
+connections.
+"""
+import contextlib
+import functools
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from queue import Queue
+from typing import Any
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from sphinx.builders.linkcheck import (
+    CheckExternalLinksBuilder,
+    CheckRequest,
+    CheckResult,
+    Hyperlink,
+    HyperlinkAvailabilityChecker,
+    HyperlinkAvailabilityCheckWorker,
+    RateLimit,
+)
+from sphinx.config import Config
+from sphinx.util import logging, requests
+
+from canonical_sphinx.cache import get_cache_dir, load_json, locked, save_json
+
+logger = logging.getLogger(__name__)
+
+# Bump when the format of the results changes.
+STORE_VERSION = 1
+
+STORE_FILE = "linkcheck.json"
+
+# How long results are reused by default, in seconds, by status. Results with
+# other statuses, such as timeouts, are always checked again.
+DEFAULT_TTL = {"working": 24 * 3600, "redirected": 24 * 3600, "broken": 3600}
+
+# Statuses of the results that are checked again with a conditional request.
+REVALIDATED = frozenset(("working", "redirected"))
+
+
+class LinkStore:
+    """The results of link checks, by URI, stored in a JSON file."""
+
+    def __init__(self, path: Path, ttl: dict[str, float]) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._updated: dict[str, dict[str, Any]] = {}
+        data = load_json(path)
+        if isinstance(data, dict) and data.get("version") == STORE_VERSION:
+            self.links: dict[str, dict[str, Any]] = data["links"]
+        else:
+            self.links = {}
+
+    def get(self, uri: str) -> dict[str, Any] | None:
+        """Return the last result of a URI, fresh or not."""
+        with self._lock:
+            return self.links.get(uri)
+
+    def fresh(self, uri: str, now: float | None = None) -> dict[str, Any] | None:
+        """Return the last result of a URI, if it can be reused."""
+        entry = self.get(uri)
+        if entry is None:
+            return None
+        age = (time.time() if now is None else now) - entry["checked"]
+        if age >= self.ttl.get(entry["status"], 0):
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def record(self, uri: str, result: tuple[str, str, int], **validators: str) -> None:
+        """Remember the result of a check, if its status is cached."""
+        status, info, code = result
+        if str(status) not in self.ttl:
+            return
+        entry = {
+            "status": str(status),
+            "info": info,
+            "code": code,
+            "checked": time.time(),
+            **{name: value for name, value in validators.items() if value},
+        }
+        with self._lock:
+            self.links[uri] = entry
+            self._updated[uri] = entry
+
+    def save(self) -> None:
+        """Write the results, with those that other builds wrote meanwhile."""
+        with locked(self.path.parent):
+            data = load_json(self.path)
+            links = {}
+            if isinstance(data, dict) and data.get("version") == STORE_VERSION:
+                links = data["links"]
+            for uri, entry in self._updated.items():
+                if entry["checked"] > links.get(uri, {}).get("checked", 0):
+                    links[uri] = entry
+            save_json(self.path, {"version": STORE_VERSION, "links": links})
+
+
+class HostLimits:
+    """Semaphores that limit the concurrent requests to each host."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores: dict[str, threading.Semaphore] = {}
+
+    @contextlib.contextmanager
+    def hold(self, uri: str) -> Iterator[None]:
+        """Wait until a request can be made to the host of ``uri``."""
+        host = urlsplit(uri).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(
+                host,
+                threading.Semaphore(self.limit),
+            )
+        with semaphore:
+            yield
+
+
+class CachedCheckWorker(HyperlinkAvailabilityCheckWorker):
+    """A linkcheck worker that reuses and records the results in a store."""
+
+    def __init__(
+        self,
+        config: Config,
+        rqueue: Queue[CheckResult],
+        wqueue: Queue[CheckRequest],
+        rate_limits: dict[str, RateLimit],
+        store: LinkStore,
+        hosts: HostLimits,
+        session: requests._Session | None,
+    ) -> None:
+        """Share ``session`` with the other workers.
+
+        Without one, the worker's own session, as Sphinx sets it up, keeps
+        connections to each host for the workers that will share it.
+        """
+        super().__init__(config, rqueue, wqueue, rate_limits)
+        if session is None:
+            adapter = HTTPAdapter(pool_maxsize=hosts.limit)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        else:
+            self._session.close()
+            self._session = session
+        self.store = store
+        self.hosts = hosts
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests._Session:
+        """Return the session that the worker makes its requests with."""
+        return self._session
+
+    def _check_uri(self, uri: str, hyperlink: Hyperlink) -> tuple[Any, str, int]:
+        entry = self.store.fresh(uri)
+        if entry is not None:
+            return entry["status"], entry["info"], entry["code"]
+
+        previous = self.store.get(uri)
+        if previous is None or previous["status"] not in REVALIDATED:
+            previous = None
+        self._local.previous = previous
+        self._local.validators = {}
+        self._local.not_modified = False
+        with self.hosts.hold(uri):
+            result = super()._check_uri(uri, hyperlink)
+
+        if previous is not None and self._local.not_modified:
+            # The page hasn't changed, and neither has the result.
+            result = (previous["status"], previous["info"], previous["code"])
+            self.store.record(
+                uri,
+                result,
+                etag=previous.get("etag", ""),
+                last_modified=previous.get("last_modified", ""),
+            )
+        else:
+            self.store.record(uri, result, **self._local.validators)
+        return result
+
+    def _retrieval_methods(
+        self,
+        check_anchors: bool,  # noqa: FBT001 (Sphinx's signature)
+        anchor: str,
+    ) -> Iterator[tuple[Callable[..., Any], dict[str, bool]]]:
+        for method, kwargs in super()._retrieval_methods(check_anchors, anchor):
+            yield functools.partial(self._request, method), kwargs
+
+    def _request(
+        self,
+        method: Callable[..., Any],
+        *,
+        headers: dict[str, str],
+        **kwargs: Any,
+    ) -> Any:  # noqa: ANN401
+        """Make a request, conditional on the previous response."""
+        headers = dict(headers)
+        previous = self._local.previous
+        if previous is not None:
+            if "etag" in previous:
+                headers["If-None-Match"] = previous["etag"]
+            if "last_modified" in previous:
+                headers["If-Modified-Since"] = previous["last_modified"]
+        response = method(headers=headers, **kwargs)
+        if response.status_code == 304:  # noqa: PLR2004 (Not Modified)
+            self._local.not_modified = True
+        else:
+            self._local.validators = {
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+        return response
+
+
+class CachedLinkChecker(HyperlinkAvailabilityChecker):
+    """A link checker whose workers share a store, and limits per host."""
+
+    def __init__(self, config: Config, store: LinkStore) -> None:
+        super().__init__(config)
+        self.store = store
+        self.hosts = HostLimits(config.linkcheck_host_workers)
+
+    def invoke_threads(self) -> None:
+        """Start the workers, with the shared store and connections."""
+        session = None
+        for _ in range(self.num_workers):
+            thread = CachedCheckWorker(
+                self.config,
+                self.rqueue,
+                self.wqueue,
+                self.rate_limits,
+                self.store,
+                self.hosts,
+                session,
+            )
+            session = thread.session
+            thread.start()
+            self.workers.append(thread)
+
+
+class CachedLinkcheckBuilder(CheckExternalLinksBuilder):
+    """The linkcheck builder, reusing the results of previous builds."""
+
+    def finish(self) -> None:
+        """Check the links, reusing the results that haven't expired."""
+        if not self.config.linkcheck_cache:
+            super().finish()
+            return
+
+        app = self.app
+        directory = self.config.linkcheck_cache_dir
+        cache_dir = Path(app.confdir, directory) if directory else get_cache_dir(app)
+        # Values set with "-D linkcheck_cache_ttl.<status>=..." are strings.
+        ttl = {
+            status: float(seconds)
+            for status, seconds in {
+                **DEFAULT_TTL,
+                **self.config.linkcheck_cache_ttl,
+            }.items()
+        }
+        store = LinkStore(cache_dir / STORE_FILE, ttl)
+        checker = CachedLinkChecker(self.config, store)
+        logger.info("")
+
+        output_text = self.outdir / "output.txt"
+        output_json = self.outdir / "output.json"
+        with (
+            output_text.open("w", encoding="utf-8") as self.txt_outfile,
+            output_json.open("w", encoding="utf-8") as self.json_outfile,
+        ):
+            for result in checker.check(self.hyperlinks):
+                self.process_result(result)
+        store.save()
+        logger.info(
+            "canonical-sphinx: reused %d of %d link check results",
+            store.hits,
+            len(self.hyperlinks),
+        )
+
+        if self.broken_hyperlinks or self.timed_out_hyperlinks:
+            app.statuscode = 1
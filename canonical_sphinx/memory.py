@@ -0,0 +1,339 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Memory use of the phases of a build, and of the extensions that run in it.
+
+With "memory_profile" set, allocations are traced with tracemalloc, and a
+snapshot is taken when the builder is set up, after reading, after writing,
+and once the other extensions have finished the build. Each snapshot records
+the peak RSS of the build, and the live allocations of each extension module.
+The report also lists the largest parts of the pickled environment and the
+largest pickled doctrees, and is written as JSON to compare builds over time.
+"""
+import functools
+import json
+import os
+import pickle
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+import sphinx
+from sphinx.application import Sphinx
+from sphinx.config import Config
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+
+# Allocations that no extension module made.
+OTHER = "(other)"
+
+_MIB = 1024 * 1024
+
+
+def peak_rss() -> dict[str, int]:
+    """Return the peak resident set size of the build and its workers, in bytes."""
+    # Linux reports kibibytes, macOS bytes.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def extension_paths(app: Sphinx) -> list[tuple[str, str]]:
+    """Return the source paths of the loaded extensions, and their names.
+
+    Packages are represented by their directory, with a trailing separator,
+    and the longest paths come first so that an extension in a subpackage
+    isn't attributed to its parent.
+    """
+    paths: list[tuple[str, str]] = []
+    for name, extension in app.extensions.items():
+        module = extension.module
+        if hasattr(module, "__path__"):
+            paths.extend(
+                (str(Path(directory).resolve()) + os.sep, name)
+                for directory in module.__path__
+            )
+        elif getattr(module, "__file__", None):
+            paths.append((str(Path(module.__file__).resolve()), name))
+    return sorted(paths, key=lambda path: len(path[0]), reverse=True)
+
+
+def group(snapshot: tracemalloc.Snapshot) -> list[tracemalloc.Statistic]:
+    """Return the live allocations of ``snapshot``, by traceback.
+
+    The profiler's own allocations, and tracemalloc's, are left out.
+    """
+    ignored = {__file__, tracemalloc.__file__}
+    return [
+        stat
+        for stat in snapshot.statistics("traceback")
+        if stat.traceback[-1].filename not in ignored
+    ]
+
+
+def attribute(
+    stats: list[tracemalloc.Statistic],
+    paths: list[tuple[str, str]],
+) -> dict[str, dict[str, int]]:
+    """Return the size and number of the allocations of each extension.
+
+    An allocation belongs to the extension of the most recent frame of its
+    traceback that is in an extension module.
+    """
+    owners: dict[str, str | None] = {}
+
+    def owner(filename: str) -> str | None:
+        if filename not in owners:
+            real = os.path.realpath(filename)
+            owners[filename] = next(
+                (
+                    name
+                    for path, name in paths
+                    if real == path or (path.endswith(os.sep) and real.startswith(path))
+                ),
+                None,
+            )
+        return owners[filename]
+
+    totals: dict[str, dict[str, int]] = {}
+    for stat in stats:
+        name = next(
+            (
+                found
+                for frame in reversed(stat.traceback)
+                if (found := owner(frame.filename))
+            ),
+            OTHER,
+        )
+        total = totals.setdefault(name, {"size": 0, "count": 0})
+        total["size"] += stat.size
+        total["count"] += stat.count
+    return dict(sorted(totals.items(), key=lambda item: item[1]["size"], reverse=True))
+
+
+def largest_lines(stats: list[tracemalloc.Statistic], top: int) -> list[dict[str, Any]]:
+    """Return the source lines with the most live allocations."""
+    totals: dict[str, dict[str, Any]] = {}
+    for stat in stats:
+        frame = stat.traceback[-1]
+        line = f"{frame.filename}:{frame.lineno}"
+        total = totals.setdefault(line, {"line": line, "size": 0, "count": 0})
+        total["size"] += stat.size
+        total["count"] += stat.count
+    return sorted(totals.values(), key=lambda total: total["size"], reverse=True)[:top]
+
+
+def environment_sizes(env: BuildEnvironment) -> dict[str, int]:
+    """Return the pickled size of each attribute of the environment.
+
+    The data of each domain is listed separately, as "domaindata.<name>".
+    """
+    state = env.__getstate__()
+    parts = {
+        f"domaindata.{name}": data for name, data in state.pop("domaindata").items()
+    }
+    parts.update(state)
+    sizes: dict[str, int] = {}
+    for name, value in parts.items():
+        try:
+            sizes[name] = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:  # noqa: BLE001, PERF203 (extensions can store anything)
+            logger.debug("canonical-sphinx: can't pickle env.%s", name)
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def doctree_sizes(doctreedir: Path, top: int) -> dict[str, Any]:
+    """Return the number and total size of the pickled doctrees, and the largest."""
+    sizes = {
+        path.relative_to(doctreedir).with_suffix("").as_posix(): path.stat().st_size
+        for path in doctreedir.rglob("*.doctree")
+    }
+    largest = sorted(sizes.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "count": len(sizes),
+        "size": sum(sizes.values()),
+        "largest": [{"docname": name, "size": size} for name, size in largest],
+    }
+
+
+class MemoryProfiler:
+    """Takes the snapshots of a build's memory use.
+
+    The snapshots are only analysed once tracing stops, at the end of the
+    build, as tracing slows the analysis down several times. Until then, they
+    are kept on disk rather than in the memory that they measure.
+    """
+
+    def __init__(self, top: int, frames: int) -> None:
+        self.top = top
+        self.start = time.perf_counter()
+        self.phases: list[dict[str, Any]] = []
+        self._directory = tempfile.TemporaryDirectory(prefix="canonical-sphinx-")
+        self.snapshots: list[Path] = []
+        # The pickled sizes of the environment's attributes, after reading.
+        self.environment: dict[str, int] = {}
+        # Whether tracing was started here, rather than with PYTHONTRACEMALLOC.
+        # The frames of each allocation are searched for the extension that
+        # made it.
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start(frames)
+
+    def snapshot(self, phase: str) -> None:
+        """Record the memory use at the end of ``phase``."""
+        if not tracemalloc.is_tracing():
+            return
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        # Before the snapshot, which is a copy of all the traces.
+        rss = peak_rss()
+        path = Path(self._directory.name, f"{len(self.snapshots)}.snapshot")
+        tracemalloc.take_snapshot().dump(str(path))
+        self.snapshots.append(path)
+        tracemalloc.reset_peak()
+        self.phases.append(
+            {
+                "phase": phase,
+                "time": round(time.perf_counter() - self.start, 3),
+                "traced": traced,
+                "traced_peak": traced_peak,
+                "rss_peak": rss,
+            },
+        )
+
+    def stop(self, app: Sphinx) -> list[dict[str, Any]]:
+        """Stop tracing, and return the phases with their allocations."""
+        if self.started:
+            tracemalloc.stop()
+        paths = extension_paths(app)
+        for phase, path in zip(self.phases, self.snapshots, strict=True):
+            stats = group(tracemalloc.Snapshot.load(str(path)))
+            phase["extensions"] = attribute(stats, paths)
+            phase["lines"] = largest_lines(stats, self.top)
+        self.snapshots.clear()
+        self._directory.cleanup()
+        return self.phases
+
+
+def snapshot_read(
+    app: Sphinx,  # noqa: ARG001 (event handler signature)
+    env: BuildEnvironment,
+    profiler: MemoryProfiler,
+) -> None:
+    """Take the snapshot of the documents that were read."""
+    profiler.snapshot("read")
+    profiler.environment = environment_sizes(env)
+
+
+def snapshot_builder(
+    app: Sphinx,  # noqa: ARG001 (event handler signature)
+    profiler: MemoryProfiler,
+) -> None:
+    """Take the snapshot of the set-up builder."""
+    profiler.snapshot("builder-inited")
+
+
+def snapshot_written(
+    app: Sphinx,  # noqa: ARG001 (event handler signature)
+    exception: Exception | None,  # noqa: ARG001
+    profiler: MemoryProfiler,
+) -> None:
+    """Take the snapshot of the build's output, before other extensions finish it."""
+    profiler.snapshot("written")
+
+
+def write_memory_profile(
+    app: Sphinx,
+    exception: Exception | None,  # noqa: ARG001 (failed builds are profiled too)
+    profiler: MemoryProfiler,
+) -> None:
+    """Write the JSON report and log the memory use of each phase."""
+    profiler.snapshot("build-finished")
+    phases = profiler.stop(app)
+
+    top = profiler.top
+    environment = profiler.environment or environment_sizes(app.env)
+    report = {
+        "version": REPORT_VERSION,
+        "sphinx": sphinx.__version__,
+        "builder": app.builder.name,
+        "parallel": app.parallel,
+        "documents": len(app.env.found_docs),
+        "phases": phases,
+        "environment": [
+            {"name": name, "size": size} for name, size in environment.items()
+        ][:top],
+        "doctrees": doctree_sizes(Path(app.doctreedir), top),
+    }
+
+    path = Path(app.confdir, app.config.memory_profile)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(report, indent=2) + "\n")
+    tmp.replace(path)
+
+    logger.info("canonical-sphinx: memory use of each phase:")
+    logger.info("%-16s %12s %12s %12s", "phase", "traced", "traced peak", "RSS peak")
+    for phase in phases:
+        logger.info(
+            "%-16s %10.1fMB %10.1fMB %10.1fMB",
+            phase["phase"],
+            phase["traced"] / _MIB,
+            phase["traced_peak"] / _MIB,
+            max(phase["rss_peak"].values()) / _MIB,
+        )
+    if phases:
+        logger.info("canonical-sphinx: largest extensions at the end of the build:")
+        extensions = list(phases[-1]["extensions"].items())[:top]
+        for name, total in extensions:
+            logger.info("%10.1fMB  %s", total["size"] / _MIB, name)
+    logger.info("canonical-sphinx: wrote the memory profile to %s", path)
+
+
+def setup_memory_profile(app: Sphinx, config: Config) -> None:
+    """Start tracing allocations, if "memory_profile" is set."""
+    if not config.memory_profile:
+        return
+
+    profiler = MemoryProfiler(config.build_profile_top, config.memory_profile_frames)
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "builder-inited",
+        functools.partial(snapshot_builder, profiler=profiler),
+        priority=900,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "env-updated",
+        functools.partial(snapshot_read, profiler=profiler),
+        priority=900,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        functools.partial(snapshot_written, profiler=profiler),
+        priority=0,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        functools.partial(write_memory_profile, profiler=profiler),
+        priority=1000,
+    )
@@ -0,0 +1,212 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""A navigation tree that is shared by all pages, instead of copied into each.
+
+With "external_navigation" enabled, the sidebar's navigation tree is written
+once, to a file named after a hash of its contents. Pages only contain the
+path from the root to themselves, and the full tree is loaded by the
+browser, which caches it for all pages.
+"""
+import functools
+import hashlib
+import html
+import os
+import re
+from pathlib import Path
+from typing import Any
+from urllib.parse import urljoin
+
+from furo.navigation import get_navigation_tree
+from sphinx.application import Sphinx
+from sphinx.builders.html import StandaloneHTMLBuilder
+from sphinx.environment.adapters.toctree import TocTree
+from sphinx.locale import _
+
+# The links in the tree are relative to this directory of the output.
+NAVIGATION_DIR = "_static"
+
+_HREF = re.compile(r'href="([^"]*)"')
+_BASE = "https://base.invalid/"
+
+NAVIGATION_PAGE = """\
+<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<div class="sidebar-tree">
+{tree}
+</div>
+</body>
+</html>
+"""
+
+
+def relocate_links(tree: str, base_uri: str, directory: str) -> str:
+    """Make the relative links of ``tree`` relative to ``directory``.
+
+    :param base_uri: The URI, relative to the root of the output, that the
+        links are relative to.
+    """
+    up = "../" * len([part for part in directory.split("/") if part])
+
+    def relocate(match: re.Match[str]) -> str:
+        href = html.unescape(match.group(1))
+        if re.match(r"^[a-z][a-z0-9+.-]*:|^[/#]", href, re.IGNORECASE):
+            return match.group()
+        target = urljoin(_BASE + base_uri, href).removeprefix(_BASE)
+        return f'href="{html.escape(up + target)}"'
+
+    return _HREF.sub(relocate, tree)
+
+
+class NavigationTree:
+    """The navigation tree of an HTML build, written once for all pages."""
+
+    def __init__(self, app: Sphinx) -> None:
+        self.app = app
+        self._name: str | None = None
+
+    @property
+    def name(self) -> str:
+        """Return the output path of the tree, writing it the first time."""
+        if self._name is None:
+            self._name = self._write()
+        return self._name
+
+    def render(self) -> str:
+        """Render the tree as Furo does, without a current page."""
+        builder = self.app.builder
+        if not isinstance(builder, StandaloneHTMLBuilder):
+            return ""
+        root_doc = self.app.config.root_doc
+        toctree = TocTree(self.app.env).get_toctree_for(
+            root_doc,
+            builder,
+            collapse=False,
+            includehidden=True,
+            maxdepth=-1,
+            titles_only=True,
+        )
+        if toctree is None:
+            return ""
+        fragment = builder.render_partial(toctree)["fragment"]
+        tree = relocate_links(
+            fragment,
+            builder.get_target_uri(root_doc),
+            NAVIGATION_DIR,
+        )
+        navigation: str = get_navigation_tree(tree)
+        return navigation
+
+    def _write(self) -> str:
+        page = NAVIGATION_PAGE.format(
+            title=html.escape(_("Navigation")),
+            tree=self.render(),
+        ).encode("utf-8")
+        name = (
+            f"{NAVIGATION_DIR}/navigation.{hashlib.sha256(page).hexdigest()[:12]}.html"
+        )
+        path = Path(self.app.outdir, name)
+        if not path.exists():
+            # Parallel writers may get here at the same time, with the same page.
+            # Older trees are kept for the pages that incremental builds don't
+            # write again.
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(page)
+            tmp.replace(path)
+        return name
+
+
+def active_path(context: dict[str, Any]) -> str:
+    """Return the navigation from the root to the page, as nested lists.
+
+    The list items use the same classes as Furo's navigation tree.
+    """
+    items = [(parent["link"], parent["title"]) for parent in context.get("parents", [])]
+    items.append(("#", context.get("title", "")))
+    markup = ""
+    for level, (link, title) in reversed(list(enumerate(items, start=1))):
+        if link == "#":
+            item = (
+                f'<li class="toctree-l{level} current current-page">'
+                f'<a class="current reference internal" href="#">{title}</a></li>'
+            )
+        else:
+            item = (
+                f'<li class="toctree-l{level} current">'
+                f'<a class="reference internal" href="{html.escape(link)}">{title}</a>'
+                f"{markup}</li>"
+            )
+        markup = f"<ul>{item}</ul>"
+    return markup
+
+
+def stash_toctree(
+    app: Sphinx,  # noqa: ARG001 (event handler signature)
+    pagename: str,  # noqa: ARG001
+    templatename: str,  # noqa: ARG001
+    context: dict[str, Any],
+    doctree: object,  # noqa: ARG001
+) -> None:
+    """Hide the toctree function from Furo, so it doesn't render the tree."""
+    if "toctree" in context:
+        context["canonical_toctree"] = context.pop("toctree")
+
+
+def add_navigation(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,  # noqa: ARG001 (event handler signature)
+    context: dict[str, Any],
+    doctree: object,  # noqa: ARG001
+    tree: NavigationTree,
+) -> None:
+    """Replace the page's navigation tree with a link to the shared one."""
+    if "canonical_toctree" not in context:
+        return
+    context["toctree"] = context.pop("canonical_toctree")
+
+    url = context["pathto"](tree.name, 1)
+    path = "" if pagename == app.config.root_doc else active_path(context)
+    context["navigation_fragment"] = url
+    context["furo_navigation_tree"] = (
+        f'<div class="canonical-navigation" data-navigation="{html.escape(url)}">'
+        f"{path}"
+        f'<noscript><p><a href="{html.escape(url)}">{html.escape(_("All pages"))}'
+        f"</a></p></noscript></div>"
+    )
+
+
+def setup_navigation(app: Sphinx) -> None:
+    """Share the navigation tree between the pages of an HTML build."""
+    if (
+        not app.config.external_navigation
+        or app.config.epub_build
+        or app.builder.format != "html"
+    ):
+        return
+    # Around Furo's handler, which renders the tree when it has a toctree.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "html-page-context",
+        stash_toctree,
+        priority=400,
+    )
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "html-page-context",
+        functools.partial(add_navigation, tree=NavigationTree(app)),
+        priority=600,
+    )
@@ -0,0 +1,144 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""A number of parallel processes picked for the machine and the docset.
+
+Sphinx's "-j auto" starts a process per CPU, which costs more than it saves
+for small builds. With "auto_parallel_jobs" enabled, the number of processes
+is picked before each phase from the number of documents to read or write,
+using the scaling curve measured by "canonical-sphinx-scaling" if there is
+one.
+"""
+import functools
+import json
+import math
+import os
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# Without a measured curve, each process gets at least this many documents.
+DOCS_PER_JOB = 100
+
+# The fewest processes whose build time is within this fraction of the fastest
+# build are picked, since more processes also use more memory.
+TOLERANCE = 0.05
+
+
+def cpu_count() -> int:
+    """Return the number of CPUs that this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover (not on Linux)
+        return os.cpu_count() or 1
+
+
+def load_scaling(path: Path) -> list[dict[str, Any]]:
+    """Return the docsets measured by "canonical-sphinx-scaling"."""
+    docsets: list[dict[str, Any]] = json.loads(path.read_text())["docsets"]
+    return docsets
+
+
+def choose_jobs(docsets: list[dict[str, Any]], docs: int, cpus: int) -> int:
+    """Return the number of processes to build ``docs`` documents with.
+
+    :param docsets: The measured docsets, from :func:`load_scaling`. The one
+        with the closest number of documents is used.
+    :param cpus: The number of CPUs available.
+    """
+    measured = [docset for docset in docsets if docset["docs"] > 0]
+    if docs <= 1:
+        return 1
+    if not measured:
+        return max(1, min(cpus, docs // DOCS_PER_JOB))
+
+    docset = min(measured, key=lambda docset: abs(math.log(docset["docs"] / docs)))
+    # Runs that didn't produce the same output as the serial build aren't safe.
+    runs = [run for run in docset["runs"] if run["identical"] and run["jobs"] <= cpus]
+    if not runs:
+        return 1
+    fastest = min(run["seconds"] for run in runs)
+    jobs: int = min(
+        run["jobs"] for run in runs if run["seconds"] <= fastest * (1 + TOLERANCE)
+    )
+    return jobs
+
+
+def set_jobs(app: Sphinx, docs: int, phase: str, docsets: list[dict[str, Any]]) -> None:
+    """Set the number of processes that Sphinx uses for the next phase."""
+    jobs = choose_jobs(docsets, docs, cpu_count())
+    if jobs != app.parallel:
+        logger.info(
+            "canonical-sphinx: %s %d documents with %d processes",
+            phase,
+            docs,
+            jobs,
+        )
+    app.parallel = jobs
+
+
+def before_read(
+    app: Sphinx,
+    env: BuildEnvironment,  # noqa: ARG001 (event handler signature)
+    docnames: list[str],
+    docsets: list[dict[str, Any]],
+) -> None:
+    """Pick the number of processes to read the changed documents with."""
+    set_jobs(app, len(docnames), "reading", docsets)
+
+
+def before_write(
+    app: Sphinx,
+    env: BuildEnvironment,
+    docsets: list[dict[str, Any]],
+) -> None:
+    """Pick the number of processes to write the outdated documents with."""
+    outdated = app.builder.get_outdated_docs()
+    if isinstance(outdated, str):
+        # Builders that always write every document describe them instead.
+        docs = len(env.found_docs)
+    else:
+        docs = len(set(outdated) & env.found_docs)
+    set_jobs(app, docs, "writing", docsets)
+
+
+def setup_parallel_jobs(app: Sphinx) -> None:
+    """Pick the number of processes of each phase, if "auto_parallel_jobs" is set."""
+    if not app.config.auto_parallel_jobs:
+        return
+
+    docsets: list[dict[str, Any]] = []
+    if app.config.parallel_scaling_file:
+        path = Path(app.confdir, app.config.parallel_scaling_file)
+        try:
+            docsets = load_scaling(path)
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("Could not read the parallel scaling file: %s", exc)
+
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "env-before-read-docs",
+        functools.partial(before_read, docsets=docsets),
+    )
+    # After the other handlers, just before the documents are written.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "env-updated",
+        functools.partial(before_write, docsets=docsets),
+        priority=900,
+    )
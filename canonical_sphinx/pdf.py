@@ -0,0 +1,318 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Compile the documents of a LaTeX build into PDFs, at the same time.
+
+"make latexpdf" compiles the documents one after the other. This compiles
+them in a bounded pool instead, each in its own working directory, which
+keeps the auxiliary files of the previous compilation. Documents whose
+inputs haven't changed aren't compiled again, and passes stop as soon as the
+auxiliary files, which hold the cross-references, stop changing.
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from canonical_sphinx.assets import place_file
+from canonical_sphinx.cache import file_digest, fingerprint, load_json, save_json
+from canonical_sphinx.parallel import cpu_count
+
+# The working directories of the documents, inside the LaTeX output directory.
+WORK_DIR = ".pdf"
+
+# The files that a pass reads back from the previous pass.
+AUX_SUFFIXES = (".aux", ".toc", ".out", ".lof", ".lot", ".ind")
+
+# Engines that can skip writing the PDF until the last pass, and the program
+# that writes it.
+DVI_ENGINES = {"xelatex": "xdvipdfmx"}
+
+MAX_PASSES = 5
+
+# Bump when the contents of the state files change.
+STATE_VERSION = 1
+
+
+class PdfError(Exception):
+    """A document couldn't be compiled."""
+
+
+@dataclass
+class PdfResult:
+    """The outcome of compiling one document.
+
+    :param name: The name of the document, without the ".tex" suffix.
+    :param passes: The number of passes of the LaTeX engine. Documents that
+        are up to date take none.
+    :param seconds: The time taken.
+    :param stable: Whether the cross-references stopped changing.
+    :param error: Why the document couldn't be compiled, if it couldn't.
+    """
+
+    name: str
+    passes: int = 0
+    seconds: float = 0.0
+    stable: bool = True
+    error: str | None = None
+
+
+def _run(command: Sequence[str | Path], cwd: Path, log: Path) -> None:
+    try:
+        subprocess.run(
+            [str(part) for part in command],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            check=True,
+        )
+    except OSError as exc:
+        raise PdfError(str(exc)) from exc
+    except subprocess.CalledProcessError as exc:
+        raise PdfError(f"{exc} (see {log})") from exc
+
+
+def aux_digests(workdir: Path, name: str) -> dict[str, str]:
+    """Return the hashes of the auxiliary files of a document."""
+    return {
+        suffix: file_digest(path)
+        for suffix in AUX_SUFFIXES
+        if (path := workdir / f"{name}{suffix}").is_file()
+    }
+
+
+def index_command(latexdir: Path, idx: Path, ind: Path) -> list[str | Path]:
+    """Return the command that Sphinx's Makefile would sort the index with."""
+    try:
+        makefile = (latexdir / "Makefile").read_text(encoding="utf-8")
+    except OSError:
+        makefile = ""
+    if match := re.search(r"^export XINDYOPTS\s*=(.*)$", makefile, re.MULTILINE):
+        return ["xindy", *match.group(1).split(), "-o", ind, idx]
+    return ["makeindex", "-s", "python.ist", "-o", ind, idx]
+
+
+def input_digest(latexdir: Path, documents: Sequence[str]) -> str:
+    """Return the hash of the files that all documents may read."""
+    outputs = {f"{name}{suffix}" for name in documents for suffix in (".tex", ".pdf")}
+    return fingerprint(
+        {
+            path.relative_to(latexdir).as_posix(): file_digest(path)
+            for path in sorted(latexdir.rglob("*"))
+            if path.is_file()
+            and WORK_DIR not in path.relative_to(latexdir).parts
+            and path.name not in outputs
+        },
+    )
+
+
+def compile_document(
+    latexdir: Path,
+    name: str,
+    inputs: str,
+    engine: str = "xelatex",
+    max_passes: int = MAX_PASSES,
+    *,
+    force: bool = False,
+) -> PdfResult:
+    """Compile ``name``.tex into ``name``.pdf, in its own working directory.
+
+    :param inputs: The hash of the files shared by the documents, from
+        :func:`input_digest`.
+    :param force: Compile the document even if its inputs haven't changed.
+    """
+    start = time.perf_counter()
+    result = PdfResult(name)
+    workdir = latexdir / WORK_DIR / name
+    workdir.mkdir(parents=True, exist_ok=True)
+    state_file = workdir / "state.json"
+    pdf = workdir / f"{name}.pdf"
+    key = fingerprint(
+        STATE_VERSION,
+        inputs,
+        file_digest(latexdir / f"{name}.tex"),
+        engine,
+    )
+
+    state = load_json(state_file)
+    up_to_date = (
+        isinstance(state, dict)
+        and state.get("inputs") == key
+        and state.get("stable")
+        and pdf.is_file()
+    )
+    if force or not up_to_date:
+        writer = DVI_ENGINES.get(Path(engine).name)
+        command: list[str | Path] = [
+            engine,
+            "-interaction=nonstopmode",
+            "-halt-on-error",
+            f"-output-directory={WORK_DIR}/{name}",
+        ]
+        if writer:
+            command.append("-no-pdf")
+        command.append(f"{name}.tex")
+        log = workdir / f"{name}.log"
+        idx = workdir / f"{name}.idx"
+        ind = workdir / f"{name}.ind"
+
+        # The auxiliary files of the previous compilation are the starting
+        # point, so unchanged cross-references take a single pass.
+        state_file.unlink(missing_ok=True)
+        previous = aux_digests(workdir, name)
+        indexed = state.get("index") if isinstance(state, dict) else None
+        result.stable = False
+        while result.passes < max_passes:
+            _run(command, latexdir, log)
+            result.passes += 1
+            if idx.is_file() and file_digest(idx) != indexed:
+                if idx.stat().st_size:
+                    _run(index_command(latexdir, idx, ind), latexdir, log)
+                else:
+                    ind.write_text("")
+                indexed = file_digest(idx)
+            current = aux_digests(workdir, name)
+            if current == previous:
+                result.stable = True
+                break
+            previous = current
+
+        if writer:
+            xdv = workdir / f"{name}.xdv"
+            _run([writer, "-q", "-o", pdf, xdv], latexdir, log)
+        save_json(
+            state_file,
+            {"inputs": key, "stable": result.stable, "index": indexed},
+        )
+
+    place_file(pdf, latexdir / f"{name}.pdf")
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def _compile(
+    latexdir: Path,
+    name: str,
+    inputs: str,
+    engine: str,
+    max_passes: int,
+    *,
+    force: bool,
+) -> PdfResult:
+    try:
+        return compile_document(
+            latexdir,
+            name,
+            inputs,
+            engine,
+            max_passes,
+            force=force,
+        )
+    except (OSError, PdfError) as exc:
+        return PdfResult(name, stable=False, error=str(exc))
+
+
+def compile_documents(
+    latexdir: Path,
+    documents: Sequence[str] | None = None,
+    jobs: int | None = None,
+    engine: str = "xelatex",
+    max_passes: int = MAX_PASSES,
+    *,
+    force: bool = False,
+) -> list[PdfResult]:
+    """Compile the documents of a LaTeX build, ``jobs`` at a time.
+
+    :param documents: The names of the documents, without the ".tex" suffix.
+        All the ".tex" files in ``latexdir`` by default.
+    """
+    if documents is None:
+        documents = sorted(path.stem for path in latexdir.glob("*.tex"))
+    inputs = input_digest(latexdir, documents)
+    # Each thread waits on its own LaTeX processes.
+    with ThreadPoolExecutor(max_workers=jobs or cpu_count()) as executor:
+        futures = [
+            executor.submit(
+                _compile,
+                latexdir,
+                name,
+                inputs,
+                engine,
+                max_passes,
+                force=force,
+            )
+            for name in documents
+        ]
+        return [future.result() for future in futures]
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Compile the PDFs of a LaTeX build from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Compile the documents of a canonical-sphinx LaTeX build.",
+    )
+    parser.add_argument(
+        "latexdir",
+        type=Path,
+        help="output directory of 'sphinx-build -b latex'",
+    )
+    parser.add_argument(
+        "--document",
+        dest="documents",
+        action="append",
+        help="name of a document to compile, without '.tex' (repeatable; "
+        "default: all)",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=cpu_count())
+    parser.add_argument("--engine", default="xelatex")
+    parser.add_argument("--max-passes", type=int, default=MAX_PASSES)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="compile documents whose inputs haven't changed",
+    )
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1 or args.max_passes < 1:
+        parser.error("--jobs and --max-passes must be at least 1.")
+    if not args.latexdir.is_dir():
+        parser.error(f"{args.latexdir} is not a directory.")
+
+    results = compile_documents(
+        args.latexdir,
+        args.documents,
+        args.jobs,
+        args.engine,
+        args.max_passes,
+        force=args.force,
+    )
+    for result in results:
+        if result.error:
+            status = f"failed: {result.error}"
+        elif not result.passes:
+            status = "up to date"
+        else:
+            status = f"{result.passes} passes"
+            if not result.stable:
+                status += ", cross-references did not stabilise"
+        sys.stderr.write(f"{result.name}.pdf: {status} ({result.seconds:.1f}s)\n")
+
+    if any(result.error for result in results):
+        sys.exit(1)
@@ -0,0 +1,217 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Timing of the Sphinx event handlers that extensions register.
+
+With "build_profile" set, every event handler is wrapped to record its wall
+and CPU time, along with the document it ran for. The records are written as
+a Chrome trace, which can be opened in Perfetto (https://ui.perfetto.dev) or
+chrome://tracing, and the slowest handlers and documents are logged.
+"""
+import functools
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# The position of the document name in the arguments of some events, after
+# the application. Other events run for the environment's current document.
+DOCNAME_ARGS = {
+    "source-read": 0,
+    "include-read": 1,
+    "env-purge-doc": 1,
+    "doctree-resolved": 1,
+    "html-page-context": 0,
+}
+
+
+def _handler_name(handler: Callable[..., Any]) -> str:
+    while isinstance(handler, functools.partial):
+        handler = handler.func
+    module = getattr(handler, "__module__", None) or "?"
+    name = getattr(handler, "__qualname__", None) or repr(handler)
+    return f"{module}.{name}"
+
+
+def _docname(app: Sphinx, event: str, args: tuple[Any, ...]) -> str:
+    index = DOCNAME_ARGS.get(event)
+    if index is not None and len(args) > index:
+        docname = args[index]
+        if isinstance(docname, str):
+            return docname
+    try:
+        return app.env.docname or ""
+    except (AttributeError, KeyError):  # before a document is read
+        return ""
+
+
+class BuildProfiler:
+    """Records the time spent in each event handler of a build.
+
+    Handlers that run in parallel worker processes write their records to a
+    file per process, which the main process merges at the end of the build.
+    """
+
+    def __init__(self) -> None:
+        self.main_pid = os.getpid()
+        self.start = time.perf_counter_ns()
+        self.records: list[dict[str, Any]] = []
+        self.worker_dir = Path(tempfile.mkdtemp(prefix="canonical-sphinx-profile-"))
+        # The handlers that are already wrapped, or that are the profiler's own.
+        self.ignored: set[int] = set()
+
+    def record(self, record: dict[str, Any]) -> None:
+        """Store a record, in this process or in a worker's file."""
+        if os.getpid() == self.main_pid:
+            self.records.append(record)
+            return
+        path = self.worker_dir / f"{os.getpid()}.jsonl"
+        with path.open("a", encoding="utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def wrap(self, event: str, handler: Callable[..., Any]) -> Callable[..., Any]:
+        """Return a version of ``handler`` that records its run times."""
+        name = _handler_name(handler)
+
+        @functools.wraps(handler)
+        def wrapper(app: Sphinx, *args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+            wall = time.perf_counter_ns()
+            cpu = time.process_time_ns()
+            try:
+                return handler(app, *args, **kwargs)
+            finally:
+                self.record(
+                    {
+                        "handler": name,
+                        "event": event,
+                        "docname": _docname(app, event, args),
+                        "pid": os.getpid(),
+                        "start": wall - self.start,
+                        "wall": time.perf_counter_ns() - wall,
+                        "cpu": time.process_time_ns() - cpu,
+                    },
+                )
+
+        self.ignored.add(id(wrapper))
+        return wrapper
+
+    def instrument(self, app: Sphinx) -> None:
+        """Wrap the event handlers that aren't wrapped yet."""
+        for event, listeners in app.events.listeners.items():
+            for index, listener in enumerate(listeners):
+                handler = listener.handler
+                if id(handler) in self.ignored:
+                    continue
+                listeners[index] = listener._replace(handler=self.wrap(event, handler))
+
+    def collect(self) -> list[dict[str, Any]]:
+        """Return the records of all processes, merging the workers' files."""
+        records = list(self.records)
+        for path in sorted(self.worker_dir.glob("*.jsonl")):
+            with path.open(encoding="utf-8") as file:
+                records.extend(json.loads(line) for line in file if line.strip())
+        shutil.rmtree(self.worker_dir, ignore_errors=True)
+        return sorted(records, key=lambda record: record["start"])
+
+
+def to_chrome_trace(records: list[dict[str, Any]], main_pid: int) -> dict[str, Any]:
+    """Convert handler records to the Chrome trace event format."""
+    events: list[dict[str, Any]] = []
+    for pid in sorted({record["pid"] for record in records} | {main_pid}):
+        name = "sphinx-build" if pid == main_pid else f"worker {pid}"
+        events.append(
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}},
+        )
+    events.extend(
+        {
+            "name": record["handler"],
+            "cat": record["event"],
+            "ph": "X",
+            "ts": record["start"] / 1000,
+            "dur": record["wall"] / 1000,
+            "pid": record["pid"],
+            "tid": record["pid"],
+            "args": {"docname": record["docname"], "cpu_us": record["cpu"] / 1000},
+        }
+        for record in records
+    )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def summarize(records: list[dict[str, Any]], key: str, top: int) -> list[str]:
+    """Return the lines of a table of the ``top`` slowest values of ``key``."""
+    totals: dict[str, list[float]] = {}
+    for record in records:
+        if not record[key]:
+            continue
+        total = totals.setdefault(record[key], [0, 0, 0])
+        total[0] += record["wall"] / 1e9
+        total[1] += record["cpu"] / 1e9
+        total[2] += 1
+    slowest = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    return [
+        f"{wall:9.3f}s {cpu:9.3f}s {int(calls):7d}  {name}"
+        for name, (wall, cpu, calls) in slowest[:top]
+    ]
+
+
+def write_profile(
+    app: Sphinx,
+    exception: Exception | None,  # noqa: ARG001 (failed builds are profiled too)
+    profiler: BuildProfiler,
+) -> None:
+    """Write the trace file and log the slowest handlers and documents."""
+    records = profiler.collect()
+    path = Path(app.confdir, app.config.build_profile)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(to_chrome_trace(records, profiler.main_pid)))
+
+    top = app.config.build_profile_top
+    header = f"{'wall':>10} {'CPU':>10} {'calls':>7}"
+    for title, key in (("event handlers", "handler"), ("documents", "docname")):
+        logger.info("canonical-sphinx: slowest %s:", title)
+        logger.info("%s  %s", header, key)
+        for line in summarize(records, key, top):
+            logger.info(line)
+    logger.info("canonical-sphinx: wrote the build profile to %s", path)
+
+
+def setup_profiling(app: Sphinx, config: Config) -> None:
+    """Start profiling the event handlers, if "build_profile" is set."""
+    if not config.build_profile:
+        return
+
+    profiler = BuildProfiler()
+    profiler.instrument(app)
+
+    def instrument_deferred(app: Sphinx) -> None:
+        # Extensions can be set up as late as "builder-inited".
+        profiler.instrument(app)
+
+    app.connect("builder-inited", instrument_deferred, priority=900)
+
+    finish = functools.partial(write_profile, profiler=profiler)
+    app.connect("build-finished", finish, priority=1000)
+    profiler.ignored.update([id(instrument_deferred), id(finish)])
@@ -0,0 +1,252 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Parallel build scaling of canonical-sphinx, with "-j 1" to "-j N".
+
+Each docset is built once with every number of processes. The output of each
+build is compared with that of the serial build, and the speedups make up the
+curve that "auto_parallel_jobs" picks the number of processes from.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import sphinx
+from sphinx.application import Sphinx
+
+import canonical_sphinx
+from canonical_sphinx.benchmark import (
+    BUILDERS,
+    MAX_PAGES,
+    MIN_PAGES,
+    DocsetSpec,
+    generate_docset,
+)
+from canonical_sphinx.parallel import cpu_count
+
+
+def build_with_jobs(
+    srcdir: Path,
+    outdir: Path,
+    builder: str,
+    jobs: int,
+) -> dict[str, Any]:
+    """Build ``srcdir`` from scratch with ``jobs`` processes.
+
+    Like :func:`canonical_sphinx.benchmark.benchmark_builder`, this should run
+    in a fresh interpreter.
+    """
+    overrides = {"epub_build": True} if builder == "epub" else {}
+    # The caches of canonical-sphinx would speed up every build after the first.
+    shutil.rmtree(srcdir / ".sphinx" / "cache", ignore_errors=True)
+    start = time.perf_counter()
+    app = Sphinx(
+        str(srcdir),
+        str(srcdir),
+        str(outdir),
+        str(outdir.with_name(f"{outdir.name}.doctrees")),
+        builder,
+        confoverrides=overrides,
+        status=None,
+        freshenv=True,
+        parallel=jobs,
+    )
+    app.build()
+    return {
+        "seconds": time.perf_counter() - start,
+        "docs": len(app.env.found_docs),
+    }
+
+
+def tree_digests(directory: Path) -> dict[str, str]:
+    """Return the SHA-256 hash of every file in ``directory``, by path."""
+    return {
+        path.relative_to(directory)
+        .as_posix(): hashlib.sha256(
+            path.read_bytes(),
+        )
+        .hexdigest()
+        for path in sorted(directory.rglob("*"))
+        if path.is_file()
+    }
+
+
+def compare_trees(expected: dict[str, str], actual: dict[str, str]) -> list[str]:
+    """Return the paths that are missing, extra or different in ``actual``."""
+    return sorted(
+        path
+        for path in expected.keys() | actual.keys()
+        if expected.get(path) != actual.get(path)
+    )
+
+
+def measure_scaling(
+    srcdir: Path,
+    workdir: Path,
+    max_jobs: int,
+    builder: str = "html",
+) -> dict[str, Any]:
+    """Build ``srcdir`` with 1 to ``max_jobs`` processes and compare the output."""
+    context = multiprocessing.get_context("spawn")
+    runs: list[dict[str, Any]] = []
+    serial: dict[str, str] = {}
+    docs = 0
+    for jobs in range(1, max_jobs + 1):
+        outdir = workdir / f"j{jobs}"
+        shutil.rmtree(outdir, ignore_errors=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(
+                build_with_jobs,
+                srcdir,
+                outdir,
+                builder,
+                jobs,
+            ).result()
+        digests = tree_digests(outdir)
+        if jobs == 1:
+            serial = digests
+            docs = result["docs"]
+        differences = compare_trees(serial, digests)
+        runs.append(
+            {
+                "jobs": jobs,
+                "seconds": result["seconds"],
+                "speedup": runs[0]["seconds"] / result["seconds"] if runs else 1.0,
+                "identical": not differences,
+                "differences": differences,
+            },
+        )
+    return {"docs": docs, "runs": runs}
+
+
+def _copy_project(project: Path, target: Path) -> Path:
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.copytree(
+        project,
+        target,
+        ignore=shutil.ignore_patterns("_build", ".sphinx", ".git"),
+    )
+    return target
+
+
+def run_scaling(
+    workdir: Path,
+    projects: list[Path],
+    specs: list[DocsetSpec],
+    max_jobs: int,
+    builder: str = "html",
+) -> dict[str, Any]:
+    """Measure the scaling of each project and generated docset."""
+    sources: list[tuple[str, Path]] = []
+    for project in projects:
+        name = project.resolve().name
+        sources.append((name, _copy_project(project, workdir / name / "source")))
+    for spec in specs:
+        name = f"synthetic-{spec.pages}"
+        shutil.rmtree(workdir / name / "source", ignore_errors=True)
+        sources.append((name, generate_docset(spec, workdir / name / "source")))
+
+    results: dict[str, Any] = {
+        "canonical_sphinx": canonical_sphinx.__version__,
+        "sphinx": sphinx.__display_version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": cpu_count(),
+        "builder": builder,
+        "docsets": [],
+    }
+    for name, srcdir in sources:
+        scaling = measure_scaling(srcdir, workdir / name / "build", max_jobs, builder)
+        results["docsets"].append({"name": name, **scaling})
+    return results
+
+
+def format_curve(results: dict[str, Any]) -> str:
+    """Return the speedup of each docset and number of processes, as a table."""
+    lines = [f"{'docset':<24} {'docs':>6} {'jobs':>4} {'seconds':>8} {'speedup':>7}"]
+    lines += [
+        f"{docset['name']:<24} {docset['docs']:>6} {run['jobs']:>4} "
+        f"{run['seconds']:>8.2f} {run['speedup']:>6.2f}x"
+        + ("" if run["identical"] else "  (output differs)")
+        for docset in results["docsets"]
+        for run in docset["runs"]
+    ]
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Measure the parallel build scaling from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Measure how canonical-sphinx builds scale with '-j'.",
+    )
+    parser.add_argument("workdir", type=Path, help="directory for the builds")
+    parser.add_argument(
+        "--project",
+        dest="projects",
+        type=Path,
+        action="append",
+        default=[],
+        help="Sphinx project to build (repeatable)",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        action="append",
+        default=[],
+        help="pages of a synthetic docset to build (repeatable)",
+    )
+    parser.add_argument("--max-jobs", type=int, default=cpu_count())
+    parser.add_argument("--builder", choices=BUILDERS, default="html")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="write the JSON results to this file, for 'parallel_scaling_file'",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.projects and not args.pages:
+        parser.error("Pass at least one --project or --pages.")
+    if args.max_jobs < 1:
+        parser.error("The maximum number of jobs must be at least 1.")
+    for pages in args.pages:
+        if not MIN_PAGES <= pages <= MAX_PAGES:
+            parser.error(
+                f"Docsets must have between {MIN_PAGES} and {MAX_PAGES} pages.",
+            )
+
+    specs = [DocsetSpec(pages=pages) for pages in args.pages]
+    results = run_scaling(
+        args.workdir,
+        args.projects,
+        specs,
+        args.max_jobs,
+        args.builder,
+    )
+    sys.stderr.write(format_curve(results) + "\n")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+    if any(
+        not run["identical"] for docset in results["docsets"] for run in docset["runs"]
+    ):
+        sys.exit("The output of parallel builds differs from that of serial builds.")
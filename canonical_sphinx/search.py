@@ -0,0 +1,158 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""A search index split into shards, for searching as the user types.
+
+Sphinx's search page downloads the whole "searchindex.js" before it shows any
+result. With "sharded_search" enabled, the terms of the index are also split
+into shards by their first characters, so the sidebar search only downloads
+the shards of the words typed. Shards are named after a hash of their
+contents, and the manifest that lists them is the only file that changes
+between builds.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from canonical_sphinx.compress import available_encoders, compress_file
+
+logger = logging.getLogger(__name__)
+
+# Bump when the format of the shards or of the manifest changes.
+SEARCH_VERSION = 1
+
+# The output directory of the manifest and shards.
+SEARCH_DIR = Path("_static", "search")
+MANIFEST = "index.json"
+
+# The number of leading characters of a term that picks its shard.
+PREFIX_LENGTH = 2
+
+_INDEX_PREFIX = "Search.setIndex("
+
+
+def read_search_index(path: Path) -> dict[str, Any]:
+    """Read the index that Sphinx writes to "searchindex.js"."""
+    text = path.read_text(encoding="utf-8").strip()
+    if not text.startswith(_INDEX_PREFIX):
+        raise ValueError(f"{path} is not a Sphinx search index")
+    index: dict[str, Any] = json.loads(
+        text[len(_INDEX_PREFIX) :].removesuffix(";").removesuffix(")"),
+    )
+    return index
+
+
+def shard_key(term: str) -> str:
+    """Return the key of the shard that holds ``term``."""
+    return term[:PREFIX_LENGTH].lower()
+
+
+def split_index(index: dict[str, Any]) -> dict[str, dict[str, dict[str, list[int]]]]:
+    """Split the terms and title terms of a search index into shards.
+
+    Sphinx stores the documents of a term as a number when there is only one;
+    shards always use lists.
+    """
+    shards: dict[str, dict[str, dict[str, list[int]]]] = {}
+    for kind in ("terms", "titleterms"):
+        for term, docs in sorted(index.get(kind, {}).items()):
+            shard = shards.setdefault(shard_key(term), {"terms": {}, "titleterms": {}})
+            shard[kind][term] = docs if isinstance(docs, list) else [docs]
+    return shards
+
+
+def _write(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def _dump(data: object) -> bytes:
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def write_shards(
+    index: dict[str, Any],
+    doc_uris: list[str],
+    directory: Path,
+) -> tuple[dict[str, Any], int]:
+    """Write the shards of ``index`` and their manifest to ``directory``.
+
+    Unchanged shards keep their names, and shards that the manifest no longer
+    lists are removed.
+
+    :returns: The manifest, and the number of shards written.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    encoders = available_encoders()
+    shards: dict[str, str] = {}
+    written = 0
+    for key, shard in split_index(index).items():
+        data = _dump(shard)
+        name = f"{hashlib.sha256(data).hexdigest()[:16]}.json"
+        shards[key] = name
+        path = directory / name
+        if not path.exists():
+            _write(path, data)
+            written += 1
+        compress_file(path, encoders)
+
+    manifest = {
+        "version": SEARCH_VERSION,
+        "prefix_length": PREFIX_LENGTH,
+        "docs": [list(doc) for doc in zip(index["titles"], doc_uris, strict=True)],
+        "shards": shards,
+    }
+    path = directory / MANIFEST
+    _write(path, _dump(manifest))
+    compress_file(path, encoders)
+
+    keep = {MANIFEST, *shards.values()}
+    for path in directory.iterdir():
+        if path.name.partition(".json")[0] + ".json" not in keep:
+            path.unlink()
+    return manifest, written
+
+
+def write_search_shards(app: Sphinx, exception: Exception | None) -> None:
+    """Shard the search index of an HTML build, if "sharded_search" is set."""
+    if (
+        exception
+        or not app.config.sharded_search
+        or app.builder.format != "html"
+        or app.config.epub_build
+        or not getattr(app.builder, "search", False)
+    ):
+        return
+
+    outdir = Path(app.outdir)
+    try:
+        index = read_search_index(outdir / "searchindex.js")
+    except (OSError, ValueError) as exc:
+        logger.warning("Could not shard the search index: %s", exc)
+        return
+
+    doc_uris = [app.builder.get_target_uri(docname) for docname in index["docnames"]]
+    manifest, written = write_shards(index, doc_uris, outdir / SEARCH_DIR)
+    logger.info(
+        "canonical-sphinx: wrote %d of %d search index shards",
+        written,
+        len(manifest["shards"]),
+    )
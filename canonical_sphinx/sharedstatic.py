@@ -0,0 +1,252 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Theme assets shared by the builds of several versions of the docs.
+
+With "shared_static_dir" set, the theme's static files are written to
+"<hash>/<name>" in that directory, and pages link to them under
+"shared_static_url" instead of to their own "_static" directory. Builds of
+other versions with the same theme files link to the same URLs, so these
+files are only uploaded, stored and cached once.
+
+The manifest in the directory lists the files that each build links to, by
+its URL prefix, so that deployments can tell which files are still in use.
+"""
+import functools
+import posixpath
+import re
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.builders.html import StandaloneHTMLBuilder
+from sphinx.util import logging
+
+from canonical_sphinx.assets import is_up_to_date, place_file
+from canonical_sphinx.cache import (
+    file_digest,
+    get_cache_dir,
+    load_json,
+    locked,
+    save_json,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+# Suffixes of the theme files that are rendered as templates.
+TEMPLATE_SUFFIXES = ("_t", ".jinja")
+
+# Relative references in stylesheets, which would break if the stylesheet was
+# moved away from the files that it refers to.
+_CSS_URL = re.compile(r"""url\(\s*['"]?(?![a-z][a-z0-9+.-]*:|/|#)([^'")?#]+)""", re.I)
+
+
+def theme_static_names(app: Sphinx) -> set[str]:
+    """Return the paths in "_static" of the files that the theme provides."""
+    builder = app.builder
+    if not isinstance(builder, StandaloneHTMLBuilder):
+        return set()
+    directories = [Path(path, "static") for path in builder.theme.get_theme_dirs()]
+    # The theme's own bundles, which are written to the cache.
+    cache_dir = get_cache_dir(app)
+    directories.extend(
+        Path(app.confdir, path)
+        for path in app.config.html_static_path
+        if Path(app.confdir, path).is_relative_to(cache_dir)
+    )
+    names: set[str] = set()
+    for directory in directories:
+        for path in directory.rglob("*"):
+            if path.is_file():
+                name = path.relative_to(directory).as_posix()
+                for suffix in TEMPLATE_SUFFIXES:
+                    name = name.removesuffix(suffix)
+                names.add(name)
+    return names
+
+
+def shared_assets(static_dir: Path, names: set[str]) -> dict[str, str]:
+    """Return the shared path of each file in ``static_dir`` that can be shared.
+
+    Stylesheets with relative references stay in "_static", with the files
+    that they refer to.
+
+    :returns: The "<hash>/<name>" path of the files, by their path in "_static".
+    """
+    candidates = {name for name in names if (static_dir / name).is_file()}
+    pinned: set[str] = set()
+    for name in candidates:
+        if not name.endswith(".css"):
+            continue
+        text = (static_dir / name).read_text(encoding="utf-8", errors="replace")
+        references = _CSS_URL.findall(text)
+        if references:
+            pinned.add(name)
+            base = posixpath.dirname(name)
+            pinned.update(
+                posixpath.normpath(posixpath.join(base, reference))
+                for reference in references
+            )
+
+    return {
+        name: f"{file_digest(static_dir / name)[:16]}/{Path(name).name}"
+        for name in sorted(candidates - pinned)
+    }
+
+
+class SharedStatic:
+    """The theme assets of an HTML build, and where they are shared."""
+
+    def __init__(self, app: Sphinx) -> None:
+        self.app = app
+        self.url: str = app.config.shared_static_url.rstrip("/") + "/"
+        self.directory = Path(app.confdir, app.config.shared_static_dir)
+
+    @functools.cached_property
+    def assets(self) -> dict[str, str]:
+        """Return the shared path of the assets, by their path in "_static".
+
+        Static files are copied before pages are written, in every process.
+        """
+        return shared_assets(
+            Path(self.app.outdir, "_static"),
+            theme_static_names(self.app),
+        )
+
+    def shared_url(self, uri: str) -> str | None:
+        """Return the shared URL of a path relative to the root of the output."""
+        path = self.assets.get(uri.removeprefix("_static/"))
+        if not uri.startswith("_static/") or path is None:
+            return None
+        return self.url + path
+
+
+def _link_tag(
+    tag: Callable[[Any], str],
+    pathto: Callable[..., str],
+    shared: SharedStatic,
+) -> Callable[[Any], str]:
+    """Wrap a tag function of Sphinx to link to the shared assets."""
+
+    def shared_tag(file: Any) -> str:  # noqa: ANN401 (Sphinx's private types)
+        markup = tag(file)
+        filename = str(getattr(file, "filename", file) or "")
+        url = shared.shared_url(filename)
+        if url is None:
+            return markup
+        # The content hash is in the URL, so the checksum isn't needed.
+        uri = re.escape(pathto(filename, resource=True))
+        return re.sub(rf'(href|src)="{uri}(\?v=\w+)?"', rf'\1="{url}"', markup, count=1)
+
+    return shared_tag
+
+
+def link_shared_assets(
+    app: Sphinx,  # noqa: ARG001 (event handler signature)
+    pagename: str,  # noqa: ARG001
+    templatename: str,  # noqa: ARG001
+    context: dict[str, Any],
+    doctree: object,  # noqa: ARG001
+    shared: SharedStatic,
+) -> None:
+    """Make the page link to the shared copies of the theme assets."""
+    pathto: Callable[..., str] = context["pathto"]
+
+    def shared_pathto(
+        otheruri: str,
+        resource: bool = False,  # noqa: FBT001, FBT002 (Sphinx's signature)
+        **kwargs: Any,
+    ) -> str:
+        if resource:
+            url = shared.shared_url(otheruri)
+            if url is not None:
+                return url
+        return pathto(otheruri, resource, **kwargs)
+
+    context["pathto"] = shared_pathto
+    for name in ("css_tag", "js_tag"):
+        if name in context:
+            context[name] = _link_tag(context[name], pathto, shared)
+
+
+def publish_shared_assets(
+    app: Sphinx,
+    exception: Exception | None,
+    shared: SharedStatic,
+) -> None:
+    """Copy the shared assets into the shared directory, and list them there.
+
+    The copies in "_static" are removed, since pages don't link to them.
+    """
+    if exception is not None:
+        return
+    static_dir = Path(app.outdir, "_static")
+    assets = shared_assets(static_dir, theme_static_names(app))
+    try:
+        shared.directory.mkdir(parents=True, exist_ok=True)
+        with locked(shared.directory):
+            for name, path in assets.items():
+                target = shared.directory / path
+                if not is_up_to_date(static_dir / name, target):
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    place_file(static_dir / name, target)
+            loaded = load_json(shared.directory / MANIFEST)
+            manifest: dict[str, Any] = (
+                loaded if isinstance(loaded, dict) else {"builds": {}}
+            )
+            build = app.config.notfound_urls_prefix or "/"
+            manifest["builds"][build] = assets
+            save_json(shared.directory / MANIFEST, manifest)
+    except OSError as exc:
+        logger.warning("Could not write the shared theme assets: %s", exc)
+        return
+
+    for name in assets:
+        (static_dir / name).unlink(missing_ok=True)
+    for directory in sorted(static_dir.rglob("*"), reverse=True):
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+    logger.info(
+        "canonical-sphinx: linked %d theme assets in %s",
+        len(assets),
+        shared.url,
+    )
+
+
+def setup_shared_static(app: Sphinx) -> None:
+    """Share the theme assets between builds, if "shared_static_dir" is set."""
+    if (
+        not app.config.shared_static_dir
+        or app.config.epub_build
+        or app.builder.format != "html"
+    ):
+        return
+    shared = SharedStatic(app)
+    # After the 404 page's links are made absolute, and before Sphinx resolves
+    # the URLs of the logo and favicon.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "html-page-context",
+        functools.partial(link_shared_assets, shared=shared),
+        priority=450,
+    )
+    # Before the output is compressed.
+    app.connect(  # pyright: ignore [reportUnknownMemberType]
+        "build-finished",
+        functools.partial(publish_shared_assets, shared=shared),
+        priority=800,
+    )
@@ -0,0 +1,75 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Values that change between builds of the same pages, read at runtime.
+
+The branch that the docs are built from ends up in the edit link of every
+page, so every page changes when the same docs are built from another branch.
+With "runtime_site_config" enabled, the pages link to the default branch and
+the theme scripts read the actual values from one small file instead.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+
+SITE_CONFIG = "_static/site-config.json"
+
+
+def get_build_branch(html_context: dict[str, Any]) -> str:
+    """Return the branch that the docs are built from."""
+    branch: str = html_context["repo_default_branch"]
+
+    if "READTHEDOCS" in os.environ:  # noqa: SIM102; `in` is orthogonal to `!=`
+        # Skip PR builds because ReadTheDocs can't read the target branch from
+        # GitHub actions
+        if os.environ["READTHEDOCS_VERSION_TYPE"] != "external":
+            branch = os.environ["READTHEDOCS_GIT_IDENTIFIER"]
+
+    return branch
+
+
+def site_config(config: Config) -> dict[str, str]:
+    """Return the values that the theme scripts read at runtime."""
+    return {
+        "build_branch": get_build_branch(config.html_context),
+        "github_url": config.html_context.get("github_url") or "",
+    }
+
+
+def write_site_config(app: Sphinx, exception: Exception | None) -> None:
+    """Write the site config of an HTML build, if "runtime_site_config" is set."""
+    if (
+        exception
+        or not app.config.runtime_site_config
+        or app.builder.format != "html"
+        or app.config.epub_build
+    ):
+        return
+
+    content = json.dumps(site_config(app.config), indent=2, sort_keys=True) + "\n"
+    path = Path(app.outdir, SITE_CONFIG)
+    try:
+        if path.read_text(encoding="utf-8") == content:
+            return
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(content, encoding="utf-8")
+    tmp.replace(path)
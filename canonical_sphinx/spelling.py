@@ -0,0 +1,246 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""A builder that checks the spelling of the documents, as pyspelling does.
+
+The "canonical-spelling" builder takes the words of each document from its
+doctree, without code, and checks them with Aspell or Hunspell in parallel
+workers.
+The misspelled words of each document are cached by the hash of its words
+and of the word lists, so only the documents with new words are checked
+again. The report has the same format as the one of pyspelling.
+"""
+import functools
+import re
+import subprocess
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from docutils import nodes
+from sphinx.builders.dummy import DummyBuilder
+from sphinx.errors import SphinxError
+from sphinx.util import logging
+
+from canonical_sphinx.cache import fingerprint, get_cache_dir, load_json, save_json
+from canonical_sphinx.parallel import cpu_count
+
+logger = logging.getLogger(__name__)
+
+# Bump when the words taken from the doctrees change.
+SPELLING_VERSION = 1
+
+# The task that the report lists the documents under, as pyspelling does.
+REPORT_TASK = "spelling"
+
+# Elements whose text isn't prose.
+SKIPPED_NODES = (
+    nodes.literal_block,
+    nodes.literal,
+    nodes.raw,
+    nodes.comment,
+    nodes.math,
+    nodes.math_block,
+    nodes.doctest_block,
+    nodes.substitution_definition,
+    nodes.target,
+)
+
+# The commands that list the misspelled words of their input, one per line.
+CHECKERS = {
+    "aspell": ["aspell", "list", "--lang={lang}"],
+    "hunspell": ["hunspell", "-l", "-d", "{lang}"],
+}
+
+# Words, with apostrophes inside them.
+_WORD = re.compile(r"[^\W\d_]+(?:['\u2019][^\W\d_]+)*")
+
+
+class SpellingError(SphinxError):
+    """The spelling checker couldn't be run."""
+
+    category = "Spelling error"
+
+
+def document_words(doctree: nodes.Node) -> list[str]:
+    """Return the words of a document, in order, without code or URLs."""
+    words = []
+    for text in doctree.findall(nodes.Text):
+        parent = text.parent
+        if any(isinstance(node, SKIPPED_NODES) for node in _ancestors(parent)):
+            continue
+        if isinstance(parent, nodes.reference) and parent.get("refuri") == str(text):
+            # A bare URL.
+            continue
+        words.extend(_WORD.findall(str(text)))
+    return words
+
+
+def _ancestors(node: nodes.Node | None) -> Iterator[nodes.Node]:
+    while node is not None:
+        yield node
+        node = node.parent
+
+
+def read_wordlists(paths: Iterable[Path]) -> set[str]:
+    """Return the words of the word lists that exist, one per line."""
+    words: set[str] = set()
+    for path in paths:
+        if path.is_file():
+            words.update(
+                line.strip()
+                for line in path.read_text(encoding="utf-8").splitlines()
+                if line.strip()
+            )
+    return words
+
+
+@functools.cache
+def checker_version(command: tuple[str, ...]) -> str:
+    """Return the version of a spelling checker, whose results depend on it."""
+    try:
+        result = subprocess.run(
+            [command[0], "--version"],
+            capture_output=True,
+            check=False,
+            text=True,
+            stdin=subprocess.DEVNULL,
+        )
+    except OSError as exc:
+        raise SpellingError(f"Could not run {command[0]}: {exc}") from exc
+    return result.stdout.strip()
+
+
+def misspelled_words(
+    command: list[str],
+    words: list[str],
+    known: set[str],
+) -> list[str]:
+    """Return the words that the checker doesn't know, in order of appearance."""
+    try:
+        result = subprocess.run(
+            command,
+            input="\n".join(dict.fromkeys(words)),
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except OSError as exc:
+        raise SpellingError(f"Could not run {command[0]}: {exc}") from exc
+    except subprocess.CalledProcessError as exc:
+        raise SpellingError(
+            f"{command[0]} failed: {exc.stderr.strip() or exc.returncode}",
+        ) from exc
+    unknown = {
+        word
+        for word in result.stdout.split()
+        if word not in known and word.lower() not in known
+    }
+    return [word for word in dict.fromkeys(words) if word in unknown]
+
+
+class SpellingBuilder(DummyBuilder):
+    """Checks the spelling of the documents."""
+
+    name = "canonical-spelling"
+    epilog = "Look for any errors in the above output or in %(outdir)s/output.txt"
+    # The words are collected while writing, and checked at the end.
+    allow_parallel = False
+
+    def init(self) -> None:
+        """Prepare to collect the words of the documents."""
+        self.words: dict[str, list[str]] = {}
+
+    def write_doc(self, docname: str, doctree: nodes.document) -> None:
+        """Collect the words of a document."""
+        self.words[docname] = document_words(doctree)
+
+    def finish(self) -> None:
+        """Check the words of the documents, and report the misspelled ones."""
+        config = self.config
+        checker = config.canonical_spelling_checker
+        if checker not in CHECKERS:
+            raise SpellingError(
+                f"Unknown spelling checker {checker!r}; use one of: "
+                + ", ".join(sorted(CHECKERS)),
+            )
+        command = [part.format(lang=config.canonical_spelling_lang) for part in CHECKERS[checker]]
+        known = read_wordlists(
+            Path(self.confdir, path) for path in config.canonical_spelling_wordlists
+        )
+        dictionary = fingerprint(
+            SPELLING_VERSION,
+            command,
+            checker_version(tuple(command)),
+            sorted(known),
+        )
+
+        cache_path = get_cache_dir(self.app) / "spelling.json"
+        cached = load_json(cache_path)
+        if not isinstance(cached, dict):
+            cached = {}
+        keys = {
+            docname: fingerprint(dictionary, sorted(set(words)))
+            for docname, words in self.words.items()
+        }
+        results = {key: cached[key] for key in keys.values() if key in cached}
+        missing = {key: docname for docname, key in keys.items() if key not in results}
+
+        with ThreadPoolExecutor(
+            max_workers=config.canonical_spelling_workers or cpu_count(),
+        ) as executor:
+            checked = executor.map(
+                lambda docname: misspelled_words(command, self.words[docname], known),
+                missing.values(),
+            )
+            results.update(zip(missing, checked, strict=True))
+        save_json(cache_path, results)
+        logger.info(
+            "canonical-sphinx: checked the spelling of %d of %d documents",
+            len(missing),
+            len(keys),
+        )
+
+        report = [
+            line
+            for docname in sorted(keys)
+            for line in self._report(docname, results[keys[docname]])
+        ]
+        report.append(
+            (
+                "!!!Spelling check failed!!!"
+                if any(results[key] for key in keys.values())
+                else "Spelling check passed :)"
+            ),
+        )
+        (self.outdir / "output.txt").write_text("\n".join(report) + "\n")
+        for line in report:
+            logger.info(line)
+        if any(results[key] for key in keys.values()):
+            self.app.statuscode = 1
+
+    def _report(self, docname: str, words: list[str]) -> list[str]:
+        """Return the lines that pyspelling reports the words of a document in."""
+        if not words:
+            return []
+        path = self.env.doc2path(docname, base=False)
+        return [
+            "Misspelled words:",
+            f"<{REPORT_TASK}> {Path(path).as_posix()}",
+            "-" * 80,
+            *words,
+            "-" * 80,
+            "",
+        ]
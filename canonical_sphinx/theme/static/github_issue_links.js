@@ -7,6 +7,19 @@ window.onload = function() {
         prev_handler();
     }
 
+    // with a runtime site config, the GitHub URL isn't in the page
+    if (typeof site_config !== "undefined") {
+        site_config.then((config) => {
+            if (config && config.github_url) {
+                addIssueLink(config.github_url);
+            }
+        });
+    } else {
+        addIssueLink(github_url);
+    }
+};
+
+function addIssueLink(github_url) {
     const link = document.createElement("a");
     link.classList.add("muted-link");
     link.classList.add("github-issue-link");
@@ -31,4 +44,4 @@ window.onload = function() {
 
     const container = document.querySelector(".article-container > .content-icon-container");
     container.prepend(div);
-};
+}
@@ -0,0 +1,271 @@
+// Prefetches the pages that the reader is likely to open next and, if
+// enabled, swaps in the main area of the page instead of loading a new page.
+// Without JavaScript, or whenever anything unexpected happens, links behave
+// as normal links.
+(function () {
+    // Set by the theme's base template.
+    const options = typeof instant_navigation === "undefined" ? null : instant_navigation;
+    if (!options || !window.fetch) {
+        return;
+    }
+
+    const BUDGET_KEY = "canonical-sphinx-prefetched-bytes";
+    const HOVER_DELAY = 65;
+    const MAX_CONCURRENT = 2;
+    // Elements that differ from page to page, and are swapped as a whole.
+    // Everything else, including the theme's event handlers, is kept.
+    const SWAPPED = [
+        "#furo-main-content",
+        ".main footer",
+        ".toc-drawer",
+        ".sidebar-tree",
+        ".edit-this-page",
+        ".view-this-page",
+    ];
+
+    const pages = new Map();
+    const queue = [];
+    let active = 0;
+    let currentPage = withoutHash(location.href);
+
+    function withoutHash(href) {
+        const url = new URL(href, location.href);
+        url.hash = "";
+        return url.href;
+    }
+
+    function slowConnection() {
+        const connection = navigator.connection;
+        return Boolean(
+            connection &&
+                (connection.saveData || /(^|-)2g$/.test(connection.effectiveType || "")),
+        );
+    }
+
+    // Bytes prefetched in this browser session, across page loads.
+    function spent() {
+        try {
+            return Number(sessionStorage.getItem(BUDGET_KEY)) || 0;
+        } catch (error) {
+            return 0;
+        }
+    }
+
+    function spend(bytes) {
+        try {
+            sessionStorage.setItem(BUDGET_KEY, String(spent() + bytes));
+        } catch (error) {
+            // Private browsing modes may not have session storage.
+        }
+    }
+
+    function pageUrl(link) {
+        if (!link || !link.href || link.target || link.hasAttribute("download")) {
+            return null;
+        }
+        const url = new URL(link.href, location.href);
+        if (url.origin !== location.origin || !/(\.html|\/)$/.test(url.pathname)) {
+            return null;
+        }
+        const page = withoutHash(url.href);
+        return page === currentPage ? null : page;
+    }
+
+    function load(url) {
+        if (!pages.has(url)) {
+            const page = fetch(url, { credentials: "same-origin" }).then((response) => {
+                const type = response.headers.get("Content-Type") || "";
+                if (!response.ok || !type.includes("text/html")) {
+                    throw new Error(`${url}: ${response.status}`);
+                }
+                return response.text();
+            });
+            // Failed pages can be tried again, as normal links.
+            page.catch(() => pages.delete(url));
+            pages.set(url, page);
+        }
+        return pages.get(url);
+    }
+
+    function next() {
+        while (active < MAX_CONCURRENT && queue.length) {
+            const url = queue.shift();
+            if (pages.has(url) || spent() >= options.budget) {
+                continue;
+            }
+            active += 1;
+            load(url)
+                .then((text) => spend(text.length))
+                .catch(() => {})
+                .finally(() => {
+                    active -= 1;
+                    next();
+                });
+        }
+    }
+
+    function prefetch(link) {
+        const url = pageUrl(link);
+        if (url && !slowConnection() && spent() < options.budget) {
+            queue.push(url);
+            next();
+        }
+    }
+
+    function watchLinks() {
+        // The next and previous pages, which tutorials are read in.
+        document.querySelectorAll(".related-pages a").forEach(prefetch);
+
+        const sidebar = document.querySelector(".sidebar-tree");
+        if (!sidebar) {
+            return;
+        }
+        let timer = null;
+        sidebar.addEventListener("mouseover", (event) => {
+            const link = event.target.closest("a");
+            clearTimeout(timer);
+            timer = setTimeout(() => prefetch(link), HOVER_DELAY);
+        });
+        sidebar.addEventListener("focusin", (event) => prefetch(event.target.closest("a")));
+        if (window.IntersectionObserver) {
+            const observer = new IntersectionObserver((entries) => {
+                for (const entry of entries) {
+                    if (entry.isIntersecting) {
+                        observer.unobserve(entry.target);
+                        const idle = window.requestIdleCallback || setTimeout;
+                        idle(() => prefetch(entry.target));
+                    }
+                }
+            });
+            sidebar.querySelectorAll("a.reference.internal").forEach((link) =>
+                observer.observe(link),
+            );
+        }
+    }
+
+    function scriptSources(doc) {
+        return [...doc.querySelectorAll("script[src]")]
+            .map((script) => script.getAttribute("src").split("?")[0].replace(/^(\.\.\/)+/, ""))
+            .join(" ");
+    }
+
+    // Make the links of the elements that stay on the page absolute, since
+    // relative links depend on the depth of the page.
+    function absolutizeLinks() {
+        for (const element of document.querySelectorAll("a[href], form[action]")) {
+            if (SWAPPED.some((selector) => element.closest(selector))) {
+                continue;
+            }
+            const name = element.tagName === "FORM" ? "action" : "href";
+            const value = element.getAttribute(name);
+            if (!value.startsWith("#") && !/^[a-z]+:/i.test(value)) {
+                element.setAttribute(name, new URL(value, document.baseURI).href);
+            }
+        }
+    }
+
+    function swap(url, text, push) {
+        const doc = new DOMParser().parseFromString(text, "text/html");
+        const parts = [];
+        for (const selector of SWAPPED) {
+            const current = document.querySelectorAll(selector);
+            const swapped = doc.querySelectorAll(selector);
+            if (current.length !== swapped.length) {
+                return false;
+            }
+            current.forEach((element, index) => parts.push([element, swapped[index]]));
+        }
+        // Pages with other scripts, or with scripts of their own in the swapped
+        // elements, need a normal page load.
+        if (
+            !doc.querySelector(SWAPPED[0]) ||
+            scriptSources(doc) !== scriptSources(document) ||
+            parts.some(([, swapped]) => swapped.querySelector("script"))
+        ) {
+            return false;
+        }
+        absolutizeLinks();
+        if (push) {
+            history.replaceState({ scroll: window.scrollY }, "");
+            history.pushState({}, "", url);
+        }
+        currentPage = withoutHash(url);
+        for (const [current, swapped] of parts) {
+            current.replaceWith(document.adoptNode(swapped));
+        }
+        document.title = doc.title;
+        const { hash } = new URL(url);
+        const target = hash && document.getElementById(decodeURIComponent(hash.slice(1)));
+        if (target) {
+            target.scrollIntoView();
+        } else {
+            window.scrollTo(0, 0);
+        }
+        if (typeof addCopyButtonToCodeCells === "function") {
+            addCopyButtonToCodeCells();
+        }
+        document.dispatchEvent(new CustomEvent("canonical-sphinx:page-swapped"));
+        watchLinks();
+        return true;
+    }
+
+    function navigate(url, page) {
+        load(page)
+            .then((text) => {
+                if (!swap(url, text, true)) {
+                    location.assign(url);
+                }
+            })
+            .catch(() => location.assign(url));
+    }
+
+    function setupSwap() {
+        document.addEventListener("click", (event) => {
+            const link = event.target.closest("a");
+            if (
+                event.defaultPrevented ||
+                event.button !== 0 ||
+                event.metaKey ||
+                event.ctrlKey ||
+                event.shiftKey ||
+                event.altKey
+            ) {
+                return;
+            }
+            const page = pageUrl(link);
+            if (page) {
+                event.preventDefault();
+                navigate(link.href, page);
+            }
+        });
+        window.addEventListener("popstate", (event) => {
+            const page = withoutHash(location.href);
+            if (page === currentPage) {
+                // A link to a section of the same page.
+                return;
+            }
+            load(page)
+                .then((text) => {
+                    if (!swap(location.href, text, false)) {
+                        location.reload();
+                    } else if (event.state && event.state.scroll) {
+                        window.scrollTo(0, event.state.scroll);
+                    }
+                })
+                .catch(() => location.reload());
+        });
+    }
+
+    function setup() {
+        watchLinks();
+        if (options.swap && window.DOMParser && history.pushState) {
+            setupSwap();
+        }
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", setup);
+    } else {
+        setup();
+    }
+})();
@@ -0,0 +1,83 @@
+// Replaces the path to the current page in the sidebar with the full
+// navigation tree, which is shared by all pages so that browsers cache it.
+(function () {
+    const trees = new Map();
+
+    function pagePath(href) {
+        const url = new URL(href, location.href);
+        return url.pathname.replace(/index\.html$/, "");
+    }
+
+    function loadTree(url) {
+        if (!trees.has(url)) {
+            const tree = fetch(url, { credentials: "same-origin" }).then((response) => {
+                if (!response.ok) {
+                    throw new Error(`${url}: ${response.status}`);
+                }
+                return response.text();
+            });
+            tree.catch(() => trees.delete(url));
+            trees.set(url, tree);
+        }
+        return trees.get(url);
+    }
+
+    // Mark the current page and its ancestors, and expand them, as Furo
+    // does for the tree that it renders.
+    function markCurrent(tree) {
+        const current = pagePath(location.href);
+        const link = [...tree.querySelectorAll("a.reference")].find(
+            (candidate) => pagePath(candidate.href) === current,
+        );
+        if (!link) {
+            return;
+        }
+        link.classList.add("current");
+        let item = link.closest("li");
+        item.classList.add("current-page");
+        while (item) {
+            item.classList.add("current");
+            const checkbox = item.querySelector(":scope > input.toctree-checkbox");
+            if (checkbox) {
+                checkbox.checked = true;
+            }
+            item = item.parentElement.closest("li");
+        }
+    }
+
+    async function hydrate() {
+        const placeholder = document.querySelector("[data-navigation]");
+        if (!placeholder) {
+            return;
+        }
+        const url = new URL(placeholder.dataset.navigation, location.href).href;
+        let text;
+        try {
+            text = await loadTree(url);
+        } catch (error) {
+            // The path to the current page stays in the sidebar.
+            return;
+        }
+        const doc = new DOMParser().parseFromString(text, "text/html");
+        const tree = doc.querySelector(".sidebar-tree");
+        if (!tree || !placeholder.isConnected) {
+            return;
+        }
+        // The links are relative to the tree's own URL.
+        for (const link of tree.querySelectorAll("a[href]")) {
+            link.setAttribute("href", new URL(link.getAttribute("href"), url).href);
+        }
+        markCurrent(tree);
+        placeholder.closest(".sidebar-tree").replaceChildren(
+            ...[...tree.childNodes].map((node) => document.adoptNode(node)),
+        );
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", hydrate);
+    } else {
+        hydrate();
+    }
+    // Pages swapped in by instant navigation have a new placeholder.
+    document.addEventListener("canonical-sphinx:page-swapped", hydrate);
+})();
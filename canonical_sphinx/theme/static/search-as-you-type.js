@@ -0,0 +1,97 @@
+// Shows search results under the sidebar search box as the user types, from
+// the sharded search index. Submitting the form still opens the search page.
+(function () {
+    const DELAY = 100;
+
+    function setup() {
+        const form = document.querySelector("form[data-search-index]");
+        if (!form || !window.Worker) {
+            return;
+        }
+        const input = form.querySelector("input[name=q]");
+        const list = form.parentElement.querySelector(".sidebar-search-results");
+        const manifest = new URL(form.dataset.searchIndex, location.href);
+        // The manifest is in "_static/search/"; page URIs are relative to the root.
+        const root = new URL("../../", manifest);
+
+        let worker = null;
+        let latest = 0;
+        let timer = null;
+
+        function startWorker() {
+            worker = new Worker(new URL(form.dataset.searchWorker, location.href));
+            worker.postMessage({
+                init: {
+                    manifest: manifest.href,
+                    languageData: new URL(form.dataset.languageData, location.href).href,
+                },
+            });
+            worker.onmessage = (event) => {
+                if (event.data.id === latest) {
+                    show(event.data.results);
+                }
+            };
+        }
+
+        function show(results) {
+            list.replaceChildren();
+            for (const result of results) {
+                const link = document.createElement("a");
+                link.href = new URL(result.uri, root).href;
+                link.textContent = result.title;
+                const item = document.createElement("li");
+                item.append(link);
+                list.append(item);
+            }
+            list.hidden = !results.length;
+        }
+
+        // Start the worker, and fetch the manifest, as soon as the search box
+        // is used.
+        input.addEventListener("focus", () => worker || startWorker(), { once: true });
+        input.setAttribute("autocomplete", "off");
+        input.addEventListener("input", () => {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (!query) {
+                latest += 1;
+                show([]);
+                return;
+            }
+            timer = setTimeout(() => {
+                if (!worker) {
+                    startWorker();
+                }
+                latest += 1;
+                worker.postMessage({ id: latest, query });
+            }, DELAY);
+        });
+        input.addEventListener("keydown", (event) => {
+            if (event.key === "Escape") {
+                show([]);
+            } else if (event.key === "ArrowDown" && !list.hidden) {
+                event.preventDefault();
+                list.querySelector("a").focus();
+            }
+        });
+        list.addEventListener("keydown", (event) => {
+            const item = event.target.parentElement;
+            if (event.key === "ArrowDown" && item.nextElementSibling) {
+                event.preventDefault();
+                item.nextElementSibling.firstChild.focus();
+            } else if (event.key === "ArrowUp") {
+                event.preventDefault();
+                (item.previousElementSibling?.firstChild || input).focus();
+            } else if (event.key === "Escape") {
+                show([]);
+                input.focus();
+            }
+        });
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", setup);
+    } else {
+        setup();
+    }
+})();
@@ -0,0 +1,146 @@
+// Searches the sharded search index, downloading only the shards that the
+// typed words need. Shards and the manifest are fetched once per worker.
+
+// language_data.js exports the stemmer and stopwords to "window".
+self.window = self;
+
+const MAX_RESULTS = 10;
+const MIN_PARTIAL_LENGTH = 2;
+
+// The scores of Sphinx's default scorer.
+const SCORES = { title: 15, term: 5, partialTitle: 7, partialTerm: 2 };
+
+let manifestUrl = null;
+let manifest = null;
+let stemmer = null;
+const shards = new Map();
+
+function loadManifest() {
+    if (!manifest) {
+        manifest = fetch(manifestUrl).then((response) => {
+            if (!response.ok) {
+                throw new Error(`${manifestUrl}: ${response.status}`);
+            }
+            return response.json();
+        }).catch((error) => {
+            // Try again with the next query.
+            manifest = null;
+            throw error;
+        });
+    }
+    return manifest;
+}
+
+function loadShard(index, key) {
+    const name = index.shards[key];
+    if (!name) {
+        return Promise.resolve(null);
+    }
+    if (!shards.has(name)) {
+        const url = new URL(name, manifestUrl);
+        shards.set(
+            name,
+            fetch(url).then((response) => (response.ok ? response.json() : null)),
+        );
+    }
+    return shards.get(name);
+}
+
+function splitQuery(query) {
+    return query
+        .toLowerCase()
+        .split(/[^\p{L}\p{N}_]+/u)
+        .filter((word) => word);
+}
+
+// Return the best score of each document for one word of the query.
+function scoreWord(shard, word, stem, partial) {
+    const scores = new Map();
+    const add = (docs, score) => {
+        for (const doc of docs) {
+            scores.set(doc, Math.max(scores.get(doc) || 0, score));
+        }
+    };
+    if (!shard) {
+        return scores;
+    }
+    add(shard.titleterms[stem] || [], SCORES.title);
+    add(shard.terms[stem] || [], SCORES.term);
+    if (partial && word.length >= MIN_PARTIAL_LENGTH) {
+        for (const [kind, score] of [
+            ["titleterms", SCORES.partialTitle],
+            ["terms", SCORES.partialTerm],
+        ]) {
+            for (const [term, docs] of Object.entries(shard[kind])) {
+                if (term !== stem && term.toLowerCase().startsWith(word)) {
+                    add(docs, score);
+                }
+            }
+        }
+    }
+    return scores;
+}
+
+async function search(query) {
+    const index = await loadManifest();
+    const words = splitQuery(query);
+    if (!words.length) {
+        return [];
+    }
+
+    let totals = null;
+    for (const [position, word] of words.entries()) {
+        // The last word may still be being typed.
+        const partial = position === words.length - 1;
+        if (!partial && window.stopwords && window.stopwords.has(word)) {
+            continue;
+        }
+        const stem = stemmer ? stemmer.stemWord(word) : word;
+        const key = stem.slice(0, index.prefix_length);
+        const wordKey = word.slice(0, index.prefix_length);
+        const found = new Map();
+        for (const shardKey of new Set([key, wordKey])) {
+            const scores = scoreWord(await loadShard(index, shardKey), word, stem, partial);
+            for (const [doc, score] of scores) {
+                found.set(doc, Math.max(found.get(doc) || 0, score));
+            }
+        }
+        if (totals === null) {
+            totals = found;
+            continue;
+        }
+        // Every word must match.
+        for (const [doc, score] of totals) {
+            if (found.has(doc)) {
+                totals.set(doc, score + found.get(doc));
+            } else {
+                totals.delete(doc);
+            }
+        }
+    }
+
+    return [...(totals || new Map())]
+        .sort((a, b) => b[1] - a[1] || index.docs[a[0]][0].localeCompare(index.docs[b[0]][0]))
+        .slice(0, MAX_RESULTS)
+        .map(([doc]) => ({ title: index.docs[doc][0], uri: index.docs[doc][1] }));
+}
+
+self.onmessage = async (event) => {
+    const { init, id, query } = event.data;
+    if (init) {
+        manifestUrl = init.manifest;
+        try {
+            importScripts(init.languageData);
+            stemmer = new window.Stemmer();
+        } catch (error) {
+            stemmer = null;
+        }
+        loadManifest().catch(() => {});
+        return;
+    }
+    try {
+        self.postMessage({ id, results: await search(query) });
+    } catch (error) {
+        self.postMessage({ id, results: [], error: String(error) });
+    }
+};
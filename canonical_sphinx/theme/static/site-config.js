@@ -0,0 +1,36 @@
+// Reads the values that change between builds of the same pages, such as the
+// branch that they are built from, so that the pages themselves don't change.
+// Until it is read, or if it can't be, the links point at the default branch.
+const site_config = (function () {
+    // Set by the theme's base template.
+    if (typeof site_config_url === "undefined" || !window.fetch) {
+        return Promise.resolve(null);
+    }
+    return fetch(new URL(site_config_url, location.href))
+        .then((response) => (response.ok ? response.json() : null))
+        .catch(() => null);
+})();
+
+(function () {
+    function updateLinks() {
+        site_config.then((config) => {
+            if (!config || !config.build_branch) {
+                return;
+            }
+            for (const link of document.querySelectorAll("a[data-branch-link]")) {
+                link.href = link.dataset.branchLink.replace(
+                    "{branch}",
+                    encodeURI(config.build_branch),
+                );
+            }
+        });
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", updateLinks);
+    } else {
+        updateLinks();
+    }
+    // Pages swapped in by instant navigation have new edit links.
+    document.addEventListener("canonical-sphinx:page-swapped", updateLinks);
+})();
@@ -0,0 +1,50 @@
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Integration tests for the build benchmark suite."""
+import json
+import subprocess
+
+
+def test_benchmark(tmp_path):
+    # As in the tox environment, the results directory doesn't exist yet.
+    output = tmp_path / "results" / "benchmark.json"
+    subprocess.check_call(
+        [
+            "canonical-sphinx-benchmark",
+            tmp_path / "docset",
+            "--pages",
+            "10",
+            "--format",
+            "md",
+            "--builder",
+            "html",
+            "--builder",
+            "latex",
+            "--output",
+            output,
+        ],
+    )
+
+    results = json.loads(output.read_text())
+    assert results["docset"]["pages"] == 10
+    assert set(results["builders"]) == {"html", "latex"}
+    for timings in results["builders"].values():
+        assert set(timings) == {
+            "setup",
+            "config_inited",
+            "read",
+            "write",
+            "copy_custom_files",
+            "total",
+        }
@@ -12,6 +12,8 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Integration tests for building documentation with the extension and theme."""
+import json
+import os
 import shutil
 import subprocess
 from datetime import datetime
@@ -77,3 +79,478 @@ def test_canonical_sphinx(example_project):
         {"href": "https://discourse.example-project.com"},
     ).string.strip()
     assert discourse_ref == "Discourse"
+
+
+def test_deferred_optional_extensions(example_project):
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "defer_optional_extensions=1",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    # Deferred extensions still add their assets to HTML builds
+    assert (build_dir / "_static" / "copybutton.js").is_file()
+    assert (example_project / ".sphinx" / "cache").is_dir()
+
+
+def test_deferred_extension_assets(example_project):
+    # A deferred extension that adds a stylesheet when the config is read, as
+    # extensions that append to "html_css_files" do. Deferring is enabled in
+    # "conf.py", which the extension reads when it's set up.
+    (example_project / "deferred_assets.py").write_text(
+        "def add_stylesheet(app, config):\n"
+        "    config.html_css_files.append('deferred.css')\n"
+        "\n"
+        "def setup(app):\n"
+        "    app.connect('config-inited', add_stylesheet)\n"
+        "    return {'parallel_read_safe': True, 'parallel_write_safe': True}\n",
+    )
+    with (example_project / "conf.py").open("a") as conf:
+        conf.write(
+            "\ndefer_optional_extensions = True\n"
+            "\nimport sys\n"
+            "import canonical_sphinx.config\n"
+            "sys.path.insert(0, '.')\n"
+            "sys.modules['sphinxcontrib.jquery'] = __import__('deferred_assets')\n"
+            "canonical_sphinx.config.find_optional_extensions = (\n"
+            "    lambda app, packages: (['sphinxcontrib.jquery'], False)\n"
+            ")\n",
+        )
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            example_project,
+            build_dir,
+        ],
+        cwd=example_project,
+    )
+
+    index = build_dir / "index.html"
+    soup = bs4.BeautifulSoup(index.read_text(), features="lxml")
+    stylesheets = [link["href"] for link in soup.find_all("link", rel="stylesheet")]
+    assert "_static/deferred.css" in stylesheets
+
+
+def test_git_history_replaces_extension(example_project):
+    # The git history index, enabled in "conf.py", replaces the "last updated"
+    # extension when the optional extensions are set up.
+    (example_project / "last_updated.py").write_text(
+        "def setup(app):\n"
+        "    raise RuntimeError('the replaced extension was set up')\n",
+    )
+    with (example_project / "conf.py").open("a") as conf:
+        conf.write(
+            "\ngit_history_index = True\n"
+            "\nimport sys\n"
+            "import canonical_sphinx.config\n"
+            "sys.path.insert(0, '.')\n"
+            "sys.modules['sphinx_last_updated_by_git'] = __import__('last_updated')\n"
+            "canonical_sphinx.config.find_optional_extensions = (\n"
+            "    lambda app, packages: (['sphinx_last_updated_by_git'], False)\n"
+            ")\n",
+        )
+    subprocess.check_call(
+        ["sphinx-build", "-b", "html", example_project, example_project / "_build"],
+        cwd=example_project,
+    )
+
+
+def test_shared_doctree_cache(example_project, tmp_path):
+    # A page that isn't in any toctree, which the consistency check reports.
+    (example_project / "orphan.rst").write_text("Orphan\n======\n")
+    outputs = []
+    for build in ("cold", "reused"):
+        result = subprocess.run(
+            [
+                "sphinx-build",
+                "-b",
+                "html",
+                "-d",
+                tmp_path / build / "doctrees",
+                "-D",
+                f"shared_doctree_cache={tmp_path / 'cache'}",
+                example_project,
+                tmp_path / build / "html",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        outputs.append(result.stdout + result.stderr)
+
+    # Every document of the second build comes from the cache, and the build
+    # still saves its environment and checks its consistency
+    cold, reused = outputs
+    assert "reused 2 of 2 documents" in reused
+    assert (tmp_path / "reused" / "doctrees" / "environment.pickle").is_file()
+    for output in (cold, reused):
+        assert "document isn't included in any toctree" in output
+
+
+def test_bundle_theme_assets(example_project):
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "bundle_theme_assets=1",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    index = build_dir / "index.html"
+    soup = bs4.BeautifulSoup(index.read_text(), features="lxml")
+    stylesheets = [link["href"] for link in soup.find_all("link", rel="stylesheet")]
+    scripts = [script["src"] for script in soup.find_all("script", src=True)]
+
+    # The theme's files are replaced by one hashed bundle of each type
+    assert not any("custom.css" in href for href in stylesheets)
+    assert not any("header-nav.js" in src for src in scripts)
+    css = [href for href in stylesheets if "canonical-sphinx." in href]
+    js = [src for src in scripts if "canonical-sphinx." in src]
+    assert len(css) == len(js) == 1
+    assert (build_dir / css[0].split("?")[0]).is_file()
+    assert (build_dir / js[0].split("?")[0]).is_file()
+
+
+def test_bundle_theme_assets_order(example_project):
+    theme_files = {
+        "fonts.css": "theme.css",
+        "custom.css": "theme.css",
+        "header.css": "theme.css",
+        "github_issue_links.css": "theme.css",
+        "furo_colors.css": "theme.css",
+        "header-nav.js": "theme.js",
+        "github_issue_links.js": "theme.js",
+    }
+
+    def linked_files(build_dir):
+        soup = bs4.BeautifulSoup((build_dir / "index.html").read_text(), "lxml")
+        uris = [link["href"] for link in soup.find_all("link", rel="stylesheet")]
+        uris += [script["src"] for script in soup.find_all("script", src=True)]
+        names = []
+        for uri in uris:
+            name = uri.split("?")[0].rpartition("/")[2]
+            if name.startswith("canonical-sphinx."):
+                name = "theme" + Path(name).suffix
+            name = theme_files.get(name, name)
+            # The theme's files are replaced by one bundle of each type
+            if not names or names[-1] != name:
+                names.append(name)
+        return names
+
+    orders = []
+    for bundle in ("0", "1"):
+        build_dir = example_project / f"_build-{bundle}"
+        subprocess.check_call(
+            [
+                "sphinx-build",
+                "-b",
+                "html",
+                "-W",
+                "-D",
+                f"bundle_theme_assets={bundle}",
+                example_project,
+                build_dir,
+            ],
+        )
+        orders.append(linked_files(build_dir))
+
+    # The bundles take the place of the theme's files, after the project's
+    unbundled, bundled = orders
+    assert unbundled.index("example-css.css") < unbundled.index("theme.css")
+    assert bundled == unbundled
+
+
+def test_self_host_web_fonts(example_project):
+    pytest.importorskip("fontTools")
+    pytest.importorskip("brotli")
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "self_host_web_fonts=1",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    index = build_dir / "index.html"
+    soup = bs4.BeautifulSoup(index.read_text(), features="lxml")
+    preloads = [link["href"] for link in soup.find_all("link", rel="preload")]
+    assert preloads == ["_static/fonts/Ubuntu-R.woff2", "_static/fonts/Ubuntu-B.woff2"]
+    for href in preloads:
+        assert (build_dir / href).is_file()
+
+    stylesheets = [link["href"] for link in soup.find_all("link", rel="stylesheet")]
+    assert any("web-fonts.css" in href for href in stylesheets)
+    assert not any(href.startswith("_static/fonts.css") for href in stylesheets)
+
+
+def test_build_profile(example_project):
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-j",
+            "2",
+            "-D",
+            "build_profile=_profile/trace.json",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    trace = json.loads((example_project / "_profile" / "trace.json").read_text())
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert {"doctree-read", "html-page-context", "build-finished"} <= {
+        event["cat"] for event in events
+    }
+    assert any(event["args"]["docname"] == "index" for event in events)
+
+
+def test_memory_profile(example_project):
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "memory_profile=_profile/memory.json",
+            "-D",
+            "memory_profile_frames=5",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    report = json.loads((example_project / "_profile" / "memory.json").read_text())
+    assert [phase["phase"] for phase in report["phases"]] == [
+        "builder-inited",
+        "read",
+        "written",
+        "build-finished",
+    ]
+    assert all(phase["rss_peak"]["self"] > 0 for phase in report["phases"])
+    assert "sphinx.builders.html" in report["phases"][-1]["extensions"]
+    assert "domaindata.std" in {item["name"] for item in report["environment"]}
+    assert report["doctrees"]["largest"][0]["docname"] == "index"
+
+
+def test_nested_page_header(example_project):
+    (example_project / "guide").mkdir()
+    (example_project / "guide" / "page.rst").write_text("Page\n====\n")
+    index = example_project / "index.rst"
+    index.write_text(index.read_text() + "\n.. toctree::\n\n   guide/page\n")
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        ["sphinx-build", "-b", "html", "-W", example_project, build_dir],
+    )
+
+    # The cached header keeps the links relative to each page
+    for page, prefix in (("index.html", ""), ("guide/page.html", "../")):
+        soup = bs4.BeautifulSoup((build_dir / page).read_text(), features="lxml")
+        logo_img = soup.find("a", {"class": "p-logo"}).find("img")
+        assert logo_img.attrs["src"] == f"{prefix}_static/example-tag.png"
+
+
+def test_sharded_search(example_project):
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "sharded_search=1",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    manifest = json.loads((build_dir / "_static/search/index.json").read_text())
+    assert manifest["docs"][0] == ["Example project documentation", "index.html"]
+    for name in manifest["shards"].values():
+        assert (build_dir / "_static/search" / name).is_file()
+    assert (build_dir / "_static/search-worker.js").is_file()
+
+    index = build_dir / "index.html"
+    soup = bs4.BeautifulSoup(index.read_text(), features="lxml")
+    form = soup.find("form", class_="sidebar-search-container")
+    assert form["data-search-index"] == "_static/search/index.json"
+    assert soup.find("ul", class_="sidebar-search-results") is not None
+
+
+def test_instant_navigation(example_project):
+    (example_project / "page.rst").write_text("Page\n====\n")
+    index = example_project / "index.rst"
+    index.write_text(index.read_text() + "\n.. toctree::\n\n   page\n")
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "instant_navigation=1",
+            "-D",
+            "html_context.sequential_nav=both",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    soup = bs4.BeautifulSoup((build_dir / "index.html").read_text(), features="lxml")
+    related = [link["href"] for link in soup.select(".related-pages a")]
+    scripts = [script["src"] for script in soup.find_all("script", src=True)]
+
+    # The script prefetches the footer's links, within the budget
+    assert related == ["page.html"]
+    assert not soup.find_all("link", rel="prefetch")
+    assert any("instant-navigation.js" in src for src in scripts)
+    assert 'const instant_navigation = {"budget": 2097152, "swap": false};' in str(
+        soup,
+    )
+
+
+def test_external_navigation(example_project):
+    (example_project / "page.rst").write_text("Page\n====\n")
+    index = example_project / "index.rst"
+    index.write_text(index.read_text() + "\n.. toctree::\n\n   page\n")
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-b",
+            "html",
+            "-W",
+            "-D",
+            "external_navigation=1",
+            example_project,
+            build_dir,
+        ],
+    )
+
+    soup = bs4.BeautifulSoup((build_dir / "index.html").read_text(), features="lxml")
+    placeholder = soup.find("div", class_="canonical-navigation")
+    tree_path = build_dir / placeholder["data-navigation"]
+    tree = bs4.BeautifulSoup(tree_path.read_text(), features="lxml")
+
+    # The pages only link to the tree, which links to the pages
+    sidebar = soup.find("div", class_="sidebar-tree")
+    assert sidebar.find("a", href="page.html") is None
+    assert tree.find("a", href="../page.html") is not None
+
+
+def test_runtime_site_config(example_project):
+    build_dirs = []
+    for branch in ("main", "1.0"):
+        build_dir = example_project / f"_build-{branch}"
+        env = {
+            **os.environ,
+            "READTHEDOCS": "True",
+            "READTHEDOCS_CANONICAL_URL": "https://docs.example.com/",
+            "READTHEDOCS_VERSION_TYPE": "branch",
+            "READTHEDOCS_GIT_IDENTIFIER": branch,
+        }
+        subprocess.check_call(
+            [
+                "sphinx-build",
+                "-b",
+                "html",
+                "-W",
+                "-D",
+                "runtime_site_config=1",
+                "-D",
+                "html_theme_options.source_edit_link=https://github.com/example/project",
+                example_project,
+                build_dir,
+            ],
+            env=env,
+        )
+        build_dirs.append(build_dir)
+
+    # The pages are the same, and only the site config has the branch
+    main, release = build_dirs
+    assert (main / "index.html").read_bytes() == (release / "index.html").read_bytes()
+    site_config = json.loads((release / "_static/site-config.json").read_text())
+    assert site_config["build_branch"] == "1.0"
+
+    soup = bs4.BeautifulSoup((release / "index.html").read_text(), features="lxml")
+    link = soup.select_one(".edit-this-page a")
+    edit_link = (
+        "https://github.com/example/project/edit/{branch}/example/docs/index.rst"
+    )
+    assert link["href"] == edit_link.format(branch="main")
+    assert link["data-branch-link"] == edit_link
+    assert "const github_url" not in str(soup)
+
+
+def _has_mylatexformat() -> bool:
+    if not shutil.which("xelatex") or not shutil.which("kpsewhich"):
+        return False
+    result = subprocess.run(
+        ["kpsewhich", "mylatexformat.ltx"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return bool(result.stdout.strip())
+
+
+@pytest.mark.skipif(
+    not _has_mylatexformat(),
+    reason="Skipping because xelatex or mylatexformat isn't installed.",
+)
+def test_latex_precompiled_preamble(example_project):
+    build_dir = example_project / "_build"
+    subprocess.check_call(
+        [
+            "sphinx-build",
+            "-M",
+            "latexpdf",
+            example_project,
+            build_dir,
+            "-D",
+            "latex_precompiled_preamble=1",
+        ],
+    )
+
+    latex_dir = build_dir / "latex"
+    (tex,) = latex_dir.glob("*.tex")
+    first_line = tex.read_text().partition("\n")[0]
+    assert first_line.startswith("%&canonical-preamble-")
+    name = first_line.removeprefix("%&")
+    assert (latex_dir / f"{name}.fmt").is_file()
+
+    # The PDF is compiled with the format
+    log = tex.with_suffix(".log").read_text(errors="replace")
+    assert f"format={name}" in log.partition("\n")[0]
+    assert tex.with_suffix(".pdf").is_file()
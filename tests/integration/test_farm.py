@@ -0,0 +1,120 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Integration tests for builds of several versions and languages."""
+import json
+import shutil
+import subprocess
+
+import bs4
+import pytest
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", repo, *args], check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(request, tmp_path):
+    repo = tmp_path / "repo"
+    shutil.copytree(request.config.rootpath / "example", repo / "docs")
+    (repo / "docs" / "guide.rst").write_text("Guide\n=====\n\nA guide.\n")
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    git(repo, "-c", "user.name=x", "-c", "user.email=x@x", "commit", "-qm", "1")
+    git(repo, "tag", "1.0")
+    (repo / "docs" / "guide.rst").write_text("Guide\n=====\n\nA new guide.\n")
+    git(repo, "-c", "user.name=x", "-c", "user.email=x@x", "commit", "-qam", "2")
+    git(repo, "tag", "2.0")
+    return repo
+
+
+def test_farm(repo, tmp_path):
+    outdir = tmp_path / "site"
+    subprocess.check_call(
+        [
+            "canonical-sphinx-farm",
+            repo,
+            outdir,
+            "--target",
+            "1.0",
+            "--target",
+            "2.0",
+            "--base-url",
+            "https://docs.example.com/",
+            "-j",
+            "2",
+        ],
+    )
+
+    for version, text in [("1.0", "A guide."), ("2.0", "A new guide.")]:
+        guide = outdir / "en" / version / "guide.html"
+        assert text in guide.read_text()
+
+        # The 404 page links to the assets of its own version, under the slug
+        page = bs4.BeautifulSoup(
+            (outdir / "en" / version / "404.html").read_text(),
+            features="lxml",
+        )
+        stylesheets = [link["href"] for link in page.find_all("link", rel="stylesheet")]
+        assert any(
+            href.startswith(f"/example_project/en/{version}/_static/")
+            for href in stylesheets
+        )
+
+    # The second version reused the unchanged page that the first one read
+    log = (tmp_path / "site.farm" / "logs" / "en-2.0.log").read_text()
+    assert "reused 1 of 2 documents" in log
+
+
+def test_farm_shared_static(repo, tmp_path):
+    outdir = tmp_path / "site"
+    subprocess.check_call(
+        [
+            "canonical-sphinx-farm",
+            repo,
+            outdir,
+            "--target",
+            "1.0",
+            "--target",
+            "2.0",
+            "--shared-static",
+        ],
+    )
+
+    links = {}
+    for version in ["1.0", "2.0"]:
+        page = bs4.BeautifulSoup(
+            (outdir / "en" / version / "index.html").read_text(),
+            features="lxml",
+        )
+        links[version] = {
+            link["href"]
+            for link in page.find_all("link", rel="stylesheet")
+            if link["href"].startswith("/_canonical_static/")
+        }
+        # Every shared asset that the page links to is in the shared directory
+        assert links[version]
+        for href in links[version]:
+            assert (outdir / href.lstrip("/")).is_file()
+        assert not (outdir / "en" / version / "_static" / "custom.css").exists()
+
+    # Both versions link to the same copies of the theme's stylesheets
+    assert links["1.0"] == links["2.0"]
+    manifest = json.loads((outdir / "_canonical_static" / "manifest.json").read_text())
+    assert sorted(manifest["builds"]) == [
+        "/example_project/en/1.0/",
+        "/example_project/en/2.0/",
+    ]
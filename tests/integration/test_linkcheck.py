@@ -0,0 +1,125 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Integration tests for the cached link checks."""
+import collections
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+PAGES = {"/page": "v1", "/other": "v1"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = collections.Counter()
+    not_modified = collections.Counter()
+
+    def do_HEAD(self):  # noqa: N802
+        self.requests[self.path] += 1
+        etag = PAGES.get(self.path)
+        if etag is None:
+            self.send_response(404)
+        elif self.headers.get("If-None-Match") == etag:
+            self.not_modified[self.path] += 1
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.requests.clear()
+    Handler.not_modified.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture
+def project(tmp_path, server):
+    project = tmp_path / "docs"
+    project.mkdir()
+    (project / "conf.py").write_text(
+        'project = "Links"\n'
+        'extensions = ["canonical_sphinx"]\n'
+        "linkcheck_cache = True\n",
+    )
+    (project / "index.rst").write_text(
+        "Links\n=====\n\n"
+        f"`Page <{server}/page>`_, `other <{server}/other>`_ and "
+        f"`missing <{server}/missing>`_.\n\n.. toctree::\n\n   more\n",
+    )
+    (project / "more.rst").write_text(f"More\n====\n\n`Page <{server}/page>`_\n")
+    return project
+
+
+def linkcheck(project, *options):
+    build = subprocess.run(
+        ["sphinx-build", "-b", "linkcheck", *options, project, project / "_build"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    results = [
+        json.loads(line)
+        for line in (project / "_build" / "output.json").read_text().splitlines()
+    ]
+    return build, sorted((result["uri"], result["status"]) for result in results)
+
+
+def test_linkcheck_cache(project, server):
+    build, first = linkcheck(project)
+
+    assert build.returncode == 1
+    assert first == [
+        (f"{server}/missing", "broken"),
+        (f"{server}/other", "working"),
+        (f"{server}/page", "working"),
+    ]
+    # Each link is checked once, although two documents link to the page
+    assert Handler.requests["/page"] == 1
+
+    Handler.requests.clear()
+    build, second = linkcheck(project)
+
+    # The results are the same, without any requests
+    assert second == first
+    assert sum(Handler.requests.values()) == 0
+    assert "reused 3 of 3 link check results" in build.stdout
+
+
+def test_linkcheck_cache_revalidates(project, server):
+    linkcheck(project)
+    PAGES["/other"] = "v2"
+    try:
+        # Results expire at once
+        build, results = linkcheck(project, "-D", "linkcheck_cache_ttl.working=0")
+    finally:
+        PAGES["/other"] = "v1"
+
+    assert (f"{server}/page", "working") in results
+    assert Handler.not_modified == {"/page": 1}
+    assert Handler.requests["/other"] == 2
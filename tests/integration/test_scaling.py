@@ -0,0 +1,39 @@
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Integration tests for the parallel build scaling harness."""
+import json
+import subprocess
+
+
+def test_scaling(request, tmp_path):
+    output = tmp_path / "scaling.json"
+    subprocess.check_call(
+        [
+            "canonical-sphinx-scaling",
+            tmp_path / "builds",
+            "--project",
+            request.config.rootpath / "example",
+            "--max-jobs",
+            "2",
+            "--output",
+            output,
+        ],
+    )
+
+    results = json.loads(output.read_text())
+    (docset,) = results["docsets"]
+    assert docset["name"] == "example"
+    assert [run["jobs"] for run in docset["runs"]] == [1, 2]
+    # The parallel build writes the same files as the serial build
+    assert all(run["identical"] for run in docset["runs"])
@@ -0,0 +1,129 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Integration tests for the spelling builder."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+# A stand-in for Aspell, which doesn't know the words that contain "zz".
+FAKE_ASPELL = """\
+import os
+import sys
+
+if "--version" in sys.argv:
+    sys.exit()
+with open(os.environ["FAKE_ASPELL_LOG"], "a") as log:
+    log.write("call\\n")
+print("\\n".join(word for word in sys.stdin.read().split() if "zz" in word))
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    (bindir / "aspell").write_text(f"#!{sys.executable}\n{FAKE_ASPELL}")
+    (bindir / "aspell").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_ASPELL_LOG", str(tmp_path / "aspell.log"))
+
+    project = tmp_path / "docs"
+    project.mkdir()
+    (project / "conf.py").write_text(
+        'project = "Spelling"\nextensions = ["canonical_sphinx"]\n',
+    )
+    (project / ".wordlist.txt").write_text("Jazz\n")
+    (project / "index.rst").write_text(
+        "Index\n=====\n\nSome fizzy Jazz.\n\n.. toctree::\n\n   guide\n",
+    )
+    (project / "guide.rst").write_text("Guide\n=====\n\nThe ``buzz`` guide.\n")
+    return project
+
+
+def spellcheck(project):
+    return subprocess.run(
+        ["sphinx-build", "-b", "canonical-spelling", project, project / "_build"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+def calls(project):
+    log = project.parent / "aspell.log"
+    count = len(log.read_text().splitlines()) if log.exists() else 0
+    log.unlink(missing_ok=True)
+    return count
+
+
+def test_spelling(project):
+    build = spellcheck(project)
+
+    assert build.returncode == 1
+    assert (project / "_build" / "output.txt").read_text() == (
+        "Misspelled words:\n"
+        "<spelling> index.rst\n" + "-" * 80 + "\nfizzy\n" + "-" * 80 + "\n\n"
+        "!!!Spelling check failed!!!\n"
+    )
+    assert calls(project) == 2
+
+    # Nothing changed, so nothing is checked again
+    build = spellcheck(project)
+    assert build.returncode == 1
+    assert calls(project) == 0
+
+    (project / "index.rst").write_text(
+        "Index\n=====\n\nSome fine Jazz.\n\n.. toctree::\n\n   guide\n",
+    )
+    build = spellcheck(project)
+    assert build.returncode == 0
+    assert "Spelling check passed :)" in build.stdout
+    assert calls(project) == 1
+
+
+# The builder and some of the config values that sphinxcontrib-spelling
+# registers, which needs the Enchant library to be imported.
+SPELLING_EXTENSION = """\
+from sphinx.builders.dummy import DummyBuilder
+
+
+class SpellingBuilder(DummyBuilder):
+    name = "spelling"
+
+
+def setup(app):
+    app.add_builder(SpellingBuilder)
+    app.add_config_value("spelling_lang", "en_US", "env")
+    app.add_config_value("spelling_word_list_filename", None, "env")
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
+"""
+
+
+def test_spelling_with_sphinxcontrib_spelling(project):
+    (project / "spelling_extension.py").write_text(SPELLING_EXTENSION)
+    (project / "conf.py").write_text(
+        f"import sys\nsys.path.insert(0, {str(project)!r})\n"
+        'project = "Spelling"\n'
+        'extensions = ["canonical_sphinx", "spelling_extension"]\n',
+    )
+
+    build = spellcheck(project)
+
+    assert "ExtensionError" not in build.stderr
+    assert build.returncode == 1
+    assert "fizzy" in (project / "_build" / "output.txt").read_text()
@@ -0,0 +1,105 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+from unittest import mock
+
+import canonical_sphinx
+import pytest
+from canonical_sphinx import assets
+
+
+@pytest.fixture
+def src(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "font.ttf").write_bytes(b"font")
+    (src / "sub" / "logo.png").write_bytes(b"logo")
+    return src
+
+
+def test_sync_directory(src, tmp_path):
+    dst = tmp_path / "dst"
+
+    written = assets.sync_directory(src, dst)
+
+    assert sorted(written) == [dst / "font.ttf", dst / "sub" / "logo.png"]
+    assert (dst / "sub" / "logo.png").read_bytes() == b"logo"
+    assert assets.sync_directory(src, dst) == []
+
+
+def test_sync_directory_same_contents(src, tmp_path):
+    dst = tmp_path / "dst"
+    assets.sync_directory(src, dst)
+    os.utime(dst / "font.ttf", ns=(0, 0))
+
+    assert assets.sync_directory(src, dst) == []
+    # The mtime is aligned so the next check doesn't need to hash the file
+    assert (dst / "font.ttf").stat().st_mtime_ns == (
+        src / "font.ttf"
+    ).stat().st_mtime_ns
+
+
+def test_sync_directory_changed(src, tmp_path):
+    dst = tmp_path / "dst"
+    assets.sync_directory(src, dst)
+    (dst / "font.ttf").write_bytes(b"FONT")
+
+    assert assets.sync_directory(src, dst) == [dst / "font.ttf"]
+    assert (dst / "font.ttf").read_bytes() == b"font"
+
+
+def test_sync_directory_hardlink(src, tmp_path):
+    dst = tmp_path / "dst"
+
+    assets.sync_directory(src, dst, hardlink=True)
+
+    assert (dst / "font.ttf").samefile(src / "font.ttf")
+
+
+def test_place_file_copy_fallback(src, tmp_path, mocker):
+    mocker.patch.object(assets, "_reflink", side_effect=OSError)
+    dst = tmp_path / "font.ttf"
+
+    assert assets.place_file(src / "font.ttf", dst) == "copy"
+    assert dst.read_bytes() == b"font"
+    assert not dst.samefile(src / "font.ttf")
+
+
+@pytest.mark.parametrize(
+    ("builder_format", "copied"),
+    [("latex", True), ("html", False)],
+)
+def test_copy_custom_files(tmp_path, builder_format, copied):
+    app = mock.Mock(canonical_sphinx.Sphinx)
+    app.builder = mock.Mock(format=builder_format)
+    app.config = mock.Mock(
+        hardlink_pdf_assets=False,
+        subset_pdf_fonts=False,
+        optimize_images=False,
+    )
+    app.outdir = tmp_path
+
+    canonical_sphinx.copy_custom_files(app)
+
+    assert (tmp_path / "Ubuntu-R.ttf").is_file() is copied
+
+
+def test_sync_directory_exclude(src, tmp_path):
+    dst = tmp_path / "dst"
+
+    written = assets.sync_directory(src, dst, exclude=["sub/logo.png"])
+
+    assert written == [dst / "font.ttf"]
@@ -0,0 +1,54 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import pytest
+from canonical_sphinx import benchmark
+
+
+@pytest.mark.parametrize("source_format", ["rst", "md"])
+def test_generate_docset(tmp_path, source_format):
+    spec = benchmark.DocsetSpec(pages=20, source_format=source_format)
+
+    benchmark.generate_docset(spec, tmp_path)
+
+    assert (tmp_path / "conf.py").is_file()
+    assert (tmp_path / f"index.{source_format}").is_file()
+    pages = list((tmp_path / "pages").glob(f"*.{source_format}"))
+    assert len(pages) == 20
+
+
+def test_generate_docset_toctree(tmp_path):
+    spec = benchmark.DocsetSpec(pages=10, toctree_depth=1)
+
+    benchmark.generate_docset(spec, tmp_path)
+
+    # With a depth of one, the root document lists every page
+    index = (tmp_path / "index.rst").read_text()
+    assert index.count("/pages/page-") == 10
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        benchmark.DocsetSpec(pages=9),
+        benchmark.DocsetSpec(pages=20001),
+        benchmark.DocsetSpec(source_format="txt"),
+        benchmark.DocsetSpec(toctree_depth=0),
+        benchmark.DocsetSpec(images=-1),
+    ],
+)
+def test_invalid_spec(tmp_path, spec):
+    with pytest.raises(ValueError):  # noqa: PT011
+        benchmark.generate_docset(spec, tmp_path)
@@ -0,0 +1,75 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import pytest
+from canonical_sphinx import bundle
+
+
+@pytest.fixture
+def sources(tmp_path):
+    sources = tmp_path / "static"
+    sources.mkdir()
+    (sources / "a.css").write_text("/* A */\nbody  >  p {\n  color: red;\n}\n")
+    (sources / "b.css").write_text('a::after { content: "  /* kept */  "; }\n')
+    (sources / "a.js").write_text("// A\nvar url = 'https://example.com';\n")
+    return sources
+
+
+def test_minify_css():
+    css = 'a , b  >  c {\n  color: red; /* x */\n}\n.d::after { content: " ; " }'
+
+    assert bundle.minify_css(css) == 'a,b>c{color: red}.d::after{content: " ; "}'
+
+
+def test_minify_js():
+    js = "// comment\nvar x = `a\n  b`;  /* c */\n\n    if (x) {\n  y() // z\n}\n"
+
+    assert bundle.minify_js(js) == "var x = `a\n  b`;\nif (x) {\ny()\n}"
+
+
+def test_build_bundle(sources, tmp_path):
+    cache_dir = tmp_path / "cache"
+
+    directory, names = bundle.build_bundle(
+        sources,
+        ["a.css", "b.css"],
+        ["a.js"],
+        cache_dir,
+    )
+
+    css_name, js_name = names
+    assert css_name.startswith("canonical-sphinx.")
+    assert css_name.endswith(".css")
+    assert (directory / css_name).read_text() == (
+        'body>p{color: red}\na::after{content: "  /* kept */  "}'
+    )
+    assert (directory / js_name).read_text() == "var url = 'https://example.com';"
+    assert bundle.build_bundle(
+        sources,
+        ["a.css", "b.css"],
+        ["a.js"],
+        cache_dir,
+    ) == (directory, names)
+
+
+def test_build_bundle_changed(sources, tmp_path):
+    cache_dir = tmp_path / "cache"
+    _, names = bundle.build_bundle(sources, ["a.css"], [], cache_dir)
+
+    (sources / "a.css").write_text("body { color: blue; }")
+    directory, new_names = bundle.build_bundle(sources, ["a.css"], [], cache_dir)
+
+    assert new_names != names
+    assert (directory / new_names[0]).read_text() == "body{color: blue}"
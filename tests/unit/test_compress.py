@@ -0,0 +1,119 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import gzip
+import os
+from unittest import mock
+
+import pytest
+from canonical_sphinx import compress
+
+TEXT = "<p>Some text that compresses well.</p>\n" * 100
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(compress.Sphinx)
+    app.builder = mock.Mock(format="html")
+    app.config = mock.Mock(precompress_output=True, epub_build=False)
+    app.confdir = tmp_path
+    app.outdir = tmp_path / "build"
+    (app.outdir / "_static").mkdir(parents=True)
+    (app.outdir / "index.html").write_text(TEXT)
+    (app.outdir / "_static" / "searchindex.js").write_text(TEXT)
+    (app.outdir / "_static" / "small.css").write_text("p{}")
+    (app.outdir / "_static" / "logo.png").write_bytes(os.urandom(2048))
+    return app
+
+
+def test_precompress_output(app):
+    compress.precompress_output(app, None)
+
+    assert gzip.decompress((app.outdir / "index.html.gz").read_bytes()) == (
+        TEXT.encode()
+    )
+    assert (app.outdir / "_static" / "searchindex.js.gz").is_file()
+    assert not (app.outdir / "_static" / "small.css.gz").exists()
+    assert not (app.outdir / "_static" / "logo.png.gz").exists()
+
+
+def test_precompress_output_brotli(app):
+    brotli = pytest.importorskip("brotli")
+
+    compress.precompress_output(app, None)
+
+    assert brotli.decompress((app.outdir / "index.html.br").read_bytes()) == (
+        TEXT.encode()
+    )
+
+
+def test_precompress_output_incremental(app, mocker):
+    compress.precompress_output(app, None)
+    compress_file = mocker.spy(compress, "compress_file")
+
+    compress.precompress_output(app, None)
+    assert compress_file.call_count == 0
+
+    # Rewritten files are compressed again
+    index = app.outdir / "index.html"
+    index.write_text(TEXT * 2)
+    stat = index.stat()
+    os.utime(index, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    compress.precompress_output(app, None)
+    compress_file.assert_called_once()
+    assert gzip.decompress((app.outdir / "index.html.gz").read_bytes()) == (
+        TEXT.encode() * 2
+    )
+
+
+def test_precompress_output_incompressible(app, mocker):
+    data = app.outdir / "_static" / "data.js"
+    data.write_bytes(os.urandom(2048))
+    compress.precompress_output(app, None)
+    assert not (app.outdir / "_static" / "data.js.gz").exists()
+    compress_file = mocker.spy(compress, "compress_file")
+
+    # Files that didn't compress aren't compressed again until they change
+    compress.precompress_output(app, None)
+    assert compress_file.call_count == 0
+
+    stat = data.stat()
+    os.utime(data, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    compress.precompress_output(app, None)
+    compress_file.assert_called_once()
+
+
+def test_precompress_output_pool(app, mocker):
+    mocker.patch.object(compress, "MIN_POOL_FILES", 1)
+    mocker.patch.object(compress.os, "cpu_count", return_value=2)
+
+    compress.precompress_output(app, None)
+
+    assert (app.outdir / "index.html.gz").is_file()
+    assert (app.outdir / "_static" / "searchindex.js.gz").is_file()
+
+
+@pytest.mark.parametrize(
+    ("builder_format", "enabled", "epub_build"),
+    [("latex", True, False), ("html", False, False), ("html", True, True)],
+)
+def test_precompress_output_skipped(app, builder_format, enabled, epub_build):
+    app.builder.format = builder_format
+    app.config.precompress_output = enabled
+    app.config.epub_build = epub_build
+
+    compress.precompress_output(app, None)
+
+    assert not (app.outdir / "index.html.gz").exists()
@@ -0,0 +1,152 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import mock
+
+import pytest
+from canonical_sphinx import config
+from sphinx.events import EventListener
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(config.Sphinx)
+    app.confdir = tmp_path
+    app.config = mock.Mock()
+    return app
+
+
+def test_find_optional_extensions(app, mocker):
+    find_spec = mocker.patch.object(
+        config.importlib.util,
+        "find_spec",
+        side_effect=lambda name: object() if name == "present" else None,
+    )
+
+    found, cached = config.find_optional_extensions(app, ["present", "missing"])
+    assert found == ["present"]
+    assert not cached
+    assert find_spec.call_count == 2
+
+    found, cached = config.find_optional_extensions(app, ["present", "missing"])
+    assert found == ["present"]
+    assert cached
+    assert find_spec.call_count == 2
+
+
+def test_find_optional_extensions_invalidated(app, mocker):
+    find_spec = mocker.patch.object(config.importlib.util, "find_spec")
+    config.find_optional_extensions(app, ["package"])
+
+    mocker.patch.object(config.sys, "path", [*config.sys.path, "/new/site-packages"])
+    _, cached = config.find_optional_extensions(app, ["package"])
+
+    assert not cached
+    assert find_spec.call_count == 2
+
+
+def test_find_optional_extensions_module_not_found(app, mocker):
+    mocker.patch.object(
+        config.importlib.util,
+        "find_spec",
+        side_effect=ModuleNotFoundError,
+    )
+
+    found, _ = config.find_optional_extensions(app, ["canonical.missing"])
+
+    assert found == []
+
+
+def test_setup_deferred_extensions(app):
+    handler = mock.Mock()
+    app.builder = mock.Mock(format="html")
+    app.config = mock.Mock(html_css_files=[], html_js_files=[])
+    app.extensions = {}
+    app.events = mock.Mock(listeners={"config-inited": [], "builder-inited": []})
+
+    def setup_extension(name):
+        app.events.listeners["builder-inited"].append(
+            EventListener(1, handler, 500),
+        )
+
+    app.setup_extension.side_effect = setup_extension
+
+    config.setup_deferred_extensions(
+        app,
+        ["sphinx_copybutton", "sphinxcontrib.cairosvgconverter"],
+    )
+
+    app.setup_extension.assert_called_once_with("sphinx_copybutton")
+    handler.assert_called_once_with(app)
+
+
+def test_record_config_fingerprint(app, caplog):
+    app.builder = mock.Mock()
+    app.builder.name = "html"
+    app.config = mock.Mock(
+        spec=[name for names in config.DERIVED_OUTPUTS.values() for name in names],
+    )
+    app.config.myst_enable_extensions = {"deflist", "substitution"}
+    app.config.html_context = {"build_branch": "main"}
+    app.config.notfound_urls_prefix = ""
+    config.record_config_fingerprint(app)
+    fingerprint = config.load_json(
+        app.confdir / ".sphinx/cache/config-fingerprint.json",
+    )
+
+    app.config.myst_enable_extensions = {"substitution", "deflist"}
+    app.config.notfound_urls_prefix = "/docs/"
+    with caplog.at_level("INFO"):
+        config.record_config_fingerprint(app)
+
+    assert list(fingerprint) == ["html"]
+    assert "configuration changes affect: 404 page" in caplog.text
+
+
+@pytest.mark.parametrize(
+    ("slug", "environ", "expected"),
+    [
+        ("", {}, ""),
+        ("lxd", {}, "/lxd/"),
+        (
+            "",
+            {
+                "READTHEDOCS_CANONICAL_URL": "https://example.com/en/1.0/",
+                "READTHEDOCS_VERSION": "1.0",
+                "READTHEDOCS_LANGUAGE": "en",
+            },
+            "/en/1.0/",
+        ),
+        (
+            "lxd",
+            {
+                "READTHEDOCS_CANONICAL_URL": "https://example.com/lxd/en/latest/",
+                "READTHEDOCS_VERSION": "latest",
+            },
+            "/lxd/latest/",
+        ),
+        # The version isn't in the URL
+        (
+            "",
+            {
+                "READTHEDOCS_CANONICAL_URL": "https://example.com/",
+                "READTHEDOCS_VERSION": "latest",
+            },
+            "",
+        ),
+    ],
+)
+def test_url_prefix(slug, environ, expected):
+    assert config.url_prefix(slug, environ) == expected
@@ -0,0 +1,155 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+from unittest import mock
+
+import pytest
+from canonical_sphinx import doctreecache
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(doctreecache.Sphinx)
+    app.srcdir = tmp_path / "docs"
+    app.srcdir.mkdir()
+    app.doctreedir = tmp_path / "doctrees"
+    app.config = mock.Mock(version="1.0", release="1.0.1", today="")
+    app.env = mock.Mock(found_docs={"index", "guide"})
+    return app
+
+
+@pytest.fixture
+def cache(app, tmp_path, mocker):
+    mocker.patch.object(doctreecache, "environment_key", return_value="env")
+    return doctreecache.DoctreeCache(app, tmp_path / "cache")
+
+
+def _add_entry(cache, app, **entry):
+    source = app.srcdir / "index.rst"
+    source.write_text("Index\n=====\n")
+    (app.srcdir / "snippet.txt").write_text("snippet")
+    blob = app.srcdir.parent / "blob"
+    blob.write_bytes(b"doctree")
+    digest = cache._store_blob(blob)
+    env = mock.Mock(doc2path=lambda docname: app.srcdir / f"{docname}.rst")
+    path = cache._entry_path(env, "index")
+    path.parent.mkdir(parents=True)
+    path.write_text(
+        json.dumps(
+            {
+                "doctree": digest,
+                "environment": digest,
+                "dependencies": {
+                    "snippet.txt": doctreecache.file_digest(app.srcdir / "snippet.txt"),
+                },
+                "versioned": {},
+                "found_docs": None,
+                **entry,
+            },
+        ),
+    )
+    return env
+
+
+def test_lookup(cache, app):
+    env = _add_entry(cache, app)
+    (app.srcdir / "guide.rst").write_text("Guide\n=====\n")
+
+    assert cache.lookup(env, "index")["doctree"]
+    assert cache.lookup(env, "guide") is None
+
+
+def test_lookup_changed_source(cache, app):
+    env = _add_entry(cache, app)
+    (app.srcdir / "index.rst").write_text("Other\n=====\n")
+
+    assert cache.lookup(env, "index") is None
+
+
+def test_lookup_changed_dependency(cache, app):
+    env = _add_entry(cache, app)
+    (app.srcdir / "snippet.txt").write_text("other snippet")
+
+    assert cache.lookup(env, "index") is None
+
+
+def test_lookup_version(cache, app):
+    env = _add_entry(cache, app, versioned={"release": "1.0.0"})
+
+    # The document contains the release of the build that read it
+    assert cache.lookup(env, "index") is None
+    app.config.release = "1.0.0"
+    assert cache.lookup(env, "index") is not None
+
+
+def test_lookup_glob_toctree(cache, app):
+    env = _add_entry(cache, app, found_docs="other documents")
+
+    assert cache.lookup(env, "index") is None
+
+
+def test_before_read(cache, app, mocker):
+    mocker.patch.object(cache, "lookup", side_effect=[{"doctree": "a"}, None])
+    mocker.patch.object(cache, "restore")
+    app._warncount = 3
+    docnames = ["index", "guide"]
+
+    doctreecache.before_read(app, app.env, docnames, cache)
+
+    assert docnames == ["guide"]
+    cache.restore.assert_called_once_with(app.env, {"index": {"doctree": "a"}})
+    assert cache.read == ["guide"]
+    assert cache.restored == ["index"]
+
+
+def test_store_doctrees_with_warnings(cache, app, mocker):
+    mocker.patch.object(cache, "store")
+    cache.warnings = 3
+    app._warncount = 4
+
+    cache.restored = ["index"]
+
+    # The restored documents are still updated
+    assert doctreecache.store_doctrees(app, app.env, cache) == ["index"]
+    cache.store.assert_not_called()
+
+
+def test_setup_doctree_cache(app, mocker):
+    mocker.patch.object(doctreecache, "environment_key", return_value="env")
+    app.config.shared_doctree_cache = "cache"
+    app.confdir = app.srcdir
+    app.extensions = {"safe": mock.Mock(parallel_read_safe=True)}
+
+    doctreecache.setup_doctree_cache(app)
+
+    assert [call.args[0] for call in app.connect.call_args_list] == [
+        "env-before-read-docs",
+        "env-updated",
+    ]
+
+
+def test_setup_doctree_cache_unsafe_extension(app, mocker):
+    logger = mocker.patch.object(doctreecache, "logger")
+    app.config.shared_doctree_cache = "cache"
+    app.extensions = {
+        "safe": mock.Mock(parallel_read_safe=True),
+        "unsafe": mock.Mock(parallel_read_safe=None),
+    }
+
+    doctreecache.setup_doctree_cache(app)
+
+    app.connect.assert_not_called()
+    assert "unsafe" in logger.warning.call_args.args
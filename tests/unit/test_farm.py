@@ -0,0 +1,73 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import argparse
+
+import pytest
+from canonical_sphinx import config, farm
+
+
+@pytest.mark.parametrize(
+    ("ref", "expected"),
+    [("1.0", "1.0"), ("Main", "main"), ("feature/new-page", "feature-new-page")],
+)
+def test_version_slug(ref, expected):
+    assert farm.version_slug(ref) == expected
+
+
+def test_version_slug_empty():
+    with pytest.raises(ValueError, match="version slug"):
+        farm.version_slug("//")
+
+
+def test_parse_target():
+    assert farm.parse_target("1.0") == farm.Target("1.0", "en")
+    assert farm.parse_target("release/2.0:fr") == farm.Target("release/2.0", "fr")
+    with pytest.raises(argparse.ArgumentTypeError):
+        farm.parse_target(":fr")
+
+
+def test_target_environ():
+    target = farm.Target("release/2.0", "fr")
+
+    environ = farm.target_environ(target, "https://docs.example.com/lxd")
+
+    assert environ["READTHEDOCS_CANONICAL_URL"] == (
+        "https://docs.example.com/lxd/fr/release-2.0/"
+    )
+    # The URL prefix of the 404 page is derived from the same variables
+    assert config.url_prefix("lxd", environ) == "/lxd/fr/release-2.0/"
+
+
+def test_run_farm_seeds_each_language(mocker, tmp_path):
+    mocker.patch.object(farm, "checkout")
+    built = []
+    mocker.patch.object(
+        farm,
+        "build_target",
+        side_effect=lambda target, *_: built.append(target) or tmp_path,
+    )
+    targets = [
+        farm.Target("1.0"),
+        farm.Target("2.0"),
+        farm.Target("1.0", "fr"),
+        farm.Target("2.0", "fr"),
+    ]
+
+    farm.run_farm(tmp_path / "repo", tmp_path / "site", targets, jobs=1)
+
+    assert set(built[:2]) == {farm.Target("1.0"), farm.Target("1.0", "fr")}
+    assert set(built[2:]) == {farm.Target("2.0"), farm.Target("2.0", "fr")}
+    assert farm.checkout.call_count == 2
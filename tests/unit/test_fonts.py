@@ -0,0 +1,112 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import mock
+
+import pytest
+from canonical_sphinx import fonts
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(fonts.Sphinx)
+    app.builder = mock.Mock(format="latex")
+    app.config = mock.Mock(subset_pdf_fonts=True)
+    app.confdir = tmp_path / "source"
+    app.outdir = tmp_path / "build"
+    app.outdir.mkdir()
+    (app.outdir / "doc.tex").write_text("Привет \\section{Ω}")
+    return app
+
+
+def test_collect_characters(app):
+    characters = fonts.collect_characters(app.outdir)
+
+    assert {"П", "Ω", "\\"} <= characters
+    assert characters >= fonts.BASE_CHARACTERS
+
+
+def test_subset_pdf_fonts(app):
+    pytest.importorskip("fontTools")
+    from fontTools.ttLib import TTFont
+
+    fonts.subset_pdf_fonts(app, None)
+
+    for name in fonts.FONT_FILES:
+        subset = app.outdir / name
+        assert subset.stat().st_size < (fonts.pdf_dir / name).stat().st_size
+    cmap = TTFont(app.outdir / "Ubuntu-R.ttf").getBestCmap()
+    assert ord("П") in cmap
+    assert ord("Ж") not in cmap
+
+    # The second build reuses the cached subsets
+    cached = sorted((app.confdir / ".sphinx" / "cache" / "fonts").iterdir())
+    fonts.subset_pdf_fonts(app, None)
+    assert sorted((app.confdir / ".sphinx" / "cache" / "fonts").iterdir()) == cached
+
+
+@pytest.mark.parametrize(
+    ("builder_format", "enabled", "exception"),
+    [("html", True, None), ("latex", False, None), ("latex", True, Exception())],
+)
+def test_subset_pdf_fonts_skipped(app, builder_format, enabled, exception):
+    app.builder.format = builder_format
+    app.config.subset_pdf_fonts = enabled
+
+    fonts.subset_pdf_fonts(app, exception)
+
+    assert not (app.outdir / "Ubuntu-R.ttf").exists()
+
+
+def test_subsetting_enabled_without_fonttools(app, mocker):
+    mocker.patch.object(fonts.importlib.util, "find_spec", return_value=None)
+
+    assert not fonts.subsetting_enabled(app)
+
+
+def test_collect_html_characters(app):
+    (app.outdir / "sub").mkdir()
+    (app.outdir / "sub" / "index.html").write_text("<p>&Omega; Ж</p>")
+
+    characters = fonts.collect_html_characters(app.outdir)
+
+    assert {"Ω", "Ж", "<"} <= characters
+    # LaTeX sources aren't part of the site
+    assert "П" not in characters
+
+
+def test_write_web_fonts(app):
+    pytest.importorskip("fontTools")
+    pytest.importorskip("brotli")
+    from fontTools.ttLib import TTFont
+
+    app.builder.format = "html"
+    app.config = mock.Mock(self_host_web_fonts=True, epub_build=False)
+    (app.outdir / "index.html").write_text("<p>Ж</p>")
+
+    fonts.write_web_fonts(app, None)
+
+    for name in fonts.FONT_FILES:
+        font = TTFont(app.outdir / "_static" / "fonts" / name.replace(".ttf", ".woff2"))
+        assert font.flavor == "woff2"
+    cmap = font.getBestCmap()
+    assert ord("Ж") in cmap
+    assert ord("П") not in cmap
+
+
+def test_web_fonts_enabled_epub(app):
+    app.config = mock.Mock(self_host_web_fonts=True, epub_build=True)
+
+    assert not fonts.web_fonts_enabled(app.config)
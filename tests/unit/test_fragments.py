@@ -0,0 +1,68 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import mock
+
+import jinja2
+from canonical_sphinx import fragments
+
+TEMPLATE = """\
+{%- call cached_fragment("logo", depth, project) -%}
+{{ render() }}<img src="{{ depth }}tag.png" alt="{{ project }}">
+{%- endcall -%}
+"""
+
+
+def test_fragment_cache():
+    cache = fragments.FragmentCache()
+    template = jinja2.Environment(autoescape=True).from_string(TEMPLATE)
+    render = mock.Mock(return_value="")
+
+    def page(depth, project="Docs"):
+        return template.render(
+            cached_fragment=cache.render,
+            render=render,
+            depth=depth,
+            project=project,
+        )
+
+    assert page("") == '<img src="tag.png" alt="Docs">'
+    assert page("") == '<img src="tag.png" alt="Docs">'
+    assert page("../") == '<img src="../tag.png" alt="Docs">'
+    assert page("../", "Other") == '<img src="../tag.png" alt="Other">'
+    assert render.call_count == 3
+    assert cache.hits == 1
+
+
+def test_setup_fragment_cache():
+    app = mock.Mock(fragments.Sphinx)
+    app.builder = mock.Mock(format="html")
+
+    fragments.setup_fragment_cache(app)
+    ((event, handler), _) = app.connect.call_args
+    context = {}
+    handler(app, "index", "page.html", context, None)
+
+    assert event == "html-page-context"
+    assert context["cached_fragment"] == handler.keywords["cache"].render
+
+
+def test_setup_fragment_cache_latex():
+    app = mock.Mock(fragments.Sphinx)
+    app.builder = mock.Mock(format="latex")
+
+    fragments.setup_fragment_cache(app)
+
+    app.connect.assert_not_called()
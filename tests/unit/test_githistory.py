@@ -0,0 +1,186 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import subprocess
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from canonical_sphinx import githistory
+
+pytestmark = pytest.mark.skipif(
+    subprocess.run(
+        ["git", "--version"],
+        capture_output=True,
+        check=False,
+    ).returncode,
+    reason="git is not installed",
+)
+
+
+def git(repo: Path, *args: str) -> str:
+    return githistory._git(repo, *args)
+
+
+def commit(repo: Path, files: dict[str, str], author: str, timestamp: int) -> str:
+    for name, text in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    subprocess.run(
+        ["git", "-C", str(repo), "add", *files],
+        check=True,
+    )
+    date = f"@{timestamp} +0000"
+    subprocess.run(
+        [
+            "git",
+            "-C",
+            str(repo),
+            "-c",
+            f"user.name={author}",
+            "-c",
+            "user.email=author@example.com",
+            "commit",
+            "-q",
+            "-m",
+            (
+                "Change\n\nCo-authored-by: Helper <helper@example.com>\n"
+                if author == "Bob"
+                else "Change"
+            ),
+        ],
+        check=True,
+        env={
+            "GIT_AUTHOR_DATE": date,
+            "GIT_COMMITTER_DATE": date,
+            "HOME": str(repo),
+            "PATH": "/usr/bin:/bin:/usr/local/bin",
+        },
+    )
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "init", "-q", str(repo)], check=True)
+    return repo
+
+
+def test_parse_log():
+    lines = [
+        "\x1eabc\x1f100\x1fAlice\x1fBob <bob@example.com>\x1fAlice <a@example.com>\n",
+        "\n",
+        "docs/index.rst\n",
+        "docs/other.rst\n",
+        "\x1edef\x1f50\x1fBob\x1f\n",
+        "\n",
+        "docs/index.rst\n",
+    ]
+
+    assert list(githistory.parse_log(lines)) == [
+        ("abc", 100, ["Alice", "Bob"], "docs/index.rst"),
+        ("abc", 100, ["Alice", "Bob"], "docs/other.rst"),
+        ("def", 50, ["Bob"], "docs/index.rst"),
+    ]
+
+
+def test_load_history(repo, tmp_path):
+    first = commit(repo, {"docs/index.rst": "1", "docs/a.rst": "a"}, "Alice", 1000)
+    second = commit(repo, {"docs/index.rst": "2"}, "Bob", 2000)
+    cache_file = tmp_path / "cache" / "git-history.json"
+
+    history = githistory.load_history(repo, cache_file)
+
+    assert history.head == second
+    assert history.last_updated(["docs/a.rst"]) == 1000
+    assert history.last_updated(["docs/a.rst", "docs/index.rst"]) == 2000
+    assert history.last_updated(["missing.rst"]) is None
+    assert history.contributors("docs/index.rst") == {
+        "Alice": [1000, first],
+        "Bob": [2000, second],
+        "Helper": [2000, second],
+    }
+    assert list(history.contributors("docs/index.rst", since=1500)) == [
+        "Bob",
+        "Helper",
+    ]
+    assert cache_file.exists()
+
+
+def test_load_history_incremental(repo, tmp_path, monkeypatch):
+    first = commit(repo, {"index.rst": "1"}, "Alice", 1000)
+    cache_file = tmp_path / "git-history.json"
+    githistory.load_history(repo, cache_file)
+    third = commit(repo, {"new.rst": "new"}, "Carol", 3000)
+
+    revisions = []
+    read_log = githistory.GitHistory.read_log
+
+    def spy(self, rev):
+        revisions.append(rev)
+        return read_log(self, rev)
+
+    monkeypatch.setattr(githistory.GitHistory, "read_log", spy)
+    history = githistory.load_history(repo, cache_file)
+    # Unchanged HEAD: the cached index is used as it is.
+    githistory.load_history(repo, cache_file)
+
+    assert revisions == [f"{first}..{third}"]
+    assert history.last_updated(["index.rst"]) == 1000
+    assert history.contributors("new.rst") == {"Carol": [3000, third]}
+
+
+def test_load_history_rewritten(repo, tmp_path):
+    commit(repo, {"index.rst": "1"}, "Alice", 1000)
+    cache_file = tmp_path / "git-history.json"
+    githistory.load_history(repo, cache_file)
+    subprocess.run(
+        ["git", "-C", str(repo), "checkout", "-q", "--orphan", "other"],
+        check=True,
+    )
+    subprocess.run(
+        ["git", "-C", str(repo), "rm", "-q", "-r", "--cached", "."],
+        check=True,
+    )
+    commit(repo, {"other.rst": "other"}, "Carol", 3000)
+
+    history = githistory.load_history(repo, cache_file)
+
+    assert list(history.files) == ["other.rst"]
+
+
+def test_add_history_context(repo, tmp_path):
+    first = commit(repo, {"docs/index.rst": "1"}, "Alice", 86400)
+    history = githistory.load_history(repo, tmp_path / "git-history.json")
+    app = mock.Mock(githistory.Sphinx)
+    app.srcdir = repo / "docs"
+    app.env = mock.Mock(all_docs={"index": 0}, dependencies={})
+    app.env.doc2path.return_value = repo / "docs" / "index.rst"
+    app.config = mock.Mock(html_last_updated_fmt="%Y-%m-%d", language="en")
+    context = {
+        "get_contributors_for_file": None,
+        "display_contributors": True,
+        "github_url": "https://github.com/example/docs",
+    }
+
+    githistory.add_history_context(app, "index", "page.html", context, None, history)
+
+    assert context["last_updated"] == "1970-01-02"
+    assert context["get_contributors_for_file"]("index", ".rst") == [
+        ("Alice", f"https://github.com/example/docs/commit/{first}"),
+    ]
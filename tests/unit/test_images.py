@@ -0,0 +1,150 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import zlib
+from unittest import mock
+
+import pytest
+from canonical_sphinx import images
+from canonical_sphinx.benchmark import PNG_IMAGE
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<!-- Generator: some editor -->
+<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10">
+  <metadata>editor data</metadata>
+  <rect width="10" height="10" />
+</svg>
+"""
+
+
+def _png(width=64, height=64):
+    """Return a poorly compressed, striped PNG image, with a text chunk."""
+    row = b"\x00" + bytes(range(3 * width))
+    pixels = zlib.compress(row * height, 0)
+    header = (width).to_bytes(4, "big") + (height).to_bytes(4, "big") + b"\x08\x02"
+    return b"".join(
+        [
+            images.PNG_SIGNATURE,
+            images._png_chunk(b"IHDR", header + b"\x00\x00\x00"),
+            images._png_chunk(b"tEXt", b"Software\x00editor"),
+            images._png_chunk(b"IDAT", pixels),
+            images._png_chunk(b"IEND", b""),
+        ],
+    )
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(images.Sphinx)
+    app.builder = mock.Mock(format="html")
+    app.config = mock.Mock(optimize_images=True, webp_images=False, epub_build=False)
+    app.confdir = tmp_path / "source"
+    app.outdir = tmp_path / "build"
+    (app.outdir / "_images").mkdir(parents=True)
+    (app.outdir / "_static").mkdir()
+    (app.outdir / "_images" / "diagram.png").write_bytes(_png())
+    (app.outdir / "_static" / "404.svg").write_text(SVG)
+    (app.outdir / "index.html").write_text(
+        '<p><img alt="A diagram" src="_images/diagram.png" /></p>',
+    )
+    return app
+
+
+def test_recompress_png():
+    png = _png()
+
+    recompressed = images.recompress_png(png)
+
+    assert len(recompressed) < len(png)
+    chunks = dict(images._png_chunks(recompressed))
+    assert b"tEXt" not in chunks
+    assert zlib.decompress(chunks[b"IDAT"]) == zlib.decompress(
+        dict(images._png_chunks(png))[b"IDAT"],
+    )
+
+
+def test_recompress_png_already_small():
+    assert images.recompress_png(PNG_IMAGE) == PNG_IMAGE
+    assert images.recompress_png(b"not a png") == b"not a png"
+
+
+def test_minify_svg():
+    assert images.minify_svg(SVG) == (
+        '<?xml version="1.0" encoding="UTF-8"?><svg '
+        'xmlns="http://www.w3.org/2000/svg" width="10" height="10"><rect '
+        'width="10" height="10" /></svg>'
+    )
+
+
+def test_minify_svg_with_text():
+    svg = "<svg>\n  <text>A <tspan>B</tspan></text>\n</svg>"
+
+    assert images.minify_svg(svg) == "<svg>\n<text>A <tspan>B</tspan></text>\n</svg>"
+
+
+def test_optimize_html_images(app, mocker):
+    images.optimize_html_images(app, None)
+
+    diagram = app.outdir / "_images" / "diagram.png"
+    assert len(diagram.read_bytes()) < len(_png())
+    assert "metadata" not in (app.outdir / "_static" / "404.svg").read_text()
+
+    # Sphinx copies the original image again on the next build
+    diagram.write_bytes(_png())
+    optimize_image = mocker.spy(images, "optimize_image")
+    images.optimize_html_images(app, None)
+    assert optimize_image.call_count == 0
+    assert len(diagram.read_bytes()) < len(_png())
+
+
+def test_optimize_html_images_webp(app):
+    pytest.importorskip("PIL")
+    app.config.webp_images = True
+
+    images.optimize_html_images(app, None)
+
+    assert (app.outdir / "_images" / "diagram.png.webp").is_file()
+    assert (app.outdir / "index.html").read_text() == (
+        '<p><picture><source srcset="_images/diagram.png.webp" type="image/webp">'
+        '<img alt="A diagram" src="_images/diagram.png" /></picture></p>'
+    )
+
+    # Pages that weren't written again aren't changed again
+    images.optimize_html_images(app, None)
+    assert (app.outdir / "index.html").read_text().count("<picture>") == 1
+
+
+def test_add_picture_elements_skips(tmp_path):
+    page = tmp_path / "index.html"
+    html = (
+        '<img src="https://example.com/a.png" /><img src="missing.png" />'
+        '<picture><source srcset="b.png.webp" /><img src="b.png" /></picture>'
+    )
+    page.write_text(html)
+    (tmp_path / "b.png.webp").write_bytes(b"webp")
+
+    assert not images.add_picture_elements(page)
+
+
+def test_place_pdf_logo(app):
+    pytest.importorskip("PIL")
+    from PIL import Image
+
+    app.outdir = app.outdir / "latex"
+    app.outdir.mkdir()
+    images.place_pdf_logo(app)
+
+    with Image.open(app.outdir / images.PDF_LOGO) as logo:
+        assert logo.width == 472
@@ -0,0 +1,90 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from canonical_sphinx import latex
+
+
+def test_default_latex_elements():
+    elements = latex.build_latex_elements()
+
+    assert elements["papersize"] == "a4paper"
+    assert elements["preamble"].startswith("\n\\setmainfont")
+    assert "\\definecolor{title}{RGB}{76, 17, 48}" in elements["preamble"]
+    assert "\\renewenvironment{sphinxwarning}[1]" in elements["preamble"]
+
+    # The defaults are rendered once, but every build gets its own copy
+    elements["papersize"] = "letterpaper"
+    assert latex.build_latex_elements()["papersize"] == "a4paper"
+
+
+def test_overrides():
+    elements = latex.build_latex_elements(overrides={"papersize": "letterpaper"})
+
+    assert elements["papersize"] == "letterpaper"
+    assert elements["preamble"] == latex.build_latex_elements()["preamble"]
+
+
+def test_colors():
+    preamble = latex.build_preamble(colors={"title": "#000000", "new": (1, 2, 3)})
+
+    assert "\\definecolor{title}{HTML}{000000}" in preamble
+    assert "\\definecolor{new}{RGB}{1, 2, 3}" in preamble
+    assert "{title}{RGB}" not in preamble
+
+
+def test_environments():
+    preamble = latex.build_preamble(
+        environments={
+            "sphinxnote": "\\renewenvironment{sphinxnote}[1]{}{}",
+            "sphinxtip": "",
+        },
+    )
+
+    assert "\\renewenvironment{sphinxnote}[1]{}{}" in preamble
+    assert "{sphinxtip}" not in preamble
+    assert "\\renewenvironment{sphinxhint}[1]" in preamble
+
+
+def test_fragments():
+    preamble = latex.build_preamble(
+        fragments={"headings": "", "extra": "\\usepackage{foo}"},
+    )
+
+    assert "\\titleformat" not in preamble
+    assert preamble.endswith("\n\\usepackage{foo}\n")
+
+
+def test_precompiled():
+    elements = latex.build_latex_elements(precompiled=True)
+    packages, marker, rest = elements["preamble"].partition(latex.END_OF_DUMP)
+
+    # The packages are dumped into the format, and the fonts are set up after
+    assert marker
+    assert "\\usepackage{tikz}" in packages
+    assert "\\setmainfont" not in packages
+    assert elements["fontpkg"] == ""
+    assert rest.lstrip().startswith("\\setmainfont{FreeSerif}")
+    assert "\\setmainfont[UprightFont" in rest
+
+
+def test_precompiled_preamble_override():
+    elements = latex.build_latex_elements(
+        overrides={"preamble": "\\usepackage{foo}"},
+        precompiled=True,
+    )
+
+    # Without the marker, the fonts stay where Sphinx puts them
+    assert elements["preamble"] == "\\usepackage{foo}"
+    assert "fontpkg" not in elements
@@ -0,0 +1,118 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import mock
+
+import pytest
+from canonical_sphinx import latexformat
+from canonical_sphinx.latex import END_OF_DUMP
+
+DOCUMENT = f"""\\documentclass{{sphinxmanual}}
+\\usepackage{{tikz}}
+{END_OF_DUMP}
+\\setmainfont{{Ubuntu}}
+\\begin{{document}}
+\\end{{document}}
+"""
+
+
+def test_preamble_head():
+    head = "\\documentclass{sphinxmanual}\n\\usepackage{tikz}\n"
+
+    assert latexformat.preamble_head(DOCUMENT) == head
+    assert latexformat.preamble_head(f"%&format\n{DOCUMENT}") == head
+    assert latexformat.preamble_head("\\documentclass{sphinxmanual}") is None
+
+
+def test_format_key(tmp_path):
+    (tmp_path / "sphinx.sty").write_text("% sphinx")
+    key = latexformat.format_key("head", tmp_path, "XeTeX 3.14")
+
+    assert latexformat.format_key("head", tmp_path, "XeTeX 3.14") == key
+    assert latexformat.format_key("other", tmp_path, "XeTeX 3.14") != key
+    assert latexformat.format_key("head", tmp_path, "XeTeX 3.15") != key
+    (tmp_path / "sphinx.sty").write_text("% sphinx, changed")
+    assert latexformat.format_key("head", tmp_path, "XeTeX 3.14") != key
+
+
+def test_use_format(tmp_path):
+    tex = tmp_path / "doc.tex"
+    tex.write_text(DOCUMENT)
+
+    latexformat.use_format(tex, "first")
+    latexformat.use_format(tex, "second")
+
+    assert tex.read_text() == f"%&second\n{DOCUMENT}"
+
+
+def _app(tmp_path):
+    outdir = tmp_path / "latex"
+    outdir.mkdir()
+    (outdir / "doc.tex").write_text(DOCUMENT)
+    app = mock.Mock(latexformat.Sphinx, outdir=outdir, confdir=tmp_path)
+    app.builder = mock.Mock(format="latex")
+    app.config = mock.Mock(
+        latex_precompiled_preamble=True,
+        latex_engine="xelatex",
+        latex_documents=[("index", "doc.tex", "Docs", "Canonical", "manual")],
+        hardlink_pdf_assets=False,
+    )
+    return app
+
+
+def _build_format(tex, name, engine):
+    fmt = tex.parent / f"{name}.fmt"
+    fmt.write_bytes(b"format")
+    return fmt
+
+
+@pytest.fixture
+def build_format():
+    with (
+        mock.patch.object(latexformat, "tex_version", return_value="XeTeX 3.14"),
+        mock.patch.object(
+            latexformat,
+            "build_format",
+            side_effect=_build_format,
+        ) as build_format,
+    ):
+        yield build_format
+
+
+def test_precompile_latex_preambles(tmp_path, build_format):
+    app = _app(tmp_path)
+
+    latexformat.precompile_latex_preambles(app, None)
+    latexformat.precompile_latex_preambles(app, None)
+
+    # The format is built once, and found in the cache afterwards
+    build_format.assert_called_once()
+    tex = app.outdir / "doc.tex"
+    name = tex.read_text().partition("\n")[0].removeprefix("%&")
+    assert name.startswith(latexformat.FORMAT_PREFIX)
+    assert (app.outdir / f"{name}.fmt").read_bytes() == b"format"
+    assert (tmp_path / ".sphinx/cache/latex-formats" / f"{name}.fmt").is_file()
+
+
+def test_precompile_latex_preambles_error(tmp_path, build_format):
+    app = _app(tmp_path)
+    build_format.side_effect = latexformat.FormatError("xelatex failed")
+
+    with mock.patch.object(latexformat, "logger") as logger:
+        latexformat.precompile_latex_preambles(app, None)
+
+    # Documents are compiled as usual
+    logger.warning.assert_called_once()
+    assert (app.outdir / "doc.tex").read_text() == DOCUMENT
@@ -0,0 +1,75 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+import time
+
+import pytest
+from canonical_sphinx import linkcheck
+
+
+@pytest.fixture
+def store(tmp_path):
+    return linkcheck.LinkStore(tmp_path / "linkcheck.json", linkcheck.DEFAULT_TTL)
+
+
+def test_link_store_fresh(store):
+    store.record("https://a.example", ("working", "", 0), etag='"v1"')
+    store.record("https://b.example", ("broken", "404", 0))
+    now = time.time()
+
+    assert store.fresh("https://a.example", now)["etag"] == '"v1"'
+    assert store.fresh("https://b.example", now)["info"] == "404"
+    # Broken links expire before working ones
+    assert store.fresh("https://a.example", now + 2 * 3600) is not None
+    assert store.fresh("https://b.example", now + 2 * 3600) is None
+    assert store.fresh("https://c.example", now) is None
+    assert store.hits == 3
+
+
+def test_link_store_uncached_status(store):
+    store.record("https://a.example", ("timeout", "", 0))
+
+    assert store.get("https://a.example") is None
+
+
+def test_link_store_save(store, tmp_path):
+    store.record("https://a.example", ("working", "", 0))
+    # Another build saved its results meanwhile
+    other = linkcheck.LinkStore(store.path, linkcheck.DEFAULT_TTL)
+    other.record("https://b.example", ("working", "", 0))
+    other.save()
+
+    store.save()
+
+    links = linkcheck.LinkStore(store.path, linkcheck.DEFAULT_TTL).links
+    assert sorted(links) == ["https://a.example", "https://b.example"]
+
+
+def test_host_limits():
+    limits = linkcheck.HostLimits(1)
+    entered = threading.Event()
+
+    with limits.hold("https://a.example/page"):
+        # Other hosts aren't limited by the requests to this one
+        with limits.hold("https://b.example/page"):
+            pass
+        thread = threading.Thread(
+            target=lambda: limits.hold("https://a.example/other").__enter__()
+            or entered.set(),
+        )
+        thread.start()
+        assert not entered.wait(0.1)
+    assert entered.wait(1)
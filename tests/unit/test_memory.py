@@ -0,0 +1,174 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import pickle
+import tracemalloc
+from unittest import mock
+
+import pytest
+from canonical_sphinx import memory
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(memory.Sphinx)
+    app.confdir = tmp_path
+    app.doctreedir = tmp_path / "_build" / ".doctrees"
+    app.parallel = 1
+    app.config = mock.Mock(
+        memory_profile="profile/memory.json",
+        memory_profile_frames=5,
+        build_profile_top=5,
+    )
+    app.builder = mock.Mock(finish=mock.Mock(), spec=["name", "finish"])
+    app.builder.name = "html"
+    app.env = mock.Mock(found_docs={"index"})
+    app.env.__getstate__ = mock.Mock(
+        return_value={"domaindata": {"std": {"labels": {}}}, "titles": {}},
+    )
+    app.extensions = {}
+    return app
+
+
+@pytest.fixture
+def extension(tmp_path):
+    package = tmp_path / "ext"
+    package.mkdir()
+    return mock.Mock(module=mock.Mock(__path__=[str(package)]))
+
+
+def _snapshot(*traces):
+    # The frames of each trace are from the most recent to the oldest.
+    return tracemalloc.Snapshot(
+        [(0, size, frames, len(frames)) for size, frames in traces],
+        traceback_limit=25,
+    )
+
+
+def test_extension_paths(app, extension, tmp_path):
+    module = tmp_path / "ext" / "sub.py"
+    app.extensions = {
+        "ext": extension,
+        "ext.sub": mock.Mock(module=mock.Mock(spec=["__file__"], __file__=module)),
+    }
+
+    assert memory.extension_paths(app) == [
+        (str(module), "ext.sub"),
+        (f"{tmp_path / 'ext'}/", "ext"),
+    ]
+
+
+def test_attribute(app, extension, tmp_path):
+    app.extensions = {"ext": extension}
+    ext = str(tmp_path / "ext" / "directives.py")
+    snapshot = _snapshot(
+        (100, (("/lib/docutils/nodes.py", 10), (ext, 20), ("/lib/sphinx/io.py", 30))),
+        (50, ((ext, 21),)),
+        (30, (("/lib/sphinx/io.py", 31),)),
+        (7, ((memory.__file__, 1),)),
+    )
+
+    stats = memory.group(snapshot)
+
+    assert memory.attribute(stats, memory.extension_paths(app)) == {
+        "ext": {"size": 150, "count": 2},
+        memory.OTHER: {"size": 30, "count": 1},
+    }
+    assert memory.largest_lines(stats, 2) == [
+        {"line": "/lib/docutils/nodes.py:10", "size": 100, "count": 1},
+        {"line": f"{ext}:21", "size": 50, "count": 1},
+    ]
+
+
+def test_environment_sizes(app):
+    app.env.__getstate__.return_value["events"] = lambda: None
+
+    sizes = memory.environment_sizes(app.env)
+
+    assert list(sizes) == ["domaindata.std", "titles"]
+    assert sizes["titles"] == len(pickle.dumps({}, pickle.HIGHEST_PROTOCOL))
+
+
+def test_doctree_sizes(tmp_path):
+    (tmp_path / "guide").mkdir()
+    (tmp_path / "index.doctree").write_bytes(b"x" * 10)
+    (tmp_path / "guide" / "install.doctree").write_bytes(b"x" * 30)
+    (tmp_path / "environment.pickle").write_bytes(b"x" * 100)
+
+    assert memory.doctree_sizes(tmp_path, 1) == {
+        "count": 2,
+        "size": 40,
+        "largest": [{"docname": "guide/install", "size": 30}],
+    }
+
+
+def test_profiler():
+    profiler = memory.MemoryProfiler(top=3, frames=5)
+    data = [bytearray(1024) for _ in range(10)]
+    profiler.snapshot("read")
+
+    app = mock.Mock(extensions={})
+    (phase,) = profiler.stop(app)
+
+    assert not tracemalloc.is_tracing()
+    assert phase["phase"] == "read"
+    assert phase["traced"] >= sum(map(len, data))
+    assert phase["rss_peak"]["self"] > 0
+    assert set(phase["extensions"]) == {memory.OTHER}
+    assert phase["lines"][0]["line"].startswith(f"{__file__}:")
+
+
+def test_setup_memory_profile(app):
+    memory.setup_memory_profile(app, app.config)
+    (
+        ((_, builder_inited), _),
+        ((_, env_updated), _),
+        ((_, written), written_kwargs),
+        ((_, build_finished), kwargs),
+    ) = app.connect.call_args_list
+    app.doctreedir.mkdir(parents=True)
+    (app.doctreedir / "index.doctree").write_bytes(b"x" * 10)
+
+    builder_inited(app)
+    env_updated(app, app.env)
+    written(app, None)
+    build_finished(app, None)
+
+    report = json.loads((app.confdir / "profile" / "memory.json").read_text())
+    assert not tracemalloc.is_tracing()
+    assert [phase["phase"] for phase in report["phases"]] == [
+        "builder-inited",
+        "read",
+        "written",
+        "build-finished",
+    ]
+    assert report["builder"] == "html"
+    assert report["documents"] == 1
+    assert report["environment"][0]["name"] == "domaindata.std"
+    assert report["doctrees"]["largest"] == [{"docname": "index", "size": 10}]
+    # Before and after the other extensions' handlers
+    assert written_kwargs == {"priority": 0}
+    assert kwargs == {"priority": 1000}
+
+
+def test_setup_memory_profile_disabled(app):
+    app.config.memory_profile = ""
+
+    memory.setup_memory_profile(app, app.config)
+
+    app.connect.assert_not_called()
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,79 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import mock
+
+from canonical_sphinx import navigation
+
+
+def test_relocate_links():
+    tree = (
+        '<a href="guide/page.html">Page</a>'
+        '<a href="https://example.com/">External</a>'
+        '<a href="#">Root</a>'
+        '<a href="../other.html#section">Other</a>'
+    )
+
+    relocated = navigation.relocate_links(tree, "docs/index.html", "_static")
+
+    assert relocated == (
+        '<a href="../docs/guide/page.html">Page</a>'
+        '<a href="https://example.com/">External</a>'
+        '<a href="#">Root</a>'
+        '<a href="../other.html#section">Other</a>'
+    )
+
+
+def test_active_path():
+    context = {
+        "parents": [{"link": "../index.html", "title": "Guide"}],
+        "title": "Install &amp; run",
+    }
+
+    assert navigation.active_path(context) == (
+        '<ul><li class="toctree-l1 current">'
+        '<a class="reference internal" href="../index.html">Guide</a>'
+        '<ul><li class="toctree-l2 current current-page">'
+        '<a class="current reference internal" href="#">Install &amp; run</a>'
+        "</li></ul></li></ul>"
+    )
+
+
+def test_add_navigation():
+    app = mock.Mock(navigation.Sphinx)
+    app.config = mock.Mock(root_doc="index")
+    tree = mock.Mock(navigation.NavigationTree)
+    tree.name = "_static/navigation.0123456789ab.html"
+    toctree = mock.Mock()
+    context = {
+        "toctree": toctree,
+        "pathto": lambda name, resource: f"../{name}",
+        "title": "Page",
+        "furo_navigation_tree": "<ul>...</ul>",
+    }
+
+    navigation.stash_toctree(app, "guide/page", "page.html", context, None)
+    # Furo only renders the tree when the page has a toctree function.
+    assert "toctree" not in context
+    navigation.add_navigation(app, "guide/page", "page.html", context, None, tree)
+
+    assert context["toctree"] is toctree
+    assert context["navigation_fragment"] == "../_static/navigation.0123456789ab.html"
+    assert context["furo_navigation_tree"].startswith(
+        '<div class="canonical-navigation" '
+        'data-navigation="../_static/navigation.0123456789ab.html">'
+        '<ul><li class="toctree-l1 current current-page">',
+    )
+    assert "<noscript>" in context["furo_navigation_tree"]
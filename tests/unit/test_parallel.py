@@ -0,0 +1,112 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from unittest import mock
+
+import pytest
+from canonical_sphinx import parallel
+
+
+def _docset(docs, seconds, identical=None):
+    identical = identical or {}
+    return {
+        "docs": docs,
+        "runs": [
+            {"jobs": jobs, "seconds": time, "identical": identical.get(jobs, True)}
+            for jobs, time in enumerate(seconds, start=1)
+        ],
+    }
+
+
+DOCSETS = [
+    _docset(20, [2.0, 2.5, 3.0, 3.5]),
+    _docset(1000, [60.0, 32.0, 23.0, 22.5]),
+]
+
+
+@pytest.mark.parametrize(
+    ("docs", "cpus", "expected"),
+    [
+        # Small docsets are built faster serially
+        (10, 4, 1),
+        # Four processes aren't much faster than three for large ones
+        (800, 4, 3),
+        (5000, 4, 3),
+        (800, 2, 2),
+        (1, 4, 1),
+    ],
+)
+def test_choose_jobs(docs, cpus, expected):
+    assert parallel.choose_jobs(DOCSETS, docs, cpus) == expected
+
+
+def test_choose_jobs_different_output():
+    docsets = [_docset(1000, [60.0, 32.0, 23.0], identical={3: False})]
+
+    assert parallel.choose_jobs(docsets, 1000, 4) == 2
+
+
+@pytest.mark.parametrize(
+    ("docs", "cpus", "expected"),
+    [(50, 8, 1), (450, 8, 4), (5000, 8, 8)],
+)
+def test_choose_jobs_unmeasured(docs, cpus, expected):
+    assert parallel.choose_jobs([], docs, cpus) == expected
+
+
+def test_before_read():
+    app = mock.Mock(parallel.Sphinx, parallel=8)
+    env = mock.Mock(parallel.BuildEnvironment)
+
+    with mock.patch.object(parallel, "cpu_count", return_value=8):
+        parallel.before_read(app, env, ["index", "install"], DOCSETS)
+
+    assert app.parallel == 1
+
+
+def test_before_write():
+    app = mock.Mock(parallel.Sphinx, parallel=0)
+    app.builder = mock.Mock()
+    app.builder.get_outdated_docs.return_value = iter(["page", "removed"])
+    env = mock.Mock(parallel.BuildEnvironment, found_docs={"page", "index"})
+
+    with mock.patch.object(parallel, "choose_jobs", return_value=2) as choose_jobs:
+        parallel.before_write(app, env, DOCSETS)
+
+    choose_jobs.assert_called_once_with(DOCSETS, 1, mock.ANY)
+    assert app.parallel == 2
+
+
+def test_setup_parallel_jobs(tmp_path):
+    (tmp_path / "scaling.json").write_text('{"docsets": []}')
+    app = mock.Mock(parallel.Sphinx, confdir=tmp_path)
+    app.config = mock.Mock(
+        auto_parallel_jobs=True,
+        parallel_scaling_file="scaling.json",
+    )
+
+    parallel.setup_parallel_jobs(app)
+
+    events = [call.args[0] for call in app.connect.call_args_list]
+    assert events == ["env-before-read-docs", "env-updated"]
+
+
+def test_setup_parallel_jobs_disabled():
+    app = mock.Mock(parallel.Sphinx)
+    app.config = mock.Mock(auto_parallel_jobs=False)
+
+    parallel.setup_parallel_jobs(app)
+
+    app.connect.assert_not_called()
@@ -0,0 +1,167 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import sys
+import textwrap
+
+import pytest
+from canonical_sphinx import pdf
+
+# Stand-ins for xelatex and xdvipdfmx. The number of pages of a document,
+# which it writes to its .aux file, goes up by one per pass until it reaches
+# the number in the document, like references to the last page do.
+FAKE_XELATEX = """\
+import sys
+from pathlib import Path
+
+args = sys.argv[1:]
+outdir = Path(next(a for a in args if a.startswith("-output-directory=")).split("=")[1])
+tex = Path(args[-1])
+text = tex.read_text()
+with open("calls.log", "a") as log:
+    log.write(f"{tex.stem}\\n")
+if "error" in text:
+    sys.exit(1)
+aux = outdir / f"{tex.stem}.aux"
+pages = int(aux.read_text()) if aux.exists() else 0
+aux.write_text(str(min(pages + 1, int(text.split()[0]))))
+(outdir / f"{tex.stem}.xdv").write_text(f"{text} {aux.read_text()}")
+"""
+
+FAKE_XDVIPDFMX = """\
+import shutil
+import sys
+
+shutil.copy(sys.argv[-1], sys.argv[-2])
+"""
+
+
+@pytest.fixture
+def latexdir(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    for name, script in [("xelatex", FAKE_XELATEX), ("xdvipdfmx", FAKE_XDVIPDFMX)]:
+        path = bindir / name
+        path.write_text(f"#!{sys.executable}\n{script}")
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+
+    latexdir = tmp_path / "latex"
+    latexdir.mkdir()
+    (latexdir / "manual.tex").write_text("2 manual")
+    (latexdir / "guide.tex").write_text("1 guide")
+    (latexdir / "logo.png").write_bytes(b"png")
+    return latexdir
+
+
+def _calls(latexdir):
+    log = latexdir / "calls.log"
+    calls = log.read_text().split() if log.exists() else []
+    log.unlink(missing_ok=True)
+    return sorted(calls)
+
+
+def test_compile_documents(latexdir):
+    results = pdf.compile_documents(latexdir, jobs=2)
+
+    # Passes stop once the .aux file doesn't change
+    assert [(r.name, r.passes, r.stable) for r in results] == [
+        ("guide", 2, True),
+        ("manual", 3, True),
+    ]
+    assert (latexdir / "manual.pdf").read_text() == "2 manual 2"
+    assert (latexdir / "guide.pdf").read_text() == "1 guide 1"
+    assert _calls(latexdir) == ["guide", "guide", "manual", "manual", "manual"]
+
+
+def test_compile_documents_up_to_date(latexdir):
+    pdf.compile_documents(latexdir)
+    _calls(latexdir)
+
+    results = pdf.compile_documents(latexdir)
+
+    assert [result.passes for result in results] == [0, 0]
+    assert _calls(latexdir) == []
+
+    # Forced documents start from the previous .aux file
+    results = pdf.compile_documents(latexdir, ["manual"], force=True)
+
+    assert [result.passes for result in results] == [1]
+
+
+def test_compile_documents_changed_input(latexdir):
+    pdf.compile_documents(latexdir)
+    _calls(latexdir)
+
+    (latexdir / "logo.png").write_bytes(b"new png")
+    pdf.compile_documents(latexdir)
+
+    assert _calls(latexdir) == ["guide", "manual"]
+
+
+def test_compile_documents_max_passes(latexdir):
+    (latexdir / "manual.tex").write_text("10 manual")
+
+    (result,) = pdf.compile_documents(latexdir, ["manual"], max_passes=3)
+
+    assert result.passes == 3
+    assert not result.stable
+    # Documents that didn't stabilise are compiled again next time
+    (result,) = pdf.compile_documents(latexdir, ["manual"], max_passes=3)
+    assert result.passes == 3
+
+
+def test_compile_documents_error(latexdir):
+    (latexdir / "guide.tex").write_text("1 error")
+
+    guide, manual = pdf.compile_documents(latexdir)
+
+    assert guide.error
+    assert "guide.log" in guide.error
+    assert not (latexdir / "guide.pdf").exists()
+    assert manual.error is None
+
+
+def test_index_command(tmp_path):
+    makefile = tmp_path / "Makefile"
+    idx, ind = tmp_path / "doc.idx", tmp_path / "doc.ind"
+
+    assert pdf.index_command(tmp_path, idx, ind)[:3] == [
+        "makeindex",
+        "-s",
+        "python.ist",
+    ]
+
+    makefile.write_text(
+        textwrap.dedent(
+            """\
+            export LATEXOPTS ?=
+            export XINDYOPTS = -L english -C utf8  -M sphinx.xdy
+            """,
+        ),
+    )
+    assert pdf.index_command(tmp_path, idx, ind) == [
+        "xindy",
+        "-L",
+        "english",
+        "-C",
+        "utf8",
+        "-M",
+        "sphinx.xdy",
+        "-o",
+        ind,
+        idx,
+    ]
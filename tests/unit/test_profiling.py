@@ -0,0 +1,123 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import multiprocessing
+from unittest import mock
+
+import pytest
+from canonical_sphinx import profiling
+from sphinx.events import EventListener
+
+
+def html_page_context(app, pagename, templatename, context, doctree):
+    context["seen"] = True
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = mock.Mock(profiling.Sphinx)
+    app.confdir = tmp_path
+    app.config = mock.Mock(build_profile="profile/trace.json", build_profile_top=5)
+    app.env = mock.Mock(docname="")
+    app.events = mock.Mock(
+        listeners={"html-page-context": [EventListener(0, html_page_context, 500)]},
+    )
+    return app
+
+
+def _emit(app, event, *args):
+    for listener in app.events.listeners[event]:
+        listener.handler(app, *args)
+
+
+def test_instrument(app):
+    profiler = profiling.BuildProfiler()
+    profiler.instrument(app)
+    profiler.instrument(app)
+
+    context = {}
+    _emit(app, "html-page-context", "index", "page.html", context, None)
+
+    assert context == {"seen": True}
+    (record,) = profiler.collect()
+    assert record["handler"] == "tests.unit.test_profiling.html_page_context"
+    assert record["event"] == "html-page-context"
+    assert record["docname"] == "index"
+    assert record["wall"] >= 0
+
+
+def _emit_in_worker(app, docname):
+    _emit(app, "html-page-context", docname, "page.html", {}, None)
+
+
+def test_collect_worker_records(app):
+    profiler = profiling.BuildProfiler()
+    profiler.instrument(app)
+
+    # Sphinx forks its parallel workers, which inherit the profiler.
+    process = multiprocessing.get_context("fork").Process(
+        target=_emit_in_worker,
+        args=(app, "worker-doc"),
+    )
+    process.start()
+    process.join()
+    _emit(app, "html-page-context", "main-doc", "page.html", {}, None)
+
+    records = profiler.collect()
+
+    assert sorted(record["docname"] for record in records) == ["main-doc", "worker-doc"]
+    assert len({record["pid"] for record in records}) == 2
+
+
+def test_setup_profiling(app):
+    profiling.setup_profiling(app, app.config)
+    ((_, instrument), _), ((_, finish), kwargs) = app.connect.call_args_list
+    instrument(app)
+    _emit(app, "html-page-context", "index", "page.html", {}, None)
+
+    finish(app, None)
+
+    trace = json.loads((app.confdir / "profile" / "trace.json").read_text())
+    metadata, event = trace["traceEvents"]
+    assert metadata["ph"] == "M"
+    assert event["ph"] == "X"
+    assert event["cat"] == "html-page-context"
+    assert event["args"]["docname"] == "index"
+    assert kwargs == {"priority": 1000}
+
+
+def test_setup_profiling_disabled(app):
+    app.config.build_profile = ""
+
+    profiling.setup_profiling(app, app.config)
+
+    app.connect.assert_not_called()
+
+
+def test_summarize():
+    records = [
+        {"handler": "a", "docname": "x", "wall": 1e9, "cpu": 1e9},
+        {"handler": "b", "docname": "", "wall": 3e9, "cpu": 2e9},
+        {"handler": "a", "docname": "y", "wall": 1e9, "cpu": 0},
+    ]
+
+    assert profiling.summarize(records, "handler", 1) == [
+        "    3.000s     2.000s       1  b",
+    ]
+    assert profiling.summarize(records, "docname", 5) == [
+        "    1.000s     1.000s       1  x",
+        "    1.000s     0.000s       1  y",
+    ]
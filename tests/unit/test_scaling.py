@@ -0,0 +1,59 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+from canonical_sphinx import scaling
+
+
+def test_tree_digests(tmp_path):
+    (tmp_path / "_static").mkdir()
+    (tmp_path / "_static" / "custom.css").write_text("body {}")
+    (tmp_path / "index.html").write_text("<html></html>")
+
+    digests = scaling.tree_digests(tmp_path)
+
+    assert sorted(digests) == ["_static/custom.css", "index.html"]
+
+
+def test_compare_trees():
+    expected = {"index.html": "a", "search.html": "b", "genindex.html": "c"}
+    actual = {"index.html": "a", "search.html": "x", "extra.html": "d"}
+
+    assert scaling.compare_trees(expected, actual) == [
+        "extra.html",
+        "genindex.html",
+        "search.html",
+    ]
+    assert scaling.compare_trees(expected, expected) == []
+
+
+def test_format_curve():
+    results = {
+        "docsets": [
+            {
+                "name": "example",
+                "docs": 10,
+                "runs": [
+                    {"jobs": 1, "seconds": 2.0, "speedup": 1.0, "identical": True},
+                    {"jobs": 2, "seconds": 1.0, "speedup": 2.0, "identical": False},
+                ],
+            },
+        ],
+    }
+
+    lines = scaling.format_curve(results).splitlines()
+
+    assert len(lines) == 3
+    assert lines[1].split() == ["example", "10", "1", "2.00", "1.00x"]
+    assert lines[2].endswith("2.00x  (output differs)")
@@ -0,0 +1,101 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+from unittest import mock
+
+import pytest
+from canonical_sphinx import search
+
+INDEX = {
+    "docnames": ["index", "install"],
+    "titles": ["Home", "Install the snap"],
+    "terms": {"snap": [0, 1], "instal": 1, "This": 0},
+    "titleterms": {"instal": 1, "snap": 1, "home": 0},
+}
+
+
+def test_read_search_index(tmp_path):
+    path = tmp_path / "searchindex.js"
+    path.write_text(f"Search.setIndex({json.dumps(INDEX)})")
+
+    assert search.read_search_index(path) == INDEX
+
+
+def test_read_search_index_invalid(tmp_path):
+    path = tmp_path / "searchindex.js"
+    path.write_text("var index = {}")
+
+    with pytest.raises(ValueError, match="not a Sphinx search index"):
+        search.read_search_index(path)
+
+
+def test_split_index():
+    shards = search.split_index(INDEX)
+
+    assert shards == {
+        "sn": {"terms": {"snap": [0, 1]}, "titleterms": {"snap": [1]}},
+        "in": {"terms": {"instal": [1]}, "titleterms": {"instal": [1]}},
+        "th": {"terms": {"This": [0]}, "titleterms": {}},
+        "ho": {"terms": {}, "titleterms": {"home": [0]}},
+    }
+
+
+def test_write_shards(tmp_path):
+    directory = tmp_path / "search"
+
+    manifest, written = search.write_shards(
+        INDEX,
+        ["index.html", "install.html"],
+        directory,
+    )
+
+    assert written == 4
+    assert manifest["docs"] == [
+        ["Home", "index.html"],
+        ["Install the snap", "install.html"],
+    ]
+    assert json.loads((directory / "index.json").read_text()) == manifest
+    shard = json.loads((directory / manifest["shards"]["sn"]).read_text())
+    assert shard == {"terms": {"snap": [0, 1]}, "titleterms": {"snap": [1]}}
+
+    # Unchanged shards keep their names, and unused shards are removed.
+    index = {**INDEX, "terms": {"snap": [0, 1]}, "titleterms": {"home": [0]}}
+    new_manifest, written = search.write_shards(
+        index,
+        ["index.html", "install.html"],
+        directory,
+    )
+
+    assert written == 1
+    assert new_manifest["shards"]["ho"] == manifest["shards"]["ho"]
+    assert sorted(path.name for path in directory.glob("*.json")) == sorted(
+        ["index.json", *new_manifest["shards"].values()],
+    )
+
+
+@pytest.mark.parametrize(
+    ("sharded_search", "epub_build", "exception"),
+    [(False, False, None), (True, True, None), (True, False, Exception())],
+)
+def test_write_search_shards_skipped(tmp_path, sharded_search, epub_build, exception):
+    app = mock.Mock(search.Sphinx)
+    app.outdir = tmp_path
+    app.builder = mock.Mock(format="html", search=True)
+    app.config = mock.Mock(sharded_search=sharded_search, epub_build=epub_build)
+
+    search.write_search_shards(app, exception)
+
+    assert not (tmp_path / search.SEARCH_DIR).exists()
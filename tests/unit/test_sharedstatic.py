@@ -0,0 +1,145 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+from unittest import mock
+
+import pytest
+from canonical_sphinx import sharedstatic
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    static_dir = tmp_path / "_build" / "_static"
+    (static_dir / "fonts").mkdir(parents=True)
+    (static_dir / "custom.css").write_text("a{color:red}")
+    (static_dir / "fonts.css").write_text("@font-face{src:url('fonts/R.woff2')}")
+    (static_dir / "fonts" / "R.woff2").write_bytes(b"font")
+    (static_dir / "header.js").write_text("let a;")
+    (static_dir / "project.png").write_bytes(b"png")
+    return static_dir
+
+
+NAMES = {"custom.css", "fonts.css", "fonts/R.woff2", "header.js", "missing.js"}
+
+
+@pytest.fixture
+def app(tmp_path, static_dir, mocker):
+    mocker.patch.object(sharedstatic, "theme_static_names", return_value=NAMES)
+    app = mock.Mock(sharedstatic.Sphinx)
+    app.confdir = tmp_path
+    app.outdir = static_dir.parent
+    app.config = mock.Mock(
+        shared_static_dir="shared",
+        shared_static_url="/_canonical_static",
+        notfound_urls_prefix="/en/1.0/",
+    )
+    return app
+
+
+def test_shared_assets(static_dir):
+    assets = sharedstatic.shared_assets(static_dir, NAMES)
+
+    # The stylesheet with relative links stays with the font
+    assert sorted(assets) == ["custom.css", "header.js"]
+    digest, name = assets["custom.css"].split("/")
+    assert name == "custom.css"
+    assert sharedstatic.file_digest(static_dir / "custom.css").startswith(digest)
+
+
+def test_shared_assets_parent_reference(static_dir):
+    (static_dir / "styles").mkdir()
+    (static_dir / "styles" / "theme.css").write_text("a{src:url(../header.js)}")
+
+    assets = sharedstatic.shared_assets(static_dir, {*NAMES, "styles/theme.css"})
+
+    # The file that the stylesheet refers to stays next to it
+    assert sorted(assets) == ["custom.css"]
+
+
+def test_link_shared_assets(app):
+    shared = sharedstatic.SharedStatic(app)
+    url = "/_canonical_static/" + shared.assets["custom.css"]
+
+    def pathto(otheruri, resource=False):  # noqa: FBT002
+        return "../" + otheruri + ("" if resource else ".html")
+
+    def css_tag(css):
+        return f'<link href="{pathto(css.filename, resource=True)}?v=1234" />'
+
+    context = {"pathto": pathto, "css_tag": css_tag}
+    sharedstatic.link_shared_assets(app, "a/b", "page.html", context, None, shared)
+
+    assert context["pathto"]("_static/custom.css", 1) == url
+    assert context["pathto"]("_static/project.png", 1) == "../_static/project.png"
+    assert context["pathto"]("index") == "../index.html"
+    assert context["css_tag"](mock.Mock(filename="_static/custom.css")) == (
+        f'<link href="{url}" />'
+    )
+    assert context["css_tag"](mock.Mock(filename="_static/fonts.css")) == (
+        '<link href="../_static/fonts.css?v=1234" />'
+    )
+
+
+def test_publish_shared_assets(app, static_dir, tmp_path):
+    shared = sharedstatic.SharedStatic(app)
+    assets = dict(shared.assets)
+
+    sharedstatic.publish_shared_assets(app, None, shared)
+
+    for name, path in assets.items():
+        assert (tmp_path / "shared" / path).is_file()
+        assert not (static_dir / name).exists()
+    assert (static_dir / "fonts.css").exists()
+    manifest = json.loads((tmp_path / "shared" / "manifest.json").read_text())
+    assert manifest == {"builds": {"/en/1.0/": assets}}
+
+
+def test_publish_shared_assets_keeps_other_builds(app, tmp_path):
+    shared = sharedstatic.SharedStatic(app)
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared" / "manifest.json").write_text(
+        json.dumps({"builds": {"/en/0.9/": {"custom.css": "0123/custom.css"}}}),
+    )
+
+    sharedstatic.publish_shared_assets(app, None, shared)
+
+    manifest = json.loads((tmp_path / "shared" / "manifest.json").read_text())
+    assert sorted(manifest["builds"]) == ["/en/0.9/", "/en/1.0/"]
+
+
+@pytest.mark.parametrize(
+    ("shared_static_dir", "epub_build", "builder_format", "connected"),
+    [
+        ("shared", False, "html", True),
+        ("", False, "html", False),
+        ("shared", True, "html", False),
+        ("shared", False, "latex", False),
+    ],
+)
+def test_setup_shared_static(
+    app,
+    shared_static_dir,
+    epub_build,
+    builder_format,
+    connected,
+):
+    app.config.shared_static_dir = shared_static_dir
+    app.config.epub_build = epub_build
+    app.builder = mock.Mock(format=builder_format)
+
+    sharedstatic.setup_shared_static(app)
+
+    assert app.connect.called == connected
@@ -0,0 +1,101 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import json
+from unittest import mock
+
+import pytest
+from canonical_sphinx import siteconfig
+
+CONTEXT = {
+    "repo_default_branch": "main",
+    "github_url": "https://github.com/example/project",
+}
+
+
+@pytest.mark.parametrize(
+    ("environ", "expected"),
+    [
+        ({}, "main"),
+        (
+            {
+                "READTHEDOCS": "True",
+                "READTHEDOCS_VERSION_TYPE": "branch",
+                "READTHEDOCS_GIT_IDENTIFIER": "1.0",
+            },
+            "1.0",
+        ),
+        (
+            {
+                "READTHEDOCS": "True",
+                "READTHEDOCS_VERSION_TYPE": "external",
+                "READTHEDOCS_GIT_IDENTIFIER": "42",
+            },
+            "main",
+        ),
+    ],
+)
+def test_get_build_branch(environ, expected):
+    with mock.patch.dict(siteconfig.os.environ, environ, clear=True):
+        assert siteconfig.get_build_branch(CONTEXT) == expected
+
+
+def _app(tmp_path, *, runtime_site_config=True, epub_build=False):
+    app = mock.Mock(siteconfig.Sphinx)
+    app.outdir = tmp_path
+    app.builder = mock.Mock(format="html")
+    app.config = mock.Mock(
+        html_context=CONTEXT,
+        runtime_site_config=runtime_site_config,
+        epub_build=epub_build,
+    )
+    return app
+
+
+def test_write_site_config(tmp_path):
+    environ = {
+        "READTHEDOCS": "True",
+        "READTHEDOCS_VERSION_TYPE": "branch",
+        "READTHEDOCS_GIT_IDENTIFIER": "1.0",
+    }
+    with mock.patch.dict(siteconfig.os.environ, environ, clear=True):
+        siteconfig.write_site_config(_app(tmp_path), None)
+
+    path = tmp_path / siteconfig.SITE_CONFIG
+    assert json.loads(path.read_text()) == {
+        "build_branch": "1.0",
+        "github_url": "https://github.com/example/project",
+    }
+
+    # An unchanged config isn't written again
+    mtime = path.stat().st_mtime_ns
+    with mock.patch.dict(siteconfig.os.environ, environ, clear=True):
+        siteconfig.write_site_config(_app(tmp_path), None)
+    assert path.stat().st_mtime_ns == mtime
+
+
+@pytest.mark.parametrize(
+    ("runtime_site_config", "epub_build"),
+    [(False, False), (True, True)],
+)
+def test_write_site_config_disabled(tmp_path, runtime_site_config, epub_build):
+    app = _app(
+        tmp_path,
+        runtime_site_config=runtime_site_config,
+        epub_build=epub_build,
+    )
+    siteconfig.write_site_config(app, None)
+
+    assert not (tmp_path / siteconfig.SITE_CONFIG).exists()
@@ -0,0 +1,91 @@
+# This file is part of canonical-sphinx.
+#
+# Copyright 2024 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License version 3, as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranties of MERCHANTABILITY,
+# SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import sys
+
+import pytest
+from canonical_sphinx import spelling
+from docutils.core import publish_doctree
+
+# A stand-in for Aspell, which doesn't know the words that contain "zz".
+FAKE_ASPELL = """\
+import os
+import sys
+
+if "--version" in sys.argv:
+    print("@(#) International Ispell Version 3.1.20 (but really Fake Aspell 1.0)")
+    sys.exit()
+with open(os.environ["FAKE_ASPELL_LOG"], "a") as log:
+    log.write("call\\n")
+for word in sys.stdin.read().split():
+    if "zz" in word:
+        print(word)
+"""
+
+
+@pytest.fixture
+def fake_aspell(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    path = bindir / "aspell"
+    path.write_text(f"#!{sys.executable}\n{FAKE_ASPELL}")
+    path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    log = tmp_path / "aspell.log"
+    monkeypatch.setenv("FAKE_ASPELL_LOG", str(log))
+    return log
+
+
+def test_document_words():
+    doctree = publish_doctree(
+        "Title\n=====\n\n"
+        "Some ``inline_code`` and a `link <https://example.com>`_, "
+        "https://example.com/bare, don't.\n\n"
+        "::\n\n    literal block\n\n"
+        ".. Comment\n",
+    )
+
+    assert spelling.document_words(doctree) == [
+        "Title",
+        "Some",
+        "and",
+        "a",
+        "link",
+        "don't",
+    ]
+
+
+def test_read_wordlists(tmp_path):
+    (tmp_path / "words.txt").write_text("Buzzword\n\n  LXD \n")
+
+    words = spelling.read_wordlists([tmp_path / "words.txt", tmp_path / "missing"])
+
+    assert words == {"Buzzword", "LXD"}
+
+
+def test_misspelled_words(fake_aspell):
+    words = ["fizz", "the", "buzz", "Jazz", "fizz"]
+
+    misspelled = spelling.misspelled_words(["aspell", "list"], words, {"jazz"})
+
+    assert misspelled == ["fizz", "buzz"]
+
+
+def test_misspelled_words_no_checker(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+
+    with pytest.raises(spelling.SpellingError, match="Could not run aspell"):
+        spelling.misspelled_words(["aspell", "list"], ["word"], set())